@@ -10,12 +10,29 @@ AUTHORS = [
 COPYRIGHT = "Copyright (c) 2009-2024, UChicago Argonne, LLC."
 LICENSE = "LICENSE"
 
-try:
-    from setuptools_scm import get_version
 
-    __version__ = get_version(root="../..", relative_to=__file__)
-    del get_version
-except (LookupError, ModuleNotFoundError):
+def _get_version():
+    """version of the installed package, or of the git checkout"""
+    from importlib.metadata import PackageNotFoundError
     from importlib.metadata import version
 
-    __version__ = version(PROJECT)
+    try:
+        return version(PROJECT)
+    except PackageNotFoundError:
+        pass
+    try:
+        from setuptools_scm import get_version
+
+        return get_version(root="../..", relative_to=__file__)
+    except (LookupError, ModuleNotFoundError):
+        return "0+unknown"
+
+
+def __getattr__(name):
+    """find ``__version__`` when first used, not when PvMail is imported"""
+    global __version__
+
+    if name == "__version__":
+        __version__ = _get_version()
+        return __version__
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,478 @@
+"""
+Watch PVs and send email from one asyncio event loop.
+
+With ``pvMail --engine asyncio``, Channel Access monitors come from the
+asyncio client of `caproto <https://caproto.github.io>`_ and email goes
+to the SMTP server over asyncio streams.  There are no per-watch or
+per-send threads: one event loop handles every watch and every
+connection.  Triggers are decided exactly as with the default engine,
+by :meth:`PvMail.cli.PvMail.receiveTriggerMonitor`, so digests
+(:mod:`PvMail.digest`) and send policies (:mod:`PvMail.policy`) work
+the same way.
+
+The ``sendmail`` mail transfer agent and the outbound spool
+(:mod:`PvMail.spool`) are not asyncio-native, they are called in the
+event loop's default executor.
+
+Install the optional dependency with::
+
+    $ pip install PvMail[asyncio]
+
+Run it with::
+
+    $ pvMail --engine asyncio --watches watches.toml
+    $ pvMail --engine asyncio pvMail:trigger pvMail:message joe@example.org
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import asyncio
+import base64
+import functools
+import ssl
+import time
+
+from . import cli
+from . import digest
+from . import history
+from . import ini_config
+from . import mailer
+from . import metrics
+from . import watches
+
+SMTP_CONNECTIONS = 4
+CONNECT_TIMEOUT = 5.0
+
+
+class AsyncSMTPError(Exception):
+    """the SMTP server replied with an error code"""
+
+    def __init__(self, code, reply):
+        super().__init__(f"{code} {reply}")
+        self.smtp_code = code
+        self.smtp_error = reply
+
+
+class AsyncSMTP(object):
+    """
+    Minimal ESMTP client over asyncio streams.
+
+    Supports STARTTLS (Python 3.11+), AUTH PLAIN, and one message per
+    MAIL transaction.
+
+    :param dict smtp_cfg: SMTP configuration from ini_config.Config()
+    :param float timeout: wait this long (s) for each server reply
+    """
+
+    def __init__(self, smtp_cfg, timeout=mailer.SMTP_TIMEOUT):
+        self.smtp_cfg = smtp_cfg
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.extensions = {}
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def _reply(self):
+        """return (code, text) of the next (multiline) server reply"""
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise ConnectionError("SMTP server closed the connection")
+            lines.append(line[4:].strip().decode(errors="replace"))
+            if line[3:4] != b"-":
+                return int(line[:3]), "\n".join(lines)
+
+    async def command(self, line, expect=250):
+        """send one command, raise :exc:`AsyncSMTPError` on an unexpected reply"""
+        self.writer.write(line.encode() + b"\r\n")
+        await self.writer.drain()
+        code, text = await self._reply()
+        if code != expect:
+            raise AsyncSMTPError(code, text)
+        return text
+
+    async def _ehlo(self):
+        text = await self.command("EHLO localhost")
+        self.extensions = {}
+        for line in text.splitlines()[1:]:
+            keyword, _, params = line.partition(" ")
+            self.extensions[keyword.upper()] = params
+
+    async def connect(self):
+        """open the connection, then greet, secure and authenticate"""
+        port = int(self.smtp_cfg.get("port", None) or 25)
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.smtp_cfg["server"], port), self.timeout
+        )
+        code, text = await self._reply()
+        if code != 220:
+            raise AsyncSMTPError(code, text)
+        await self._ehlo()
+
+        if self.smtp_cfg.get("connection_security", None) == "STARTTLS":
+            await self.command("STARTTLS", expect=220)
+            await self.writer.start_tls(ssl.create_default_context())
+            await self._ehlo()
+
+        password = self.smtp_cfg.get("password", None)
+        if password is not None:
+            user = self.smtp_cfg["user"]
+            token = base64.b64encode(f"\0{user}\0{password}".encode()).decode()
+            await self.command(f"AUTH PLAIN {token}", expect=235)
+
+    async def sendmail(self, from_addr, recipients, data):
+        """
+        send one message, return dict of refused recipients
+
+        :param str from_addr: envelope sender
+        :param [str] recipients: envelope recipients
+        :param bytes data: message, with CRLF line endings
+        """
+        await self.command(f"MAIL FROM:<{from_addr}>")
+        refused = {}
+        for rcpt in recipients:
+            try:
+                await self.command(f"RCPT TO:<{rcpt}>")
+            except AsyncSMTPError as exc:
+                refused[rcpt] = (exc.smtp_code, exc.smtp_error)
+        if len(refused) == len(recipients):
+            await self.command("RSET")
+            raise AsyncSMTPError(550, f"all recipients refused: {refused}")
+
+        await self.command("DATA", expect=354)
+        lines = data.split(b"\r\n")
+        if lines[-1] == b"":
+            lines.pop()
+        stuffed = [b"." + line if line.startswith(b".") else line for line in lines]
+        self.writer.write(b"\r\n".join(stuffed) + b"\r\n.\r\n")
+        await self.writer.drain()
+        code, text = await self._reply()
+        if code != 250:
+            raise AsyncSMTPError(code, text)
+        return refused
+
+    async def quit(self):
+        """say goodbye and close the connection"""
+        if self.writer is None:
+            return
+        try:
+            if self.connected:
+                await self.command("QUIT", expect=221)
+        except (OSError, asyncio.TimeoutError, AsyncSMTPError):
+            pass
+        finally:
+            self.writer.close()
+            self.writer = None
+
+
+class AsyncSMTPPool(object):
+    """
+    Reuse up to ``size`` connections to one SMTP server.
+
+    A send waits for a free connection, so no more than ``size``
+    messages are in flight at once.
+
+    :param dict smtp_cfg: SMTP configuration from ini_config.Config()
+    :param int size: maximum number of connections
+    """
+
+    def __init__(self, smtp_cfg, size=SMTP_CONNECTIONS):
+        self.smtp_cfg = smtp_cfg
+        self._all = [AsyncSMTP(smtp_cfg) for _ in range(size)]
+        self._clients = asyncio.Queue()
+        for client in self._all:
+            self._clients.put_nowait(client)
+
+    async def sendmail(self, from_addr, recipients, data):
+        """send one message, reconnect (once) if the connection was lost"""
+        client = await self._clients.get()
+        try:
+            for attempt in (1, 2):
+                if not client.connected:
+                    t0 = time.perf_counter()
+                    await client.connect()
+                    metrics.smtp_connect.observe(time.perf_counter() - t0)
+                try:
+                    t0 = time.perf_counter()
+                    refused = await client.sendmail(from_addr, recipients, data)
+                    metrics.smtp_transaction.observe(time.perf_counter() - t0)
+                    return refused
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    await client.quit()
+                    if attempt == 2:
+                        raise
+        except BaseException:
+            await client.quit()
+            raise
+        finally:
+            self._clients.put_nowait(client)
+
+    async def close(self):
+        for client in self._all:
+            await client.quit()
+
+
+def _value(response):
+    """python value of the first element of a caproto monitor response"""
+    value = response.data[0]
+    if isinstance(value, bytes):
+        return value.decode(errors="replace")
+    return value.item() if hasattr(value, "item") else value
+
+
+class AsyncWatch(watches.Watch):
+    """
+    One trigger/message PV pair watched with the caproto asyncio client.
+
+    Monitor responses are handed to the usual
+    :meth:`~PvMail.cli.PvMail.receiveTriggerMonitor` and
+    :meth:`~PvMail.cli.PvMail.receiveMessageMonitor` in the event loop.
+    """
+
+    def attach(self, trigger, message):
+        """subscribe to the (connected) caproto PVs"""
+        self.pv = dict(trigger=trigger, message=message)
+        self.subscriptions = [
+            trigger.subscribe(data_type="time"),
+            message.subscribe(data_type="time"),
+        ]
+        # caproto holds only weak references to bound methods
+        self.subscriptions[0].add_callback(self._on_trigger)
+        self.subscriptions[1].add_callback(self._on_message)
+        self.running = True
+
+    async def _on_trigger(self, sub, response):
+        metadata = response.metadata
+        self.receiveTriggerMonitor(
+            value=_value(response),
+            timestamp=metadata.timestamp,
+            severity=metadata.severity,
+            status=metadata.status,
+        )
+
+    async def _on_message(self, sub, response):
+        self.receiveMessageMonitor(value=_value(response))
+
+    def attach_history(self, pvs):
+        """subscribe to the caproto context PVs, record them in :attr:`history`"""
+        self._history_callbacks = []  # keep them: caproto holds weak references
+        for pv in pvs:
+            append = self.history.buffers[pv.name].append
+
+            async def receive(sub, response, append=append):
+                value = history._number(_value(response))
+                append(response.metadata.timestamp, value)
+
+            subscription = pv.subscribe(data_type="time")
+            subscription.add_callback(receive)
+            self.subscriptions.append(subscription)
+            self._history_callbacks.append(receive)
+
+    def do_stop(self):
+        """stop watching (the subscriptions end with the caproto context)"""
+        self.subscriptions = []
+        self.running = False
+
+
+class AsyncWatchEngine(watches.WatchEngine):
+    """
+    Run all watches, and send all email, from one asyncio event loop.
+
+    :param obj config: email configuration from ini_config.Config()
+    :param class watch_class: class used to create each watch
+    :param int workers: maximum number of SMTP connections
+    """
+
+    def __init__(self, config=None, watch_class=AsyncWatch, workers=SMTP_CONNECTIONS):
+        super().__init__(config, watch_class=watch_class, workers=workers)
+        self.workers = workers
+        self.connect_timeout = CONNECT_TIMEOUT
+        self.loop = None
+        self.smtp = None
+        self._sending = set()
+        self._stop = None
+        self._input_subscriptions = []
+
+    def _make_pool(self, workers):
+        return None  # messages are sent by tasks in the event loop
+
+    def send_event(self, watch, event):
+        """send one message from the event loop"""
+        self.submit(self._send_event(event, [watch]))
+
+    def _send_digest(self, events, watches):
+        """send the digest from the event loop"""
+        self.submit(self._send_digest_async(events, watches))
+
+    def attach_inputs(self, pvs):
+        """subscribe to the caproto input PVs of :attr:`index`, once each"""
+        update = self.index.update
+
+        async def receive(sub, response):
+            metrics.input_monitors.inc()
+            value = _value(response)
+            cli.logger("%s = %s", sub.pv.name, value)
+            metadata = response.metadata
+            update(
+                sub.pv.name,
+                value,
+                metadata.severity,
+                metadata.status,
+                timestamp=metadata.timestamp,
+            )
+
+        self._on_input = receive  # keep it: caproto holds weak references
+        for pv in pvs:
+            subscription = pv.subscribe(data_type="time")
+            subscription.add_callback(receive)
+            self._input_subscriptions.append(subscription)
+
+    def queue_depth(self):
+        """number of messages being sent"""
+        return len(self._sending)
+
+    def submit(self, coro):
+        """run coroutine ``coro`` in the event loop, from any thread"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        self._sending.add(future)
+        future.add_done_callback(self._sending.discard)
+
+    async def _send_event(self, event, watches):
+        cli.logger("trigger received, sending email")
+        template = digest._template(watches)
+        subject, msg = cli.render_message(event, self.config, template)
+        await self._send(subject, msg, list(event.recipients), event.time, watches)
+
+    async def _send_digest_async(self, events, watches):
+        if len(events) == 1:
+            await self._send_event(events[0], watches)
+            return
+        cli.logger(f"send_digest: {len(events)} trigger(s)")
+        subject, msg = digest.render_digest(events, self.config)
+        recipients = list(events[0].recipients)
+        await self._send(subject, msg, recipients, events[0].time, watches)
+
+    async def _send(self, subject, msg, recipients, trigger_time, watches=None):
+        try:
+            if self.smtp is not None:
+                sender = self.config.get()["user"]
+                text = mailer._compose(subject, msg, recipients, sender)
+                data = mailer._crlf_bytes(text)
+                await self.smtp.sendmail(sender, recipients, data)
+            else:
+                emailer = functools.partial(
+                    cli.get_emailer(self.config),
+                    subject,
+                    msg,
+                    recipients,
+                    self.config.get(),
+                    logger=cli.logger,
+                )
+                await self.loop.run_in_executor(None, emailer)
+        except Exception as exc:
+            metrics.emails_failed.inc()
+            cli.logger(f"problem sending email: {exc}")
+        else:
+            metrics.emails_sent.inc()
+            metrics.send_latency.observe(time.time() - trigger_time)
+            cli.logger("message(s) sent")
+            digest.count_sent(watches)
+
+    async def start_async(self, context, timeout=CONNECT_TIMEOUT):
+        """
+        connect all PVs at once, then subscribe each watch
+
+        A watch whose PVs do not connect is logged and skipped.
+        Returns the number of running watches.
+        """
+        cli.logger(f"starting {len(self.watches)} watch(es)")
+        names = []
+        for watch in self.watches:
+            names += [watch.triggerPV, watch.messagePV]
+        pvs = await context.get_pvs(*names, timeout=timeout)
+        results = await asyncio.gather(
+            *[pv.wait_for_connection(timeout=timeout) for pv in pvs],
+            return_exceptions=True,
+        )
+        for i, watch in enumerate(self.watches):
+            trigger, message = results[2 * i : 2 * i + 2]
+            if isinstance(trigger, Exception):
+                cli.logger(f"{watch!r} did not start: {names[2 * i]} not connected")
+                continue
+            if isinstance(message, Exception):
+                cli.logger(f"{watch!r}: {names[2 * i + 1]} not connected")
+            watch.attach(pvs[2 * i], pvs[2 * i + 1])
+            if watch.condition is not None and watch.input_index is None:
+                pvnames = list(watch.condition.inputs.values())
+                self.index.add(watch.condition, [None] + pvnames, watch.condition_fired)
+                watch.input_index = self.index
+            if watch.history is not None:
+                # not waited for, the history starts when they connect
+                context_pvs = await context.get_pvs(*watch.history.pvnames)
+                watch.attach_history(context_pvs)
+                cli.logger(watch.history.summary())
+        if len(self.index):
+            # once for all watches, the conditions are not evaluated until
+            # they connect
+            input_pvs = await context.get_pvs(*self.index.pvnames())
+            self.attach_inputs(input_pvs)
+            cli.logger(self.index.summary())
+        running = sum(1 for watch in self.watches if watch.running)
+        cli.logger(f"{running} of {len(self.watches)} watch(es) running")
+        metrics.queue_depth.set_function(self.queue_depth)
+        metrics.pvs_connected.set_function(lambda: cli.connected_pvs(self.watches))
+        metrics.history_bytes.set_function(self.history_bytes)
+        return running
+
+    def stop(self):
+        """stop :meth:`run` (safe to call from any thread)"""
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    async def run(self, logging_interval=cli.CHECKPOINT_INTERVAL_S, context=None):
+        """
+        watch all PVs and send email until :meth:`stop` is called
+
+        :param float logging_interval: checkpoint reporting interval (s)
+        :param obj context: caproto asyncio client context
+            (default: a new one, disconnected on return)
+        """
+        from caproto.asyncio.client import Context
+
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self.config = self.config or ini_config.cached()
+        if cli.outbox is None and self.config.mail_transfer_agent == "SMTP":
+            self.smtp = AsyncSMTPPool(self.config.get(), size=self.workers)
+
+        own_context = context is None
+        if own_context:
+            context = Context()
+        try:
+            await self.start_async(context, self.connect_timeout)
+            while not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), logging_interval)
+                except asyncio.TimeoutError:
+                    running = sum(1 for watch in self.watches if watch.running)
+                    cli.logger(
+                        f"checkpoint: {running} watch(es) running,"
+                        f" {self.queue_depth()} message(s) being sent"
+                    )
+        finally:
+            for watch in self.watches:
+                watch.do_stop()
+            for coalescer in self.coalescers.values():
+                if coalescer is not None:
+                    # send the held digests, joins the coalescer's thread
+                    await self.loop.run_in_executor(None, coalescer.close)
+            pending = [asyncio.wrap_future(f) for f in list(self._sending)]
+            await asyncio.gather(*pending, return_exceptions=True)
+            if self.smtp is not None:
+                await self.smtp.close()
+            if own_context:
+                await context.disconnect()
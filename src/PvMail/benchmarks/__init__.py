@@ -0,0 +1,10 @@
+"""
+Offline benchmarks for PvMail.
+
+Each module can be run by itself, such as::
+
+    $ python -m PvMail.benchmarks.watches
+
+Run them all, and compare with results saved from an earlier run, with
+:mod:`PvMail.benchmarks.suite`.
+"""
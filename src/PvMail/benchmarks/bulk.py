@@ -0,0 +1,87 @@
+"""
+Bulk sending with :func:`PvMail.mailer.send_many`, into a local SMTP server.
+
+Compares one :func:`~PvMail.mailer.sendMail_SMTP` call per message
+(pooled connection) with :func:`~PvMail.mailer.send_many`, with and
+without ESMTP PIPELINING, for many messages and for one message to a
+long recipient list.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.bulk
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import time
+
+from .. import mailer
+from .smtp_sink import SMTPSink
+
+N_MESSAGES = 2_000
+N_RECIPIENTS = 5_000
+
+
+class _Config(object):
+    mail_transfer_agent = "SMTP"
+
+    def __init__(self, smtp_cfg):
+        self.smtp_cfg = smtp_cfg
+
+    def get(self):
+        return self.smtp_cfg
+
+
+def _timed(method, messages, pipelining):
+    sink = SMTPSink(pipelining=pipelining)
+    sink.start()
+    config = _Config(sink.config())
+    t0 = time.perf_counter()
+    if method == "send_many":
+        mailer.send_many(messages, config)
+    else:
+        for subject, message, recipients in messages:
+            mailer.sendMail_SMTP(subject, message, recipients, config.get())
+    elapsed = time.perf_counter() - t0
+    sink.stop()
+    mailer.smtp_pool.close()
+    return elapsed
+
+
+def measure(n_messages=N_MESSAGES, n_recipients=N_RECIPIENTS):
+    """return list of (case, method, pipelining, seconds)"""
+    many = [
+        (f"message {i}", "beam dump", ["ops@example.org"]) for i in range(n_messages)
+    ]
+    fanout = [
+        ("fan-out", "beam dump", [f"u{i}@example.org" for i in range(n_recipients)])
+    ]
+    results = []
+    for case, messages in (
+        (f"{n_messages} messages", many),
+        (f"{n_recipients} rcpt", fanout),
+    ):
+        results.append((case, "sendMail_SMTP", False, _timed("loop", messages, False)))
+        for pipelining in (False, True):
+            t = _timed("send_many", messages, pipelining)
+            results.append((case, "send_many", pipelining, t))
+    return results
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument("-n", dest="n_messages", type=int, default=N_MESSAGES)
+    parser.add_argument("-r", dest="n_recipients", type=int, default=N_RECIPIENTS)
+    results = parser.parse_args()
+
+    print(f"{'case':>16}  {'method':>14}  {'pipelining':>10}  {'time (s)':>9}")
+    for case, method, pipelining, t in measure(
+        results.n_messages, results.n_recipients
+    ):
+        print(f"{case:>16}  {method:>14}  {str(pipelining):>10}  {t:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
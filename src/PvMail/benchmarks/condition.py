@@ -0,0 +1,92 @@
+"""
+Time to evaluate trigger conditions, per monitor update, against a budget.
+
+Each condition (:mod:`PvMail.condition`) is fed ``-n`` updates of its
+PVs, in turn, with values that make it change often.  The time per
+:meth:`~PvMail.condition.Condition.update` is compared with the fixed
+0 to 1 test of pvMail 4.0.  The exit status is 1 if any condition takes
+longer than the budget.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.condition -n 1000000
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import sys
+import time
+
+from ..condition import Condition
+
+N_UPDATES = 200_000
+BUDGET_US = 5.0
+VALUES = (0, 1, 0, 6, 2, 7, 1, 3)  # each PV in turn, then the next value
+
+# condition: inputs
+CONDITIONS = {
+    "old_value == 0 and value == 1": {},
+    "value > 5": {},
+    "above(value, 5, 1)": {},
+    "severity(value) >= MAJOR": {},
+    "rises(value) and B == 0": dict(B="sim:b"),
+    "above(value, 5, 1) and B == 0 or not 0 <= C < 10": dict(B="sim:b", C="sim:c"),
+}
+
+
+def make_updates(n_updates, n_pvs):
+    """return list of (PV index, value, severity), PVs in turn"""
+    return [
+        (i % n_pvs, VALUES[(i // n_pvs) % len(VALUES)], i % 4) for i in range(n_updates)
+    ]
+
+
+def measure_4_0(updates):
+    """return time (s) per update of the 0 to 1 test of pvMail 4.0"""
+    old_value = 0
+    triggers = 0
+    t0 = time.perf_counter()
+    for _index, value, _severity in updates:
+        if old_value == 0 and value == 1:
+            triggers += 1
+        old_value = value
+    return (time.perf_counter() - t0) / len(updates)
+
+
+def measure(condition, updates):
+    """return (time (s) per update, triggers)"""
+    update = condition.update
+    triggers = 0
+    t0 = time.perf_counter()
+    for index, value, severity in updates:
+        if update(index, value, severity):
+            triggers += 1
+    return (time.perf_counter() - t0) / len(updates), triggers
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument("-n", type=int, default=N_UPDATES, help="number of updates")
+    args = parser.parse_args()
+
+    seconds = measure_4_0(make_updates(args.n, 1))
+    print(f"{1e6 * seconds:8.3f} us  pvMail 4.0: old_value == 0 and value == 1")
+    over = []
+    for text, inputs in CONDITIONS.items():
+        condition = Condition(text, inputs)
+        updates = make_updates(args.n, 1 + len(inputs))
+        seconds, triggers = measure(condition, updates)
+        status = "ok" if 1e6 * seconds <= BUDGET_US else "OVER BUDGET"
+        print(f"{1e6 * seconds:8.3f} us  {text}  ({triggers} triggers)  {status}")
+        if status != "ok":
+            over.append(text)
+
+    if over:
+        print(f"over budget ({BUDGET_US} us): " + ", ".join(over))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Startup time to connect many PVs, all at once or one at a time.
+
+A soft IOC (:mod:`PvMail.benchmarks.ioc`, needs caproto) serving
+``--pairs`` trigger/message pairs is started in a new process on a
+free local port.  PyEpics then connects to all its PVs (plus
+``--missing`` PVs that do not exist) with one
+:class:`~PvMail.connections.BulkConnection`, and to a sample of them one
+at a time, as ``testConnect`` did.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.connect --pairs 2500
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from ..connections import BulkConnection
+
+N_PAIRS = 2_500
+N_MISSING = 10
+N_SERIAL = 100
+TIMEOUT = 2.0
+IOC_CODE = """
+from caproto.asyncio.server import run
+from PvMail.benchmarks.ioc import make_pvdb
+run(make_pvdb({n_pairs}), interfaces=["127.0.0.1"], log_pv_names=False)
+"""
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_ioc(n_pairs):
+    """start the soft IOC, set the CA environment for this process, return it"""
+    port = str(_free_port())
+    os.environ.update(
+        EPICS_CA_SERVER_PORT=port,
+        EPICS_CAS_SERVER_PORT=port,
+        EPICS_CA_ADDR_LIST="127.0.0.1",
+        EPICS_CA_AUTO_ADDR_LIST="NO",
+        EPICS_CAS_INTF_ADDR_LIST="127.0.0.1",
+        EPICS_CA_MAX_ARRAY_BYTES="100000",
+    )
+    code = IOC_CODE.format(n_pairs=n_pairs)
+    return subprocess.Popen([sys.executable, "-c", code], stderr=subprocess.DEVNULL)
+
+
+def connect(pvnames, timeout):
+    """connect all at once, return (elapsed s, BulkConnection)"""
+    import epics
+
+    bulk = BulkConnection()
+    pvs = [epics.PV(pvname) for pvname in pvnames]
+    bulk.add(pvs)
+    bulk.wait(timeout)
+    for pv in pvs:
+        pv.disconnect()
+    return bulk.elapsed, bulk
+
+
+def connect_serially(pvnames, timeout):
+    """connect one PV at a time, return elapsed s"""
+    import epics
+
+    t0 = time.perf_counter()
+    for pvname in pvnames:
+        bulk = BulkConnection()
+        pv = epics.PV(pvname)
+        bulk.add([pv])
+        bulk.wait(timeout)
+        pv.disconnect()
+    return time.perf_counter() - t0
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument("--pairs", type=int, default=N_PAIRS, help="PV pairs served")
+    parser.add_argument(
+        "--missing", type=int, default=N_MISSING, help="PVs that do not exist"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=TIMEOUT, help="connection timeout (s)"
+    )
+    args = parser.parse_args()
+
+    ioc = start_ioc(args.pairs)
+    try:
+        pvnames = ["pvMail:trigger", "pvMail:message"]
+        for i in range(args.pairs):
+            pvnames += [f"sim:{i}:trigger", f"sim:{i}:message"]
+
+        # wait for the IOC to serve its PVs
+        elapsed, bulk = connect(pvnames[:1], timeout=30)
+        if bulk.pvnames != set(bulk.latency):
+            raise RuntimeError("IOC did not start")
+
+        missing = [f"missing:{i}" for i in range(args.missing)]
+        elapsed, bulk = connect(pvnames + missing, args.timeout)
+        print(f"all at once: {bulk.summary()}")
+
+        sample = pvnames[:N_SERIAL]
+        serial = connect_serially(sample, args.timeout)
+        per_pv = serial / len(sample)
+        print(
+            f"one at a time: {len(sample)} PVs in {serial:.3f} s"
+            f" ({1e3 * per_pv:.2f} ms per PV), for {len(pvnames)} PVs:"
+            f" {per_pv * len(pvnames):.1f} s"
+            f" + {args.missing} x {args.timeout} s timeouts"
+        )
+    finally:
+        ioc.terminate()
+        ioc.wait()
+
+
+if __name__ == "__main__":
+    main()
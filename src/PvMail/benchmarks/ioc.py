@@ -0,0 +1,42 @@
+"""
+Channel Access soft IOC (caproto) serving trigger/message PV pairs.
+
+Serves ``pvMail:trigger`` and ``pvMail:message`` plus any number of
+``sim:N:trigger`` / ``sim:N:message`` pairs, for testing the asyncio
+engine (:mod:`PvMail.aio`) against a real Channel Access server.
+
+Run it with::
+
+    $ python -m PvMail.benchmarks.ioc --list-pvs
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+from caproto import ChannelInteger
+from caproto import ChannelString
+
+
+def make_pvdb(n_pairs=0, prefix="pvMail:"):
+    """return the caproto pvdb: {pvname: ChannelData}"""
+    pvdb = {
+        f"{prefix}trigger": ChannelInteger(value=0),
+        f"{prefix}message": ChannelString(value="default message"),
+    }
+    for i in range(n_pairs):
+        pvdb[f"sim:{i}:trigger"] = ChannelInteger(value=0)
+        pvdb[f"sim:{i}:message"] = ChannelString(value=f"message {i}")
+    return pvdb
+
+
+def main():
+    from caproto.server import ioc_arg_parser
+    from caproto.server import run
+
+    ioc_options, run_options = ioc_arg_parser(
+        default_prefix="pvMail:", desc=__doc__.strip().splitlines()[0]
+    )
+    run(make_pvdb(prefix=ioc_options["prefix"]), **run_options)
+
+
+if __name__ == "__main__":
+    main()
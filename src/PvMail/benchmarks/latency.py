@@ -0,0 +1,119 @@
+"""
+Trigger-to-dispatch latency of the command-line main loop.
+
+Compares the blocking :func:`PvMail.cli.event_loop` with the
+sleep-polling loop used by pvMail 4.0 and earlier (checking
+``pvm.trigger`` every ``-r`` seconds).  Triggers come from a
+:class:`~PvMail.benchmarks.simulator.SimulatedIOC`; nothing is sent.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.latency
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import queue
+import statistics
+import threading
+import time
+
+from .. import cli
+from .simulator import SimulatedIOC
+
+N_TRIGGERS = 50
+
+
+def _polling_loop(pvm, dispatched, sleep_duration, stop):
+    """main loop of pvMail 4.0: sleep, then check the trigger flag"""
+    while not stop.is_set():
+        if pvm.trigger:
+            pvm.trigger = False
+            dispatched.append(time.perf_counter())
+        time.sleep(sleep_duration)
+
+
+def _event_loop(events, dispatched):
+    """same as cli.event_loop(), recording instead of sending"""
+    while True:
+        item = events.get()
+        if item is None:
+            break
+        dispatched.append(time.perf_counter())
+
+
+def _pvmail(ioc, events=None):
+    pvm = ioc.watch_class(cli.PvMail)(events=events)
+    pvm.triggerPV = "pvMail:trigger"
+    pvm.messagePV = "pvMail:message"
+    pvm.recipients = ["joe@example.org"]
+    return pvm
+
+
+def _fire(ioc, dispatched, n_triggers):
+    """post trigger edges, return the list of latencies (s)"""
+    latencies = []
+    for i in range(n_triggers):
+        t0 = time.perf_counter()
+        ioc.put("pvMail:trigger", 1)
+        while len(dispatched) <= i and time.perf_counter() - t0 < 10:
+            time.sleep(0.00005)
+        latencies.append(dispatched[i] - t0)
+        ioc.put("pvMail:trigger", 0)
+        time.sleep(0.001)
+    return latencies
+
+
+def measure_polling(n_triggers=N_TRIGGERS, sleep_duration=cli.RETRY_INTERVAL_S):
+    """latencies (s) of the sleep-polling loop"""
+    ioc = SimulatedIOC()
+    pvm = _pvmail(ioc)
+    pvm.dispatch = lambda event: None  # 4.0 also started a thread here
+    pvm.do_start()
+    dispatched, stop = [], threading.Event()
+    args = (pvm, dispatched, sleep_duration, stop)
+    loop = threading.Thread(target=_polling_loop, args=args)
+    loop.start()
+    latencies = _fire(ioc, dispatched, n_triggers)
+    stop.set()
+    loop.join()
+    pvm.do_stop()
+    return latencies
+
+
+def measure_event_loop(n_triggers=N_TRIGGERS):
+    """latencies (s) of the blocking event loop"""
+    ioc = SimulatedIOC()
+    events = queue.Queue()
+    pvm = _pvmail(ioc, events)
+    pvm.do_start()
+    dispatched = []
+    loop = threading.Thread(target=_event_loop, args=(events, dispatched))
+    loop.start()
+    latencies = _fire(ioc, dispatched, n_triggers)
+    events.put(None)
+    loop.join()
+    pvm.do_stop()
+    return latencies
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument(
+        "-n", dest="n_triggers", type=int, default=N_TRIGGERS, help="triggers"
+    )
+    results = parser.parse_args()
+
+    print(f"{'main loop':>12}  {'median (ms)':>12}  {'max (ms)':>10}")
+    for label, latencies in (
+        ("polling", measure_polling(results.n_triggers)),
+        ("event", measure_event_loop(results.n_triggers)),
+    ):
+        median = 1e3 * statistics.median(latencies)
+        print(f"{label:>12}  {median:>12.3f}  {1e3 * max(latencies):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Time to render (and compose with headers) the email of many triggers.
+
+Compares the compiled default template (:mod:`PvMail.template`) and
+cached header block (``mailer._compose``) with the message built as
+pvMail 4.0 did: string concatenation, host name and user name looked up
+for each email, headers made with :class:`email.message.Message`.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.render -n 100000
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import datetime
+import email.message
+import os
+import socket
+import sys
+import time
+
+from .. import mailer
+from .. import template
+from ..trigger import TriggerEvent
+
+N_EVENTS = 100_000
+N_WATCHES = 100
+
+
+def render_4_0(event, username):
+    """the message, as rendered by pvMail 4.0"""
+    subject = "pvMail.py: " + event.triggerPV
+
+    msg = ""  # start with a new message
+    msg += "\n\n"
+    msg += str(event.message)
+    msg += "\n\n"
+    msg += "user: %s\n" % (os.environ.get("LOGNAME", None) or username)
+    msg += "host: %s\n" % socket.gethostname()
+    msg += "date: %s (UNIX, not PV)\n" % datetime.datetime.fromtimestamp(event.time)
+    if event.ca_timestamp is not None:
+        msg += "CA_timestamp: %d\n" % event.ca_timestamp
+    else:
+        msg += "CA_timestamp: not available\n"
+    msg += "program: %s\n" % sys.argv[0]
+    msg += "PID: %d\n" % os.getpid()
+    msg += "trigger PV: %s\n" % event.triggerPV
+    if event.connected:
+        msg += "message PV: %s\n" % event.messagePV
+    else:
+        msg += "message PV: %s (disconnected)\n" % event.messagePV
+    msg += "recipients: %s\n" % ", ".join(event.recipients)
+    if event.suppressed:
+        msg += "suppressed: %d trigger(s) since last email\n" % event.suppressed
+    return subject, msg
+
+
+def compose_4_0(subject, message, recipients, sender):
+    """the email text, as composed by pvMail 4.0"""
+    msg = email.message.Message()
+    for who in recipients:
+        msg["To"] = who
+    msg["From"] = sender
+    msg["Subject"] = subject
+    msg.set_payload(message)
+    return str(msg)
+
+
+def make_events(n_events, n_watches=N_WATCHES):
+    """return ``n_events`` triggers, from ``n_watches`` watches in turn"""
+    t0 = time.time()
+    return [
+        TriggerEvent(
+            triggerPV=f"sim:{i % n_watches}:trigger",
+            value=1,
+            old_value=0,
+            ca_timestamp=t0 + i,
+            messagePV=f"sim:{i % n_watches}:message",
+            message=f"message {i % n_watches}",
+            connected=True,
+            recipients=("ops@example.org", f"group{i % 7}@example.org"),
+            time=t0 + i,
+        )
+        for i in range(n_events)
+    ]
+
+
+def measure(events, render, compose, user="pvmail"):
+    """return (render, render and compose) rate, emails/s"""
+    t0 = time.perf_counter()
+    for event in events:
+        render(event, user)
+    t1 = time.perf_counter()
+    for event in events:
+        subject, msg = render(event, user)
+        compose(subject, msg, event.recipients, user)
+    t2 = time.perf_counter()
+    return len(events) / (t1 - t0), len(events) / (t2 - t1)
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument("-n", type=int, default=N_EVENTS, help="number of triggers")
+    args = parser.parse_args()
+
+    events = make_events(args.n)
+    assert render_4_0(events[0], "pvmail") == template.DEFAULT.render(
+        events[0], os.environ.get("LOGNAME", None) or "pvmail"
+    )
+    user = os.environ.get("LOGNAME", None) or "pvmail"
+    results = {
+        "pvMail 4.0": measure(events, render_4_0, compose_4_0),
+        "template": measure(events, template.DEFAULT.render, mailer._compose, user),
+    }
+    print(f"{len(events)} triggers from {N_WATCHES} watches, emails/s:")
+    print(f"{'':>12}  {'render':>10}  {'+ compose':>10}")
+    for name, (render_rate, compose_rate) in results.items():
+        print(f"{name:>12}  {render_rate:>10.0f}  {compose_rate:>10.0f}")
+    old, new = results["pvMail 4.0"], results["template"]
+    print(f"{'x faster':>12}  {new[0] / old[0]:>10.1f}  {new[1] / old[1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Indexed condition evaluation (:mod:`PvMail.rules`) against evaluating all.
+
+``--rules`` conditions, each on a trigger PV and two input PVs chosen
+at random from ``--pvs`` PVs, are fed the same random monitor updates
+two ways: by a :class:`~PvMail.rules.RuleIndex`, which evaluates only
+the conditions that use the updated PV, and by evaluating every
+condition on every update.  Both must trigger the same number of times.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.rules --rules 10000 --pvs 20000
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import random
+import time
+
+from ..condition import Condition
+from ..condition import compile_condition
+from ..rules import RuleIndex
+
+N_RULES = 10_000
+N_PVS = 20_000
+N_UPDATES = 200_000
+N_NAIVE_UPDATES = 200
+TEXT = "value > 5 and A < 3 or B == 7"
+INPUTS = ("A", "B")
+
+
+def make_rules(n_rules, n_pvs, seed=1):
+    """return list of PV names (trigger, A, B), all different, of each condition"""
+    rng = random.Random(seed)
+    return [[f"sim:{i}" for i in rng.sample(range(n_pvs), 3)] for _ in range(n_rules)]
+
+
+def make_updates(n_updates, n_pvs, seed=2):
+    """return list of (PV name, value)"""
+    rng = random.Random(seed)
+    pvnames = [f"sim:{i}" for i in range(n_pvs)]
+    return [(rng.choice(pvnames), rng.randrange(10)) for _ in range(n_updates)]
+
+
+def initial_values(n_pvs):
+    """return {PV name: value} of all PVs"""
+    return {f"sim:{i}": i % 10 for i in range(n_pvs)}
+
+
+def measure_indexed(rules, values, updates):
+    """return (time (s) per update, triggers)"""
+    fired = []
+    index = RuleIndex()
+    for pvnames in rules:
+        condition = Condition(TEXT, dict(zip(INPUTS, pvnames[1:])))
+        condition.reset([values[pvname] for pvname in pvnames])
+        index.add(condition, pvnames, lambda: fired.append(1))
+    update = index.update
+    t0 = time.perf_counter()
+    for pvname, value in updates:
+        update(pvname, value)
+    return (time.perf_counter() - t0) / len(updates), len(fired)
+
+
+def measure_naive(rules, values, updates):
+    """return (time (s) per update, triggers), evaluating all conditions"""
+    function = compile_condition(TEXT, INPUTS).function
+    latest = dict(values)
+    states = [
+        bool(function([latest[p] for p in pvnames], None, None, None, None))
+        for pvnames in rules
+    ]
+    triggers = 0
+    t0 = time.perf_counter()
+    for pvname, value in updates:
+        latest[pvname] = value
+        for i, pvnames in enumerate(rules):
+            state = bool(function([latest[p] for p in pvnames], None, None, None, None))
+            if state and not states[i]:
+                triggers += 1
+            states[i] = state
+    return (time.perf_counter() - t0) / len(updates), triggers
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument("--rules", type=int, default=N_RULES, help="conditions")
+    parser.add_argument("--pvs", type=int, default=N_PVS, help="PVs")
+    parser.add_argument("-n", type=int, default=N_UPDATES, help="number of updates")
+    parser.add_argument(
+        "--naive",
+        type=int,
+        default=N_NAIVE_UPDATES,
+        help="number of updates, evaluating all conditions",
+    )
+    args = parser.parse_args()
+
+    rules = make_rules(args.rules, args.pvs)
+    values = initial_values(args.pvs)
+    updates = make_updates(args.n, args.pvs)
+    print(f"{args.rules} conditions ({TEXT}) on {args.pvs} PVs")
+
+    naive, naive_triggers = measure_naive(rules, values, updates[: args.naive])
+    check, check_triggers = measure_indexed(rules, values, updates[: args.naive])
+    if check_triggers != naive_triggers:
+        raise RuntimeError(f"{check_triggers} != {naive_triggers} triggers")
+    indexed, triggers = measure_indexed(rules, values, updates)
+    print(f"{1e6 * naive:12.3f} us per update, all conditions  ({args.naive} updates)")
+    print(f"{1e6 * indexed:12.3f} us per update, indexed  ({args.n} updates)")
+    print(f"{naive / indexed:12.0f} x faster, {triggers} triggers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+In-process stand-in for an EPICS IOC.
+
+:class:`SimulatedIOC` serves :class:`SimulatedPV` objects that behave
+enough like :class:`epics.PV` for PvMail: they connect at once, return
+values with :meth:`get`, and call monitor callbacks on :meth:`put`.
+No Channel Access traffic is involved.
+
+EXAMPLE::
+
+    >>> ioc = SimulatedIOC()
+    >>> engine = WatchEngine(watch_class=ioc.watch_class())
+    >>> engine.add("pvMail:trigger", "pvMail:message", "joe@example.org")
+    >>> engine.start()
+    >>> ioc.put("pvMail:trigger", 1)    # sends the email
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import time
+
+from .. import watches
+
+
+class SimulatedPV(object):
+    """Behaves like :class:`epics.PV` for a PV of :class:`SimulatedIOC`."""
+
+    __slots__ = ("ioc", "pvname", "connected", "callbacks", "_next_index")
+
+    def __init__(self, ioc, pvname):
+        self.ioc = ioc
+        self.pvname = pvname
+        self.connected = True
+        self.callbacks = {}
+        self._next_index = 0
+
+    @property
+    def value(self):
+        return self.ioc.values[self.pvname][0]
+
+    @property
+    def timestamp(self):
+        return self.ioc.values[self.pvname][1]
+
+    @property
+    def severity(self):
+        return self.ioc.alarms.get(self.pvname, (0, 0))[0]
+
+    def connect(self, timeout=None):
+        return self.connected
+
+    def get(self, **kw):
+        return self.value
+
+    def add_callback(self, callback, **kw):
+        self._next_index += 1
+        self.callbacks[self._next_index] = callback
+        return self._next_index
+
+    def remove_callback(self, index):
+        self.callbacks.pop(index, None)
+
+    def disconnect(self):
+        self.connected = False
+        self.callbacks.clear()
+        self.ioc.forget(self)
+
+    def run_callbacks(self):
+        value, timestamp = self.ioc.values[self.pvname]
+        severity, status = self.ioc.alarms.get(self.pvname, (0, 0))
+        for callback in list(self.callbacks.values()):
+            callback(
+                pvname=self.pvname,
+                value=value,
+                char_value=str(value),
+                timestamp=timestamp,
+                severity=severity,
+                status=status,
+            )
+
+
+class SimulatedIOC(object):
+    """
+    Hold the values of simulated PVs.
+
+    :param dict values: initial values, by PV name (default for new PVs: 0)
+    """
+
+    def __init__(self, values=None):
+        self.values = {}
+        self.alarms = {}  # pvname: (severity, status), if not (0, 0)
+        self.pvs = {}
+        for pvname, value in (values or {}).items():
+            self.values[pvname] = (value, time.time())
+
+    def pv(self, pvname):
+        """create a new PV object connected to ``pvname``"""
+        if pvname not in self.values:
+            self.values[pvname] = (0, time.time())
+        pv = SimulatedPV(self, pvname)
+        self.pvs.setdefault(pvname, []).append(pv)
+        return pv
+
+    def forget(self, pv):
+        """remove a disconnected PV object"""
+        pvs = self.pvs.get(pv.pvname, [])
+        if pv in pvs:
+            pvs.remove(pv)
+
+    def put(self, pvname, value, timestamp=None, severity=0, status=0):
+        """write a new value (and alarm) and post monitors to all PV objects"""
+        self.values[pvname] = (value, timestamp or time.time())
+        self.alarms[pvname] = (severity, status)
+        for pv in list(self.pvs.get(pvname, [])):
+            pv.run_callbacks()
+
+    def watch_class(self, base=watches.Watch):
+        """return a subclass of ``base`` that connects to this IOC"""
+        ioc = self
+
+        class SimulatedWatch(base):
+            def make_pv(self, pvname):
+                return ioc.pv(pvname)
+
+        return SimulatedWatch
@@ -0,0 +1,141 @@
+"""
+Local stand-in SMTP server that accepts and keeps every message.
+
+Speaks just enough ESMTP for :mod:`PvMail.mailer`: EHLO/HELO, MAIL,
+RCPT, DATA, RSET, NOOP and QUIT.  No STARTTLS or AUTH, so use a
+configuration without ``connection_security`` or ``password``.
+
+EXAMPLE::
+
+    >>> sink = SMTPSink()
+    >>> sink.start()
+    >>> smtp_cfg = dict(server=sink.host, port=sink.port, user="pvmail")
+    >>> mailer.sendMail_SMTP("subject", "message", ["joe"], smtp_cfg)
+    >>> len(sink.messages)
+    1
+    >>> sink.stop()
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import socket
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # replies are written one at a time, do not wait to coalesce them
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def reply(self, text):
+        self.wfile.write(text.encode() + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self.reply("220 localhost pvMail SMTP sink")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                extensions = ["8BITMIME", "SIZE 10000000"]
+                if sink.pipelining:
+                    extensions.append("PIPELINING")
+                for ext in extensions:
+                    self.reply(f"250-{ext}")
+                self.reply("250 HELP")
+            elif verb in ("HELO", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                if sink.max_recipients and len(recipients) >= sink.max_recipients:
+                    self.reply("452 too many recipients")
+                elif command[8:].strip("<> ") in sink.refuse:
+                    self.reply("550 no such user")
+                else:
+                    recipients.append(command[8:].strip("<> "))
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                data = []
+                for line in self.rfile:
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    data.append(line)
+                with sink.lock:
+                    sink.messages.append((sender, recipients, b"".join(data)))
+                    sink.accepted.append(time.perf_counter())
+                if sink.hang_up:
+                    break  # message accepted, but the client is not told
+                self.reply("250 OK queued")
+                sender, recipients = None, []
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                break
+            else:
+                self.reply("502 command not implemented")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SMTPSink(object):
+    """
+    SMTP server (in a background thread) on a free local port.
+
+    :param bool pipelining: advertise the ESMTP PIPELINING extension
+    :param int max_recipients: refuse RCPT beyond this many per message (0: no limit)
+    :param [str] refuse: addresses refused (550) by RCPT
+    :param bool hang_up: close the connection after DATA, before the reply
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        pipelining=True,
+        max_recipients=0,
+        refuse=(),
+        hang_up=False,
+    ):
+        self.pipelining = pipelining
+        self.max_recipients = max_recipients
+        self.refuse = refuse
+        self.hang_up = hang_up
+        self.connections = 0
+        self.messages = []
+        self.accepted = []  # time.perf_counter() when each message was accepted
+        self.lock = threading.Lock()
+        self.server = _Server((host, port), _SMTPHandler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address
+        self._thread = None
+
+    def config(self, user="pvmail@localhost"):
+        """SMTP configuration dictionary for this server"""
+        return dict(server=self.host, port=str(self.port), user=user)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
@@ -0,0 +1,84 @@
+"""
+Throughput of the outbound spool, into a local stand-in SMTP server.
+
+Measures how fast messages are written to the spool (with and without
+fsync) and how fast the deliverer drains them to an
+:class:`~PvMail.benchmarks.smtp_sink.SMTPSink`.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.spool
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import tempfile
+import time
+
+from .. import mailer
+from ..spool import Spool
+from .smtp_sink import SMTPSink
+
+N_MESSAGES = 10_000
+MESSAGE = "\n\nbeam dump\n\nuser: pvmail\nhost: localhost\n" * 5
+
+
+class _Config(object):
+    mail_transfer_agent = "SMTP"
+
+    def __init__(self, smtp_cfg):
+        self.smtp_cfg = smtp_cfg
+
+    def get(self):
+        return self.smtp_cfg
+
+
+def measure(n_messages=N_MESSAGES, fsync=True):
+    """return dict with spool and delivery rates (messages/s)"""
+    sink = SMTPSink()
+    sink.start()
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = Spool(directory, fsync=fsync)
+        t0 = time.perf_counter()
+        for i in range(n_messages):
+            outbox.put(f"pvMail.py: sim:{i}:trigger", MESSAGE, ["ops@example.org"])
+        t_spool = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        outbox.start(_Config(sink.config()))
+        while len(outbox):
+            time.sleep(0.01)
+        t_deliver = time.perf_counter() - t0
+        outbox.stop()
+    sink.stop()
+    mailer.smtp_pool.close()
+
+    assert len(sink.messages) == n_messages
+    return dict(
+        messages=n_messages,
+        fsync=fsync,
+        spool_per_s=n_messages / t_spool,
+        deliver_per_s=n_messages / t_deliver,
+    )
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument(
+        "-n", dest="n_messages", type=int, default=N_MESSAGES, help="messages"
+    )
+    results = parser.parse_args()
+
+    print(f"{'messages':>8}  {'fsync':>5}  {'spooled/s':>10}  {'delivered/s':>11}")
+    for fsync in (True, False):
+        r = measure(results.n_messages, fsync)
+        print(
+            f"{r['messages']:>8}  {str(r['fsync']):>5}"
+            f"  {r['spool_per_s']:>10.0f}  {r['deliver_per_s']:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Startup time of each console entry point, checked against a budget.
+
+Each module named in ``[project.scripts]`` is imported in a new Python
+process with ``-X importtime``.  The time is the cumulative import
+time that Python reports for the module (best of ``--repeat`` runs),
+so interpreter startup is not counted.  ``pvMail --version`` is also
+timed from start to exit, less the time to run ``python -c pass``.
+
+The slowest imports below each entry point are listed, to find what
+to defer.  The exit status is 1 if any time is over its budget.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.startup
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import subprocess
+import sys
+import time
+
+REPEAT = 5
+N_SLOWEST = 5
+
+# entry point: (module, budget in ms)
+ENTRY_POINTS = {
+    "pvMail": ("PvMail.cli", 80),
+    "pvMail_mail_test": ("PvMail.mailer", 80),
+    "pvMail_mail_config_file": ("PvMail.ini_config", 40),
+}
+VERSION_BUDGET_MS = 150
+VERSION_CODE = """
+import sys
+from PvMail.cli import main
+sys.argv = ["pvMail", "--version"]
+main()
+"""
+
+
+def parse_importtime(stderr):
+    """return list of (name, self us, cumulative us, depth) from -X importtime"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def import_time(module, repeat=REPEAT):
+    """return (best cumulative import time in s, imports of that run)"""
+    best = None
+    for _ in range(repeat):
+        run = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        imports = parse_importtime(run.stderr)
+        total = sum(us for name, _self, us, depth in imports if name == module)
+        if best is None or total < best[0]:
+            best = (total, imports)
+    return best[0] / 1e6, best[1]
+
+
+def run_time(code, repeat=REPEAT):
+    """return best time (s) to run ``code`` in a new Python process"""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], capture_output=True, check=True)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument(
+        "--repeat", type=int, default=REPEAT, help="runs of each, best is kept"
+    )
+    args = parser.parse_args()
+
+    over = []
+    for entry_point, (module, budget_ms) in ENTRY_POINTS.items():
+        seconds, imports = import_time(module, args.repeat)
+        status = "ok" if 1e3 * seconds <= budget_ms else "OVER BUDGET"
+        print(
+            f"{entry_point:>24}  import {module}:"
+            f" {1e3 * seconds:6.1f} ms (budget {budget_ms} ms)  {status}"
+        )
+        slowest = sorted(imports, key=lambda i: i[1], reverse=True)[:N_SLOWEST]
+        for name, self_us, _cumulative, _depth in slowest:
+            print(f"{'':>26}{self_us / 1e3:6.1f} ms  {name}")
+        if status != "ok":
+            over.append(entry_point)
+
+    seconds = run_time(VERSION_CODE, args.repeat) - run_time("pass", args.repeat)
+    status = "ok" if 1e3 * seconds <= VERSION_BUDGET_MS else "OVER BUDGET"
+    print(
+        f"{'pvMail --version':>24}  {1e3 * seconds:6.1f} ms"
+        f" (budget {VERSION_BUDGET_MS} ms)  {status}"
+    )
+    if status != "ok":
+        over.append("pvMail --version")
+
+    if over:
+        print("over budget: " + ", ".join(over))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
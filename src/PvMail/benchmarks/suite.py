@@ -0,0 +1,266 @@
+"""
+Offline benchmark suite, results saved as JSON to catch regressions.
+
+Triggers come from a :class:`~PvMail.benchmarks.simulator.SimulatedIOC`
+and email goes to a local :class:`~PvMail.benchmarks.smtp_sink.SMTPSink`,
+through the same :class:`~PvMail.watches.WatchEngine` send path used by
+``pvMail --watches``.  No IOC, mail server or network is needed.
+
+=======================  =====  ========================================
+metric                   unit   measures
+=======================  =====  ========================================
+``latency_p50_ms`` ...   ms     trigger put to SMTP server accepting it
+``triggers_per_s``       1/s    sustained rate, many watches triggering
+``bytes_per_watch``      B      memory allocated per watch
+``startup_s``            s      create and start the watches
+``import_s``             s      ``import PvMail.cli`` in a new process
+=======================  =====  ========================================
+
+Save the results of a release, then compare a later tree with them::
+
+    $ python -m PvMail.benchmarks.suite -o baseline.json
+    $ python -m PvMail.benchmarks.suite -o results.json --compare baseline.json
+
+With ``--compare``, the exit status is 1 if any metric is worse than
+the baseline by more than the tolerance (default 20%).
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from .. import __version__
+from .. import dispatch
+from .. import mailer
+from ..watches import WatchEngine
+from . import watches as watches_benchmark
+from .simulator import SimulatedIOC
+from .smtp_sink import SMTPSink
+
+SCHEMA = 1
+TOLERANCE = 0.2
+
+# name: (unit, better)
+METRICS = {
+    "latency_p50_ms": ("ms", "lower"),
+    "latency_p90_ms": ("ms", "lower"),
+    "latency_p99_ms": ("ms", "lower"),
+    "latency_max_ms": ("ms", "lower"),
+    "triggers_per_s": ("1/s", "higher"),
+    "bytes_per_watch": ("B", "lower"),
+    "startup_s": ("s", "lower"),
+    "import_s": ("s", "lower"),
+}
+
+# (full, --quick)
+N_LATENCY = (500, 50)
+N_WATCHES = (1_000, 100)
+N_ROUNDS = (10, 3)
+
+
+class _Config(object):
+    mail_transfer_agent = "SMTP"
+
+    def __init__(self, smtp_cfg):
+        self.smtp_cfg = smtp_cfg
+
+    def get(self):
+        return self.smtp_cfg
+
+
+def percentile(values, q):
+    """nearest-rank ``q`` percentile (0..100) of ``values``"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))  # ceiling
+    return ordered[int(rank) - 1]
+
+
+def _wait_for_messages(sink, count, timeout=60):
+    t0 = time.perf_counter()
+    while len(sink.accepted) < count:
+        if time.perf_counter() - t0 > timeout:
+            raise TimeoutError(f"{len(sink.accepted)} of {count} messages arrived")
+        time.sleep(0.00005)
+
+
+def _engine(ioc, sink, n_watches):
+    engine = WatchEngine(_Config(sink.config()), watch_class=ioc.watch_class())
+    for i in range(n_watches):
+        engine.add(f"sim:{i}:trigger", f"sim:{i}:message", "ops@example.org")
+    engine.start()
+    return engine
+
+
+def measure_latency(n_triggers):
+    """return list of trigger-to-accept latencies (s), one trigger at a time"""
+    ioc, sink = SimulatedIOC(), SMTPSink()
+    sink.start()
+    engine = _engine(ioc, sink, 1)
+    latencies = []
+    try:
+        for i in range(n_triggers):
+            t0 = time.perf_counter()
+            ioc.put("sim:0:trigger", 1)
+            _wait_for_messages(sink, i + 1)
+            latencies.append(sink.accepted[i] - t0)
+            ioc.put("sim:0:trigger", 0)
+    finally:
+        engine.stop()
+        sink.stop()
+        mailer.smtp_pool.close()
+    return latencies
+
+
+def measure_throughput(n_watches, rounds, in_flight=dispatch.SEND_QUEUE_SIZE // 8):
+    """
+    return sustained triggers/s with every watch triggering ``rounds`` times
+
+    No more than ``in_flight`` triggers wait to be sent at any time,
+    so the send queues never overflow (and drop a message).
+    """
+    ioc, sink = SimulatedIOC(), SMTPSink()
+    sink.start()
+    engine = _engine(ioc, sink, n_watches)
+    try:
+        t0 = time.perf_counter()
+        posted = 0
+        for _ in range(rounds):
+            for i in range(n_watches):
+                _wait_for_messages(sink, posted - in_flight)
+                ioc.put(f"sim:{i}:trigger", 1)
+                ioc.put(f"sim:{i}:trigger", 0)
+                posted += 1
+        _wait_for_messages(sink, posted)
+        elapsed = time.perf_counter() - t0
+    finally:
+        engine.stop()
+        sink.stop()
+        mailer.smtp_pool.close()
+    return n_watches * rounds / elapsed
+
+
+def measure_import(repeat=3):
+    """return the time (s) to ``import PvMail.cli``, less interpreter startup"""
+
+    def best(code):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    return max(0.0, best("import PvMail.cli") - best("pass"))
+
+
+def run_suite(quick=False):
+    """run all benchmarks, return the results as a dictionary"""
+    size = 1 if quick else 0
+    latencies = measure_latency(N_LATENCY[size])
+    memory = watches_benchmark.measure(N_WATCHES[size], idle_duration=0.1)
+    metrics = {
+        "latency_p50_ms": 1e3 * percentile(latencies, 50),
+        "latency_p90_ms": 1e3 * percentile(latencies, 90),
+        "latency_p99_ms": 1e3 * percentile(latencies, 99),
+        "latency_max_ms": 1e3 * max(latencies),
+        "triggers_per_s": measure_throughput(N_WATCHES[size], N_ROUNDS[size]),
+        "bytes_per_watch": memory["bytes_per_watch"],
+        "startup_s": memory["startup_s"],
+        "import_s": measure_import(),
+    }
+    return dict(
+        schema=SCHEMA,
+        version=__version__,
+        date=datetime.datetime.now().isoformat(timespec="seconds"),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        quick=quick,
+        sizes=dict(
+            triggers=N_LATENCY[size], watches=N_WATCHES[size], rounds=N_ROUNDS[size]
+        ),
+        metrics=metrics,
+    )
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    return list of (metric, baseline, result, change) for each regression
+
+    ``change`` is the relative change, positive when worse.
+    Metrics missing from either side are not compared.
+    """
+    regressions = []
+    for name, (_unit, better) in METRICS.items():
+        old = baseline["metrics"].get(name)
+        new = results["metrics"].get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if better == "higher":
+            change = -change
+        if change > tolerance:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument("-o", dest="output", help="write results to this JSON file")
+    parser.add_argument(
+        "--compare", dest="baseline", help="baseline JSON file from an earlier run"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="allowed relative change before a metric is a regression",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="smaller sizes, for a fast check"
+    )
+    args = parser.parse_args()
+
+    results = run_suite(args.quick)
+    if args.output is not None:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+            fp.write("\n")
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+
+    print(
+        f"{'metric':>16}  {'unit':>4}  {'result':>12}  {'baseline':>12}  {'change':>7}"
+    )
+    for name, (unit, _better) in METRICS.items():
+        value = results["metrics"][name]
+        line = f"{name:>16}  {unit:>4}  {value:>12.3f}"
+        old = None if baseline is None else baseline["metrics"].get(name)
+        if old:
+            line += f"  {old:>12.3f}  {100 * (value - old) / old:>+6.1f}%"
+        print(line)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new, change in regressions:
+            print(
+                f"REGRESSION: {name} {old:.3f} -> {new:.3f}"
+                f" ({100 * change:.0f}% worse)"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
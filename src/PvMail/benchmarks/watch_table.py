@@ -0,0 +1,123 @@
+"""
+Time to sort, filter and update the watch table GUI model, against a budget.
+
+A :class:`~PvMail.watch_model.WatchTableModel` of ``-n`` watches (not
+connected, no IOC needed) is shown through a
+:class:`~PvMail.watch_model.WatchFilterProxyModel`, as in
+``pvMail --watches watches.toml -g``.  Each operation is timed (best of
+``--repeat`` runs), no window is shown.  The exit status is 1 if any
+operation takes longer than the budget.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.watch_table -n 10000
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import os
+import sys
+import time
+
+from ..watches import WatchEngine
+
+N_WATCHES = 10_000
+N_CHANGED = 1_000
+REPEAT = 3
+BUDGET_MS = 100.0  # longer is not smooth
+
+
+def make_engine(n_watches):
+    """return a WatchEngine with ``n_watches`` watches (not started)"""
+    engine = WatchEngine(workers=1)
+    for i in range(n_watches):
+        engine.add(
+            f"ioc{i % 97}:trigger:{i}",
+            f"ioc{i % 97}:message:{i}",
+            f"user{i % 13}@example.org",
+            label=f"watch {n_watches - i:05d}",
+        )
+        engine.watches[-1].emails_sent = (7 * i) % 101
+    return engine
+
+
+def _best(operation, repeat):
+    """return the best time (s) of ``repeat`` calls of ``operation()``"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        operation()
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+
+def measure(n_watches=N_WATCHES, n_changed=N_CHANGED, repeat=REPEAT):
+    """return {operation: time (s)}"""
+    from PyQt5 import QtCore
+
+    from ..watch_model import COLUMNS
+    from ..watch_model import WatchFilterProxyModel
+    from ..watch_model import WatchTableModel
+
+    engine = make_engine(n_watches)
+    results = {}
+    t0 = time.perf_counter()
+    model = WatchTableModel(engine)
+    proxy = WatchFilterProxyModel()
+    proxy.setSourceModel(model)
+    results["create model"] = time.perf_counter() - t0
+
+    def sort(column):
+        for order in (QtCore.Qt.DescendingOrder, QtCore.Qt.AscendingOrder):
+            proxy.sort(column, order)
+            proxy.rowCount()  # as the view does, the proxy maps the rows again
+
+    def set_filter(text):
+        proxy.setFilterText(text)
+        proxy.rowCount()
+
+    for column, (header, _value) in enumerate(COLUMNS):
+        results[f"sort by {header} (both ways)"] = _best(lambda: sort(column), repeat)
+    results["filter"] = _best(lambda: set_filter("ioc42:"), repeat)
+    results["clear filter"] = _best(lambda: set_filter(""), repeat)
+
+    step = max(1, n_watches // n_changed)
+
+    def update():
+        for watch in engine.watches[::step]:
+            model.mark_changed(watch)
+        model.flush()
+
+    results[f"update {min(n_changed, n_watches)} rows"] = _best(update, repeat)
+    model.timer.stop()
+    engine.pool.shutdown()
+    return results
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument("-n", type=int, default=N_WATCHES, help="number of watches")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs, best used")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])  # noqa
+    over = []
+    for operation, seconds in measure(args.n, repeat=args.repeat).items():
+        status = "ok" if 1e3 * seconds <= BUDGET_MS else "OVER BUDGET"
+        print(f"{1e3 * seconds:10.2f} ms  {operation}  ({args.n} watches)  {status}")
+        if status != "ok":
+            over.append(operation)
+
+    if over:
+        print(f"over budget ({BUDGET_MS} ms): " + ", ".join(over))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Memory per watch and idle CPU of the multi-watch engine.
+
+Watches are connected to a :class:`~PvMail.benchmarks.simulator.SimulatedIOC`
+so no IOC is needed.  Memory is counted with :mod:`tracemalloc` while the
+watches are created and started.  Idle CPU is the process CPU time used
+while the engine waits for triggers.
+
+Run with::
+
+    $ python -m PvMail.benchmarks.watches
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import argparse
+import threading
+import time
+import tracemalloc
+
+from ..watches import WatchEngine
+from .simulator import SimulatedIOC
+
+WATCH_COUNTS = (10, 1_000, 10_000)
+IDLE_DURATION_S = 2.0
+
+
+def measure(n_watches, idle_duration=IDLE_DURATION_S):
+    """
+    return dict with memory per watch (bytes) and idle CPU (%)
+
+    :param int n_watches: number of simulated watches
+    :param float idle_duration: time (s) to watch the idle engine
+    """
+    ioc = SimulatedIOC()
+    engine = WatchEngine(watch_class=ioc.watch_class())
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    for i in range(n_watches):
+        engine.add(f"sim:{i}:trigger", f"sim:{i}:message", "ops@example.org")
+    engine.start()
+    startup = time.perf_counter() - t0
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    runner = threading.Thread(target=engine.run, args=(60,), daemon=True)
+    runner.start()
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    time.sleep(idle_duration)
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+    engine.stop()
+    runner.join()
+
+    return dict(
+        watches=n_watches,
+        bytes_per_watch=(after - before) / n_watches,
+        startup_s=startup,
+        idle_cpu_percent=100 * cpu / wall,
+    )
+
+
+def main():
+    doc = __doc__.strip().splitlines()[0]
+    parser = argparse.ArgumentParser(description=doc)
+    parser.add_argument(
+        "-n",
+        dest="counts",
+        type=int,
+        nargs="+",
+        default=WATCH_COUNTS,
+        help="number(s) of watches",
+    )
+    parser.add_argument(
+        "-t",
+        dest="idle_duration",
+        type=float,
+        default=IDLE_DURATION_S,
+        help="idle measurement time (s)",
+    )
+    results = parser.parse_args()
+
+    print(
+        f"{'watches':>8}  {'bytes/watch':>12}  {'startup (s)':>12}  {'idle CPU %':>10}"
+    )
+    for n in results.counts:
+        r = measure(n, results.idle_duration)
+        print(
+            f"{r['watches']:>8}  {r['bytes_per_watch']:>12.0f}"
+            f"  {r['startup_s']:>12.3f}  {r['idle_cpu_percent']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
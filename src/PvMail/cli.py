@@ -3,20 +3,23 @@
 # Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
 
 import argparse
-import datetime
+import functools
 import logging
 import os
+import queue
 import socket
 import sys
 import threading
 import time
 
-import epics
-
 from . import PROJECT
-from . import __version__ as VERSION
+from . import connections
+from . import dispatch
 from . import ini_config
-from . import mailer
+from . import logs
+from . import metrics
+from . import template as message_template
+from .trigger import TriggerEvent
 
 LOG_FILE = f"pvMail-{os.getpid()}.log"
 RETRY_INTERVAL_S = 0.2
@@ -24,14 +27,34 @@ CHECKPOINT_INTERVAL_S = 5 * 60.0
 CONNECTION_TEST_TIMEOUT = 0.5
 
 gui_object = None
+outbox = None  # spool.Spool, if messages are spooled before sending
 
 
 class PvMail(threading.Thread):
     """
     Watches an EPICS PV and sends email when value changes from 0 to 1.
+
+    :param obj config: email configuration from ini_config.Config()
+    :param obj events: optional :class:`queue.Queue`, if given, triggers
+        are put on this queue (for the caller to send) instead of being
+        sent by the send pool
+    :param obj pool: optional :class:`~PvMail.dispatch.SendPool` shared
+        with other PvMail objects, otherwise a pool is created by
+        :meth:`do_start` and shut down by :meth:`do_stop`
+    :param obj policy: optional :class:`~PvMail.policy.SendPolicy` to
+        suppress triggers from a flapping trigger PV
+
+    Set :attr:`template` to a :class:`~PvMail.template.MessageTemplate`
+    to change the subject and body of the email.  Set :attr:`history` to
+    a :class:`~PvMail.history.ContextHistory` to report the values of
+    context PVs before the trigger.  Set :attr:`condition` to a
+    :class:`~PvMail.condition.Condition` to trigger on a condition of the
+    trigger PV (and other PVs) instead of a change from 0 to 1.  Its
+    input PVs are monitored by this object, or by :attr:`input_index`
+    (a :class:`~PvMail.rules.RuleIndex` shared with other objects) if set.
     """
 
-    def __init__(self, config=None):
+    def __init__(self, config=None, events=None, pool=None, policy=None):
         self.trigger = False
         self.message = "default message"
         self.subject = "pvMail.py"
@@ -41,6 +64,16 @@ class PvMail(threading.Thread):
         self.old_value = None
         self.ca_timestamp = None
         self.config = config
+        self.events = events
+        self.pool = pool
+        self.policy = policy
+        self.template = None  # message_template.DEFAULT
+        self.history = None  # no context PVs
+        self.condition = None  # trigger on a change from 0 to 1
+        self.input_index = None  # input PVs monitored here
+        self.emails_sent = 0
+        self.last_trigger = None  # time of the latest trigger sent
+        self._own_pool = False
         self.running = False
         self.pv = dict(trigger=None, message=None)
         self.pv_cb_index = dict(trigger=None, message=None)
@@ -58,12 +91,16 @@ class PvMail(threading.Thread):
         for key, pv in parts.items():
             if len(pv) == 0:
                 raise RuntimeWarning(f"no EPICS PV name for PV {key!r}")
-            if self.pv[key] is None:
-                if self.testConnect(pv, timeout=CONNECTION_TEST_TIMEOUT) is False:
-                    raise RuntimeWarning(f"could not connect to {key} PV: {pv}")
-            else:
-                if not self.pv[key].connected:
-                    raise RuntimeWarning(f"could not connect to {key} PV: {pv}")
+        bulk = connections.BulkConnection()
+        bulk.add(self.make_pvs())
+        try:
+            if bulk.wait(CONNECTION_TEST_TIMEOUT):  # both PVs at the same time
+                for key, pv in parts.items():
+                    if not self.pv[key].connected:
+                        raise RuntimeWarning(f"could not connect to {key} PV: {pv}")
+        except BaseException:
+            self.disconnect_pvs()  # not started, do_stop() would not
+            raise
 
     def testConnect(self, pvname, timeout=5.0):
         """
@@ -71,19 +108,39 @@ class PvMail(threading.Thread):
         wait for connection,
         return connection state (True | False)
 
-        adapted from PyEpics __createPV() method
+        The PV is disconnected after the test.
+        """
+        logger("test connect with %s", pvname)
+        bulk = connections.BulkConnection()
+        thispv = self.make_pv(pvname)
+        bulk.add([thispv])
+        connected = len(bulk.wait(timeout)) == 0
+        thispv.disconnect()
+        return connected
+
+    def make_pv(self, pvname):
+        """create the PV object (channel) for ``pvname``"""
+        import epics
+
+        return epics.PV(pvname)
+
+    def make_pvs(self):
+        """
+        create the message and trigger PVs (if not created yet), return them
+
+        Does not wait for the connections, see :mod:`PvMail.connections`.
         """
-        logger("test connect with %s" % pvname)
-        retry_interval_s = 0.0001
-        start_time = time.time()
-        thispv = epics.PV(pvname)
-        thispv.connect()
-        while not thispv.connected:
-            time.sleep(retry_interval_s)
-            epics.ca.poll()
-            if time.time() - start_time > timeout:
-                break
-        return thispv.connected
+        parts = {"message": self.messagePV, "trigger": self.triggerPV}
+        if self.condition is not None and self.input_index is None:
+            for name, pvname in self.condition.inputs.items():
+                parts[f"input:{name}"] = pvname
+        for key, pvname in parts.items():
+            if self.pv.get(key) is None and len(pvname) > 0:
+                self.pv[key] = self.make_pv(pvname)
+        pvs = [pv for pv in self.pv.values() if pv is not None]
+        if self.history is not None:
+            pvs += self.history.make_pvs(self.make_pv)
+        return pvs
 
     def do_start(self):
         """start watching for triggers"""
@@ -96,30 +153,68 @@ class PvMail(threading.Thread):
                 ["message", self.messagePV, self.receiveMessageMonitor],
                 ["trigger", self.triggerPV, self.receiveTriggerMonitor],
             ]
+            if self.condition is not None and self.input_index is None:
+                for index, name in enumerate(self.condition.inputs, start=1):
+                    cb = functools.partial(self.receiveInputMonitor, index)
+                    handler_list.append([f"input:{name}", None, cb])
             for key, pvname, cb in handler_list:
-                pv = epics.PV(pvname)
-                self.pv[key] = pv
+                pv = self.pv[key]  # connected by basicChecks()
                 self.pv_cb_index[key] = pv.add_callback(cb)
+            if self.history is not None:
+                self.history.start()
+                logger(self.history.summary())
+
+            if self.events is None and self.pool is None:
+                self.pool = dispatch.SendPool(logger=logger, overflow=spool_overflow())
+                self._own_pool = True
 
             self.old_value = self.pv["trigger"].get()
             self.message = self.pv["message"].get()
+            if self.condition is not None:
+                self.condition.reset(*zip(*self.condition_values()))
 
             logger("PVs connected")
             self.running = True
 
+    def condition_values(self):
+        """return [(value, severity)] of the PVs of the condition, now"""
+        pv = self.pv["trigger"]
+        values = [(pv.get(), getattr(pv, "severity", None))]
+        for name, pvname in self.condition.inputs.items():
+            if self.input_index is not None:
+                values.append(self.input_index.get(pvname))
+                continue
+            pv = self.pv[f"input:{name}"]
+            if pv.connected:
+                values.append((pv.get(), getattr(pv, "severity", None)))
+            else:
+                values.append((None, None))
+        return values
+
     def do_stop(self):
         """stop watching for triggers"""
         logger("do_stop")
         if self.running:
-            for key, pv in self.pv.items():
-                if pv is not None and pv.connected:
-                    pv.remove_callback(self.pv_cb_index[key])
-                    pv.disconnect()
-                    self.pv[key] = None
-                    self.pv_cb_index[key] = None
+            self.disconnect_pvs()
             logger("PVs disconnected")
+            if self._own_pool:
+                # queued messages are still sent
+                self.pool.shutdown(wait=False)
+                self.pool = None
+                self._own_pool = False
             self.running = False
 
+    def disconnect_pvs(self):
+        """remove the monitors, disconnect and forget the PVs"""
+        for key, pv in self.pv.items():
+            if pv is not None:
+                pv.remove_callback(self.pv_cb_index.get(key))
+                pv.disconnect()
+                self.pv[key] = None
+                self.pv_cb_index[key] = None
+        if self.history is not None:
+            self.history.stop()
+
     def do_restart(self):
         """restart watching for triggers"""
         self.do_stop()
@@ -127,47 +222,151 @@ class PvMail(threading.Thread):
 
     def receiveMessageMonitor(self, value, **kw):
         """respond to EPICS CA monitors on message PV"""
-        logger("%s = %s" % (self.messagePV, value))
+        metrics.message_monitors.inc()
+        logger("%s = %s", self.messagePV, value)
         self.message = value
 
     def receiveTriggerMonitor(self, value, **kw):
         """respond to EPICS CA monitors on trigger PV"""
-        logger("%s = %s" % (self.triggerPV, value))
+        metrics.trigger_monitors.inc()
+        logger("%s = %s", self.triggerPV, value)
         # print self.old_value, type(self.old_value), value, type(value)
-        if self.old_value == 0 and value == 1:
-            self.trigger = True  # set email trigger flag
-            pv = self.pv["trigger"]
-            # print pv.pvname, value,pv.timestamp
-            self.ca_timestamp = pv.timestamp
-
-            # send the message in a different thread
-            # SendMessage(self, self.config)
-            t = threading.Thread(target=SendMessage, args=(self, self.config))
-            t.start()
+        condition = self.condition
+        if condition is None:
+            triggered = self.old_value == 0 and value == 1
+        else:
+            triggered = condition.update(0, value, kw.get("severity"), kw.get("status"))
+        if triggered:
+            self.triggered(value, **kw)
         self.old_value = value
 
+    def receiveInputMonitor(self, index, value=None, **kw):
+        """respond to EPICS CA monitors on input PV ``index`` of the condition"""
+        metrics.input_monitors.inc()
+        logger("%s = %s", kw.get("pvname"), value)
+        condition = self.condition
+        if condition.update(index, value, kw.get("severity"), kw.get("status")):
+            self.condition_fired(**kw)
 
-def SendMessage(pvm, agent_db, reporter=None):
+    def condition_fired(self, **kw):
+        """an input PV made the condition true"""
+        if self.running:
+            self.triggered(self.condition.values[0], **kw)
+
+    def triggered(self, value, **kw):
+        """the trigger fired: snapshot, apply the policy, send the email"""
+        self.trigger = True  # set email trigger flag
+        metrics.triggers.inc()
+        if "timestamp" in kw:
+            self.ca_timestamp = kw["timestamp"]
+        else:
+            self.ca_timestamp = self.pv["trigger"].timestamp
+        event = self.snapshot(value)
+        if self.policy is not None:
+            event = self.policy.apply(event)
+        if event is None:
+            self.trigger = False
+            logger("%s trigger suppressed", self.triggerPV)
+        else:
+            self.last_trigger = event.time
+            self.dispatch(event)
+            self.status_changed()
+
+    def snapshot(self, value=None):
+        """
+        capture the current state as an immutable :class:`~PvMail.trigger.TriggerEvent`
+
+        Uses only the values kept current by the monitors, no CA I/O.
+        """
+        pv = self.pv["message"]
+        now = time.time()
+        history = None
+        if self.history is not None:
+            history = self.history.snapshot(self.ca_timestamp or now)
+        return TriggerEvent(
+            triggerPV=self.triggerPV,
+            value=value,
+            old_value=self.old_value,
+            ca_timestamp=self.ca_timestamp,
+            messagePV=self.messagePV,
+            message=self.message,
+            connected=pv is not None and pv.connected,
+            recipients=tuple(self.recipients),
+            time=now,
+            history=history,
+        )
+
+    def status_changed(self):
+        """called (from any thread) when ``last_trigger`` or ``emails_sent`` change"""
+
+    def dispatch(self, event):
+        """send the message (from the send pool) or queue the trigger"""
+        if self.events is not None:
+            self.events.put((self, event))
+        else:
+            self.pool.submit(self.triggerPV, SendMessage, self, self.config, event)
+
+
+def SendMessage(pvm, agent_db, event=None):
     """
     construct and send the message
 
     :param obj pvm: instance of PvMail object on which to report
+    :param obj agent_db: email configuration from ini_config.Config()
+    :param obj event: :class:`~PvMail.trigger.TriggerEvent` to report,
+        if *None*, use a snapshot of ``pvm`` now
     """
 
     # print "SendMessage", type(pvm), pvm
     logger("SendMessage")
     pvm.trigger = False  # triggered event received
+    if event is None:
+        event = pvm.snapshot()
+
+    agent_db = ini_config.snapshot(agent_db)  # same settings for all of this email
+    emailer = get_emailer(agent_db)
 
-    agent_db = agent_db or ini_config.Config()
+    try:
+        _send(emailer, event, agent_db, logger=logger, template=pvm.template)
+    except Exception as exc:
+        metrics.emails_failed.inc()
+        logger(f"problem sending email: {exc}")
+    else:
+        metrics.emails_sent.inc()
+        metrics.send_latency.observe(time.time() - event.time)
+        pvm.emails_sent += 1
+        pvm.status_changed()
+
+
+def get_emailer(agent_db):
+    """
+    return the mailer function for the configured mail transfer agent
+
+    If messages are spooled, return the function that writes to the spool.
+    """
+    from . import mailer
+
+    if outbox is not None:
+        return outbox.emailer
     email_agent_dict = dict(
         sendmail=mailer.sendMail_sendmail, SMTP=mailer.sendMail_SMTP
     )
-    emailer = email_agent_dict[agent_db.mail_transfer_agent]
+    return email_agent_dict[agent_db.mail_transfer_agent]
 
-    try:
-        _send(emailer, pvm, agent_db, logger=logger)
-    except Exception as exc:
-        logger("problem sending email: %s", exc)
+
+def _run_now(func, *args):
+    func(*args)
+
+
+def spool_overflow():
+    """
+    return the send pool *overflow* function, *None* if messages are not spooled
+
+    When messages are spooled, a job that does not fit in the send queue
+    is run at once: its email is only written to the spool, then sent by
+    the spool's delivery thread.
+    """
+    return None if outbox is None else _run_now
 
 
 def getUserName(db):
@@ -177,50 +376,40 @@ def getUserName(db):
     return u1 or u2 or u3
 
 
-def _send(emailer, pvm, agent_db, reporter=None, logger=None):
-    pvm.basicChecks()
+def render_message(event, agent_db, template=None):
+    """
+    return (subject, message) of the email for ``event``
 
-    pvm.subject = "pvMail.py: " + pvm.triggerPV
+    :param obj template: :class:`~PvMail.template.MessageTemplate`,
+        if *None*, the default subject and message
+    """
+    return (template or message_template.DEFAULT).render(event, getUserName(agent_db))
 
-    msg = ""  # start with a new message
-    msg += "\n\n"
-    msg += epics.caget(pvm.messagePV)
-    msg += "\n\n"
-    username = getUserName(agent_db)
-    msg += "user: %s\n" % username
-    msg += "host: %s\n" % socket.gethostname()
-    msg += "date: %s (UNIX, not PV)\n" % datetime.datetime.now()
-    if hasattr(pvm, "ca_timestamp"):
-        msg += "CA_timestamp: %d\n" % pvm.ca_timestamp
-    else:
-        msg += "CA_timestamp: not available\n"
-    msg += "program: %s\n" % sys.argv[0]
-    msg += "PID: %d\n" % os.getpid()
-    msg += "trigger PV: %s\n" % pvm.triggerPV
-    msg += "message PV: %s\n" % pvm.messagePV
-    msg += "recipients: %s\n" % ", ".join(pvm.recipients)
-    pvm.message = msg
+
+def _send(emailer, event, agent_db, reporter=None, logger=None, template=None):
+    subject, msg = render_message(event, agent_db, template)
 
     if logger is not None:
         logger("#" * 60)
-        logger(pvm.message)
+        logger(msg)
         logger("#" * 60)
 
-    emailer(pvm.subject, msg, pvm.recipients, agent_db.get(), logger=logger)
-    logger("message(s) sent")
+    emailer(subject, msg, list(event.recipients), agent_db.get(), logger=logger)
+    if logger is not None:
+        logger("message(s) sent")
 
 
-def logger(message):
+def logger(message, *args):
     """
     log a message or report from PvMail
 
-    :param str message: words to be logged
+    Returns at once, the log file is written by a background thread
+    (see :mod:`PvMail.logs`).
+
+    :param str message: words to be logged, a ``%`` format if ``args`` are given
+    :param args: values for the format, only formatted if the message is written
     """
-    now = datetime.datetime.now()
-    name = os.path.basename(sys.argv[0])
-    pid = os.getpid()
-    text = "(%d,%s,%s) %s" % (pid, name, now, message)
-    logging.info(text)
+    logs.info(message, *args)
 
 
 def cli(results, config=None):
@@ -231,23 +420,82 @@ def cli(results, config=None):
     :param obj config: email configuration from ini_config.Config()
     """
     logging_interval = min(60 * 60, max(5.0, results.logging_interval))
-    sleep_duration = min(5.0, max(0.0001, results.sleep_duration))
 
-    pvm = PvMail(config)
+    events = queue.Queue()
+    pvm = PvMail(config, events=events)
     pvm.triggerPV = results.trigger_PV
     pvm.messagePV = results.message_PV
     pvm.recipients = results.email_addresses.strip().split(",")
-    checkpoint_time = time.time()
+    pvm.condition = command_line_condition(results)
     pvm.do_start()
-    while True:  # endless loop, kill with ^C or equal
-        if time.time() > checkpoint_time:
+    metrics.queue_depth.set_function(events.qsize)
+    metrics.pvs_connected.set_function(lambda: connected_pvs([pvm]))
+    event_loop(events, logging_interval, config)  # endless, kill with ^C or equal
+    # pvm.do_stop()        # this will never be called
+
+
+def command_line_condition(results):
+    """the :class:`~PvMail.condition.Condition` given with ``--condition``, or *None*"""
+    if results.condition is None:
+        return None
+    from . import condition
+
+    return condition.Condition(results.condition)
+
+
+def connected_pvs(pvms):
+    """number of connected PVs of the PvMail objects ``pvms``"""
+    return sum(
+        1 for pvm in pvms for pv in pvm.pv.values() if pv is not None and pv.connected
+    )
+
+
+def event_loop(events, logging_interval, config=None):
+    """
+    send a message for each trigger put on the ``events`` queue
+
+    Blocks on the queue so each trigger is sent once, as soon as it
+    arrives.  Otherwise, only wakes up to write a checkpoint to the log.
+    Returns when ``None`` is put on the queue.
+
+    :param obj events: :class:`queue.Queue` of (PvMail, TriggerEvent) pairs
+    :param float logging_interval: checkpoint reporting interval (s)
+    :param obj config: email configuration from ini_config.Config()
+    """
+    logger("checkpoint")
+    checkpoint_time = time.time() + logging_interval
+    while True:
+        try:
+            item = events.get(timeout=max(0, checkpoint_time - time.time()))
+        except queue.Empty:
             checkpoint_time += logging_interval
             logger("checkpoint")
-        if pvm.trigger:
-            SendMessage(pvm, config)
-            logger("trigger received, sending email")
-        time.sleep(sleep_duration)
-    # pvm.do_stop()        # this will never be called
+            continue
+        if item is None:
+            break
+        pvm, event = item
+        logger("trigger received, sending email")
+        SendMessage(pvm, config, event)
+
+
+def watch_table(results, config=None):
+    """
+    command-line interface to watch many PV pairs from a watch table
+
+    :param obj results: default parameters from argparse, see main()
+    :param obj config: email configuration from ini_config.Config()
+    """
+    from . import watches
+
+    logging_interval = min(60 * 60, max(5.0, results.logging_interval))
+
+    engine = watches.WatchEngine(config)
+    engine.load(results.watches_file)
+    engine.start()
+    try:
+        engine.run(logging_interval)
+    finally:
+        engine.stop()
 
 
 def gui(results, config=None):
@@ -270,8 +518,83 @@ def gui(results, config=None):
     )
 
 
+def watches_gui(results, config=None):
+    """
+    graphical user interface to the watches of a watch table
+
+    :param obj results: default parameters from argparse, see main()
+    :param obj config: email configuration from ini_config.Config()
+    """
+    from . import uic_gui
+    from . import watches
+
+    engine = watches.WatchEngine(config)
+    engine.load(results.watches_file)
+    uic_gui.watches_main(engine, logfile=results.log_file)
+
+
+def async_engine(results, config=None):
+    """
+    command-line interface to the asyncio engine (see :mod:`PvMail.aio`)
+
+    :param obj results: default parameters from argparse, see main()
+    :param obj config: email configuration from ini_config.Config()
+    """
+    import asyncio
+
+    from . import aio
+
+    logging_interval = min(60 * 60, max(5.0, results.logging_interval))
+
+    engine = aio.AsyncWatchEngine(config)
+    if results.watches_file is not None:
+        logger("watch table      = " + results.watches_file)
+        engine.load(results.watches_file)
+    else:
+        engine.add(
+            results.trigger_PV,
+            results.message_PV,
+            results.email_addresses,
+            condition=command_line_condition(results),
+        )
+    asyncio.run(engine.run(logging_interval))  # endless, kill with ^C or equal
+
+
+def replay(results, config=None):
+    """
+    replay recorded monitor updates, report what would have been sent
+
+    :param obj results: default parameters from argparse, see main()
+    :param obj config: email configuration from ini_config.Config()
+    """
+    from . import replay
+
+    engine = replay.ReplayEngine(config)
+    if results.watches_file is not None:
+        engine.load(results.watches_file)
+    else:
+        engine.add(
+            results.trigger_PV,
+            results.message_PV,
+            results.email_addresses,
+            condition=command_line_condition(results),
+        )
+    logger("replay files     = " + ", ".join(results.replay_files))
+    samples = replay.read_samples(results.replay_files)
+
+    logging.disable(logging.INFO)  # not each replayed update
+    try:
+        report = engine.replay(samples)
+    finally:
+        logging.disable(logging.NOTSET)
+    logger(f"replay: {report}")
+    replay.print_report(report, engine)
+
+
 def main():
     """parse command-line arguments and choose which interface to use"""
+    from . import __version__ as VERSION
+
     doc = f"{PROJECT}, v{VERSION}, {__doc__.strip()}"
     parser = argparse.ArgumentParser(description=doc)
 
@@ -310,6 +633,41 @@ def main():
         default=LOG_FILE,
     )
 
+    parser.add_argument(
+        "--log-rotate",
+        action="store",
+        dest="log_rotate",
+        metavar="SIZE_OR_WHEN",
+        help="rotate the log file at a size (such as 10MB) or time (such as midnight)",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--log-backups",
+        action="store",
+        dest="log_backups",
+        type=int,
+        help="number of rotated log files to keep",
+        default=logs.BACKUP_COUNT,
+    )
+
+    parser.add_argument(
+        "--log-compress",
+        action="store_true",
+        dest="log_compress",
+        help="compress rotated log files (gzip)",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--log-format",
+        action="store",
+        dest="log_format",
+        choices=("text", "json"),
+        help="log file lines: text or JSON objects",
+        default="text",
+    )
+
     parser.add_argument(
         "-i",
         action="store",
@@ -324,7 +682,7 @@ def main():
         action="store",
         dest="sleep_duration",
         type=float,
-        help="sleep duration (s) in main event loop",
+        help="(no longer used) sleep duration (s) in main event loop",
         default=RETRY_INTERVAL_S,
     )
 
@@ -337,24 +695,92 @@ def main():
         help="Use the graphical rather than command-line interface",
     )
 
+    parser.add_argument(
+        "--spool",
+        action="store",
+        dest="spool_dir",
+        help="spool directory, messages are saved here until sent",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--watches",
+        action="store",
+        dest="watches_file",
+        help="watch table (TOML) of trigger/message PV pairs to watch",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--condition",
+        action="store",
+        dest="condition",
+        metavar="EXPR",
+        help="trigger when EXPR becomes true, such as 'value > 5' (default: 0 to 1)",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        action="store",
+        dest="metrics_port",
+        type=int,
+        help="serve metrics (Prometheus text format) on this local port",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--replay",
+        action="store",
+        dest="replay_files",
+        nargs="+",
+        metavar="FILE",
+        help="replay recorded monitor updates (camonitor or CSV), send nothing",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--engine",
+        action="store",
+        dest="engine",
+        choices=("threads", "asyncio"),
+        help="threads: PyEpics and a send pool, asyncio: caproto and asyncio SMTP",
+        default="threads",
+    )
+
     parser.add_argument("-v", "--version", action="version", version=VERSION)
 
     results = parser.parse_args()
+    if results.condition is not None:
+        from . import condition
+
+        try:
+            condition.compile_condition(results.condition)
+        except condition.ConditionError as exc:
+            parser.error(str(exc))
 
     addresses = results.email_addresses.strip().split(",")
     interface = {False: "command-line", True: "GUI"}[results.interface]
 
-    agent_db = ini_config.Config()
+    agent_db = ini_config.cached()
 
     results.log_file = results.log_file.strip()
 
-    logging.basicConfig(filename=results.log_file, level=logging.INFO)
+    logs.setup(
+        results.log_file,
+        rotate=results.log_rotate,
+        backups=results.log_backups,
+        compress=results.log_compress,
+        json_lines=results.log_format == "json",
+    )
     logger("#" * 60)
     logger("startup")
     logger("trigger PV       = " + results.trigger_PV)
     logger("message PV       = " + results.message_PV)
     logger("email list       = " + str(addresses))
-    logger("log file         = {results.log_file}")
+    if results.condition is not None:
+        logger("condition        = " + results.condition)
+    logger("log file         = %s", results.log_file)
     logger("logging interval = " + str(results.logging_interval))
     logger("sleep duration   = " + str(results.sleep_duration))
     logger("interface        = " + interface)
@@ -363,9 +789,55 @@ def main():
     logger("host             = " + socket.gethostname())
     logger("program          = " + sys.argv[0])
     logger("PID              = " + str(os.getpid()))
-    logger("PyEpics version  = " + str(epics.__version__))
     logger("config file      = " + agent_db.ini_file)
 
+    pv_pair_missing = results.watches_file is None and "" in (
+        results.trigger_PV,
+        results.message_PV,
+        results.email_addresses.strip(),
+    )
+
+    if results.replay_files is not None:
+        if pv_pair_missing:
+            parser.print_usage()
+            sys.exit()
+        if results.spool_dir is not None or results.metrics_port is not None:
+            logger("--spool and --metrics-port are not used by --replay")
+        replay(results, agent_db)  # sends nothing, not even the spooled messages
+        return
+
+    if results.spool_dir is not None:
+        from . import spool
+
+        global outbox
+        outbox = spool.Spool(results.spool_dir, logger=logger)
+        logger("spool directory  = " + outbox.directory)
+        logger("spooled messages = " + str(len(outbox)))
+        outbox.start(agent_db)
+
+    if results.metrics_port is not None:
+        metrics.serve(results.metrics_port)
+        logger(f"metrics          = http://127.0.0.1:{results.metrics_port}/metrics")
+
+    if results.engine == "asyncio":
+        if results.interface:
+            parser.error("--engine asyncio does not support the GUI")
+        if pv_pair_missing:
+            parser.print_usage()
+            sys.exit()
+        logger("engine           = asyncio")
+        async_engine(results, agent_db)
+        return
+
+    import epics  # not needed (nor loaded) by --replay or --engine asyncio
+
+    logger("PyEpics version  = " + str(epics.__version__))
+
+    if results.watches_file is not None:
+        logger("watch table      = " + results.watches_file)
+        {False: watch_table, True: watches_gui}[results.interface](results, agent_db)
+        return
+
     if results.interface is False:
         # When the GUI is not selected,
         # ensure the positional arguments are given
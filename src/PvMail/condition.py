@@ -0,0 +1,343 @@
+"""
+When a watch triggers: a condition on its trigger PV and other PVs.
+
+By default, a watch triggers when its trigger PV changes from 0 to 1.
+A *condition* is an expression (in Python syntax) of the trigger PV,
+named ``value``, and of other *input* PVs named in the watch table.
+The watch triggers each time the condition changes from false to true::
+
+    [[watch]]
+    trigger_PV = "ioc:vac:pressure"
+    message_PV = "ioc:vac:why"
+    condition = "above(value, 5e-6, 1e-6) and valve == 0"
+    inputs = {valve = "ioc:vac:valve:open"}
+
+===========================  ==============================================
+in a condition               value
+===========================  ==============================================
+``value``                    value of the trigger PV
+``A`` (a name of inputs)     value of that input PV
+``old_value``, ``old(A)``    value before the latest update of the PV
+``rises(A)``                 latest update of A: from false (0) to true
+``falls(A)``                 latest update of A: from true to false (0)
+``changed(A)``               latest update of A changed its value
+``above(A, level, h)``       true when A > level, until A < level - h
+``below(A, level, h)``       true when A < level, until A > level + h
+``severity(A)``              alarm severity: ``NO_ALARM``, ``MINOR``,
+                             ``MAJOR`` or ``INVALID``
+``status(A)``                alarm status (0: no alarm)
+``abs()``, ``min()``,        as in Python
+``max()``
+===========================  ==============================================
+
+Numbers, strings, arithmetic (``+ - * / %``), comparisons (which may be
+chained, ``0 < value < 5``), ``and``, ``or`` and ``not`` may be used.
+The hysteresis ``h`` of ``above`` and ``below`` is optional (default 0).
+The default condition is ``old_value == 0 and value == 1``.
+
+The condition is parsed and checked once, then compiled into a Python
+function of the lists of PV values.  Each monitor update stores the new
+value and calls that function, about a microsecond (see
+``python -m PvMail.benchmarks.condition``).  A condition that cannot be
+evaluated, such as when a PV has no value yet or a string is compared
+with a number, is false.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import ast
+import collections
+import functools
+import threading
+
+DEFAULT_CONDITION = "old_value == 0 and value == 1"
+CONDITION_KEYS = ("condition", "inputs")
+TRIGGER = "value"  # name of the trigger PV
+ALARM_SEVERITY = dict(NO_ALARM=0, MINOR=1, MAJOR=2, INVALID=3)
+
+# function: Python expression, of the lists of PV values, for PV ``i``
+PV_FUNCTIONS = {
+    "old": "_o[{i}]",
+    "rises": "(not _o[{i}] and _v[{i}])",
+    "falls": "(_o[{i}] and not _v[{i}])",
+    "changed": "(_o[{i}] != _v[{i}])",
+    "severity": "_s[{i}]",
+    "status": "_t[{i}]",
+}
+LATCHES = dict(above=1, below=-1)
+BUILTINS = dict(abs=abs, min=min, max=max)
+RESERVED = (set(PV_FUNCTIONS) | set(LATCHES) | set(BUILTINS) | set(ALARM_SEVERITY)) | {
+    TRIGGER,
+    "old_value",
+}
+_ALLOWED = (
+    ast.Expression,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.USub,
+    ast.UAdd,
+    ast.BinOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Mod,
+    ast.Compare,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.Load,
+)
+
+Compiled = collections.namedtuple("Compiled", "function latches")
+
+
+class ConditionError(ValueError):
+    pass
+
+
+class _Compiler(ast.NodeTransformer):
+    """check the parsed condition, replace PV names by list items"""
+
+    def __init__(self, text, names):
+        self.text = text
+        self.index = {name: i for i, name in enumerate(names)}
+        self.latches = []  # (PV index, level, hysteresis, sign)
+
+    def error(self, what):
+        return ConditionError(f"{what} in condition {self.text!r}")
+
+    def snippet(self, expression):
+        return ast.parse(expression, mode="eval").body
+
+    def pv_index(self, node):
+        if not isinstance(node, ast.Name) or node.id not in self.index:
+            raise self.error("a PV name is needed")
+        return self.index[node.id]
+
+    def number(self, node):
+        try:
+            value = ast.literal_eval(node)
+        except ValueError:
+            value = None
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise self.error("a number is needed")
+        return value
+
+    def generic_visit(self, node):
+        if not isinstance(node, _ALLOWED):
+            raise self.error(f"{type(node).__name__} not allowed")
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float, str)):
+            raise self.error(f"constant {node.value!r} not allowed")
+        return node
+
+    def visit_Name(self, node):
+        name = node.id
+        if name in self.index:
+            return self.snippet(f"_v[{self.index[name]}]")
+        if name == "old_value":
+            return self.snippet(f"_o[{self.index[TRIGGER]}]")
+        if name in ALARM_SEVERITY:
+            return ast.Constant(ALARM_SEVERITY[name])
+        raise self.error(f"unknown name {name!r}")
+
+    def visit_Call(self, node):
+        name = getattr(node.func, "id", None)
+        if node.keywords or not isinstance(node.func, ast.Name):
+            raise self.error("function call not allowed")
+        args = node.args
+        if name in PV_FUNCTIONS:
+            if len(args) != 1:
+                raise self.error(f"{name}() takes one PV name")
+            i = self.pv_index(args[0])
+            return self.snippet(PV_FUNCTIONS[name].format(i=i))
+        if name in LATCHES:
+            if len(args) not in (2, 3):
+                raise self.error(f"{name}() takes a PV name, a level and a hysteresis")
+            i = self.pv_index(args[0])
+            level = self.number(args[1])
+            hysteresis = self.number(args[2]) if len(args) == 3 else 0
+            if hysteresis < 0:
+                raise self.error(f"negative hysteresis of {name}()")
+            self.latches.append((i, level, hysteresis, LATCHES[name]))
+            return self.snippet(f"_l[{len(self.latches) - 1}]")
+        if name in BUILTINS:
+            node.args = [self.visit(arg) for arg in args]
+            return node
+        raise self.error(f"unknown function {name!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def compile_condition(text, inputs=()):
+    """
+    return the :class:`Compiled` condition, the same object for the same text
+
+    :param str text: the condition
+    :param (str) inputs: names of the input PVs, other than ``value``
+    """
+    for name in inputs:
+        if not name.isidentifier() or name in RESERVED:
+            raise ConditionError(f"input name {name!r} not allowed")
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as exc:
+        raise ConditionError(f"condition {text!r}: {exc.msg}")
+    compiler = _Compiler(text, (TRIGGER,) + tuple(inputs))
+    body = compiler.visit(tree).body
+
+    function = ast.parse("lambda _v, _o, _s, _t, _l: 0", mode="eval")
+    function.body.body = body
+    ast.fix_missing_locations(function)
+    code = compile(function, "<condition>", "eval")
+    namespace = dict(BUILTINS, __builtins__={})
+    return Compiled(eval(code, namespace), tuple(compiler.latches))
+
+
+class _Latch(object):
+    """threshold with hysteresis: ``above()`` (sign 1) or ``below()`` (sign -1)"""
+
+    __slots__ = ("level", "reset", "sign", "state")
+
+    def __init__(self, level, hysteresis, sign):
+        self.sign = sign
+        self.level = sign * level
+        self.reset = self.level - hysteresis
+        self.state = False
+
+    def update(self, value):
+        try:
+            y = self.sign * value
+            self.state = y >= self.reset if self.state else y > self.level
+        except TypeError:  # not a number
+            self.state = False
+        return self.state
+
+
+class Condition(object):
+    """
+    The trigger condition of one watch, with the latest values of its PVs.
+
+    :param str text: the condition
+    :param dict inputs: {name: PV name} of the PVs used, other than the
+        trigger PV
+
+    Input ``0`` is the trigger PV, the inputs follow in order.  Until
+    each PV has a value, the condition is not evaluated.  The first values
+    do not trigger: a condition that is already true then triggers only
+    after it has been false.
+    """
+
+    def __init__(self, text=DEFAULT_CONDITION, inputs=None):
+        self.text = text
+        self.inputs = dict(inputs or {})
+        names = (TRIGGER,) + tuple(self.inputs)
+        compiled = compile_condition(text, names[1:])
+        self._function = compiled.function
+        n = len(names)
+        self.names = names
+        self.values = [None] * n
+        self.old = [None] * n
+        self.severity = [0] * n
+        self.status = [0] * n
+        self.latched = [False] * len(compiled.latches)
+        self._latches = [[] for _ in names]  # for each PV: [(k, _Latch)]
+        for k, (i, level, hysteresis, sign) in enumerate(compiled.latches):
+            self._latches[i].append((k, _Latch(level, hysteresis, sign)))
+        self.state = None  # not known
+        self._missing = n  # PVs without a value
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Condition({self.text!r})"
+
+    def _evaluate(self):
+        try:
+            return bool(
+                self._function(
+                    self.values, self.old, self.severity, self.status, self.latched
+                )
+            )
+        except Exception:  # such as None > 5, or division by zero
+            return False
+
+    def _store(self, index, value, severity, status):
+        previous = self.values[index]
+        self.old[index] = value if previous is None else previous
+        self.values[index] = value
+        if severity is not None:
+            self.severity[index] = severity
+        if status is not None:
+            self.status[index] = status
+        for k, latch in self._latches[index]:
+            self.latched[k] = latch.update(value)
+
+    def update(self, index, value, severity=None, status=None):
+        """
+        store a new value of PV ``index``, return *True* if the condition became true
+
+        :param int index: 0 for the trigger PV, then the inputs in order
+        :param obj value: new value of the PV
+        :param int severity: alarm severity, *None* if not known
+        :param int status: alarm status, *None* if not known
+        """
+        with self._lock:
+            values = self.values
+            self.old[index] = values[index]
+            values[index] = value
+            if self._missing:
+                values[index] = None  # no edge from no value
+                self._store(index, value, severity, status)
+                self._known()
+                return False
+            if severity is not None:
+                self.severity[index] = severity
+            if status is not None:
+                self.status[index] = status
+            latched = self.latched
+            for k, latch in self._latches[index]:
+                latched[k] = latch.update(value)
+            args = (values, self.old, self.severity, self.status, latched)
+            try:
+                state = bool(self._function(*args))
+            except Exception:  # such as None > 5, or division by zero
+                state = False
+            fired = state and not self.state
+            self.state = state
+        return fired
+
+    def _known(self):
+        """count the PVs without a value, evaluate once all have one"""
+        self._missing = self.values.count(None)
+        self.state = None if self._missing else self._evaluate()
+
+    def reset(self, values, severity=None):
+        """start from these values (one for each PV, *None*: not known)"""
+        with self._lock:
+            for index, value in enumerate(values):
+                self.values[index] = None  # no edge from the last values
+                sev = None if severity is None else severity[index]
+                self._store(index, value, sev, None)
+            self._known()
+
+
+def from_settings(settings, defaults=None):
+    """
+    return a :class:`Condition` from a dictionary (such as a watch table entry)
+
+    Returns *None* if no condition is given.
+    """
+    kwargs = {}
+    for source in (defaults or {}, settings):
+        kwargs.update({k: source[k] for k in CONDITION_KEYS if k in source})
+    if "condition" not in kwargs:
+        return None
+    return Condition(kwargs["condition"], kwargs.get("inputs"))
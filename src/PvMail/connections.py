@@ -0,0 +1,94 @@
+"""
+Connect many PVs at the same time.
+
+Creating an :class:`epics.PV` does not wait for the connection: the
+channel search goes out at once and the PV's connection callbacks are
+called when the IOC answers.  Create all the PVs first, then wait for
+all of them with one :class:`BulkConnection`, so that startup takes
+about one timeout at most, whatever the number of PVs::
+
+    bulk = BulkConnection()
+    pvs = [epics.PV(pvname) for pvname in pvnames]
+    bulk.add(pvs)
+    not_connected = bulk.wait(timeout=5)
+    logger(bulk.summary())
+
+The waiting thread sleeps until the last connection callback (or the
+timeout), it does not poll.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import threading
+import time
+
+CONNECT_TIMEOUT = 5.0
+
+
+class BulkConnection(object):
+    """
+    Wait for many PVs to connect, report the time each one took.
+
+    Times are measured from the creation of this object, so create it
+    just before the PVs.
+
+    :param obj clock: function returning the time (s)
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.t0 = clock()
+        self.pvs = []
+        self.pvnames = set()
+        self.latency = {}  # pvname: time (s) to connect
+        self.elapsed = None  # time (s) waited by wait()
+        self._cond = threading.Condition()
+
+    def add(self, pvs):
+        """watch the connection of these (just created) PVs"""
+        for pv in pvs:
+            callbacks = getattr(pv, "connection_callbacks", None)
+            if callbacks is not None:
+                callbacks.append(self._on_connect)
+            self.pvs.append(pv)
+            self.pvnames.add(pv.pvname)
+            if pv.connected:  # connected before the callback was added
+                self._connected(pv.pvname)
+
+    def _on_connect(self, pvname=None, conn=False, **kw):
+        if conn:
+            self._connected(pvname)
+
+    def _connected(self, pvname):
+        t = self.clock() - self.t0
+        with self._cond:
+            self.latency.setdefault(pvname, t)
+            if len(self.latency) >= len(self.pvnames):
+                self._cond.notify_all()
+
+    def wait(self, timeout=CONNECT_TIMEOUT):
+        """wait until all PVs connect (or timeout), return the PVs not connected"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.latency) < len(self.pvnames):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        self.elapsed = self.clock() - self.t0
+        for pv in self.pvs:
+            callbacks = getattr(pv, "connection_callbacks", None)
+            if callbacks is not None and self._on_connect in callbacks:
+                callbacks.remove(self._on_connect)
+        return [pv for pv in self.pvs if not pv.connected]
+
+    def summary(self):
+        """one line report: how many connected, how long it took"""
+        text = f"{len(self.latency)} of {len(self.pvnames)} PV(s) connected"
+        if self.elapsed is not None:
+            text += f" in {self.elapsed:.3f} s"
+        if self.latency:
+            times = sorted(self.latency.values())
+            median = times[len(times) // 2]
+            text += f" (median {1e3 * median:.1f} ms, max {1e3 * times[-1]:.1f} ms)"
+        return text
@@ -0,0 +1,238 @@
+"""
+Coalesce many triggers into one digest email per recipient list.
+
+When many watches trigger at once (such as a beam dump), a
+:class:`Coalescer` holds the triggers for a short *window*.  Each new
+trigger for the same recipient list extends the window, but no trigger
+is held longer than *max_delay*.  Then one email is sent for all of
+them, listing each trigger PV, its timestamp and its message.
+
+In a watch table (see :mod:`PvMail.watches`), set the global window
+and (optionally) a window per group of watches::
+
+    digest_window = 5           # seconds, 0: send each trigger at once
+    digest_max_delay = 30       # seconds
+
+    [groups.vacuum]
+    digest_window = 10
+    digest_max_delay = 60
+
+    [[watch]]
+    group = "vacuum"
+    trigger_PV = "ioc:vac1:trip"
+    message_PV = "ioc:vac1:why"
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import datetime
+import os
+import socket
+import sys
+import threading
+import time
+
+from . import cli
+from . import ini_config
+from . import metrics
+
+DIGEST_WINDOW_S = 5.0
+DIGEST_MAX_DELAY_S = 30.0
+
+
+class Coalescer(object):
+    """
+    Collect triggers by recipient list, hand each batch to ``send``.
+
+    :param obj send: called as ``send(events, watches)`` with a list of
+        :class:`~PvMail.trigger.TriggerEvent` (same recipients) and the
+        list of the watch of each one, from the coalescer's thread
+    :param float window: wait this long (s) after the latest trigger
+    :param float max_delay: never hold a trigger longer than this (s)
+    :param obj clock: returns the time (s), for replay in virtual time
+    :param bool start: if False, no thread is started, the caller
+        collects the digests that are due with :meth:`take_due`
+    """
+
+    def __init__(
+        self,
+        send,
+        window=DIGEST_WINDOW_S,
+        max_delay=DIGEST_MAX_DELAY_S,
+        clock=time.monotonic,
+        start=True,
+    ):
+        self.send = send
+        self.window = window
+        self.max_delay = max(window, max_delay)
+        self.clock = clock
+        self.running = True
+        self._pending = {}  # key: [events, first_time, deadline, watches]
+        self._cond = threading.Condition()
+        self._thread = None
+        if start:
+            self._thread = threading.Thread(
+                target=self._run, name="pvMail-digest", daemon=True
+            )
+            self._thread.start()
+
+    def add(self, event, watch=None):
+        """hold ``event`` (from ``watch``) for the next digest to its recipients"""
+        key = tuple(sorted(set(event.recipients)))
+        now = self.clock()
+        with self._cond:
+            digest = self._pending.get(key)
+            if digest is None:
+                digest = self._pending[key] = [[], now, now, []]
+            digest[0].append(event)
+            digest[3].append(watch)
+            digest[2] = min(now + self.window, digest[1] + self.max_delay)
+            self._cond.notify()
+
+    def pending(self):
+        """number of triggers being held"""
+        with self._cond:
+            return sum(len(d[0]) for d in self._pending.values())
+
+    def next_deadline(self):
+        """time when the next digest is due, *None* if none are held"""
+        with self._cond:
+            if not self._pending:
+                return None
+            return min(d[2] for d in self._pending.values())
+
+    def take_due(self, now=None):
+        """
+        remove and return the digests due at ``now`` (all, once closed)
+
+        Returns a list of (events, watches).
+        """
+        if now is None:
+            now = self.clock()
+        with self._cond:
+            due = [
+                key
+                for key, digest in self._pending.items()
+                if digest[2] <= now or not self.running
+            ]
+            digests = [self._pending.pop(key) for key in due]
+            return [(digest[0], digest[3]) for digest in digests]
+
+    def _next_batches(self):
+        """wait for, then remove and return the digests that are due"""
+        with self._cond:
+            while True:
+                now = self.clock()
+                batches = self.take_due(now)
+                if batches or not self.running:
+                    return batches
+                timeout = None
+                if self._pending:
+                    timeout = min(d[2] for d in self._pending.values()) - now
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            batches = self._next_batches()
+            for events, watches in batches:
+                self.send(events, watches)
+            if not batches and not self.running:
+                break
+
+    def close(self):
+        """send all held triggers now and stop"""
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            for events, watches in self.take_due():
+                self.send(events, watches)
+
+
+def render_digest(events, agent_db):
+    """return (subject, message) of a digest email for ``events``"""
+    first = events[0]
+    subject = f"pvMail.py: {len(events)} triggers ({first.triggerPV}, ...)"
+
+    t0 = datetime.datetime.fromtimestamp(first.time)
+    t1 = datetime.datetime.fromtimestamp(events[-1].time)
+    lines = ["", "", f"{len(events)} triggers between {t0} and {t1}"]
+    for event in events:
+        lines.append("")
+        lines.append("trigger PV: %s" % event.triggerPV)
+        lines.append(
+            "date: %s (UNIX, not PV)" % datetime.datetime.fromtimestamp(event.time)
+        )
+        if event.ca_timestamp is not None:
+            lines.append("CA_timestamp: %d" % event.ca_timestamp)
+        else:
+            lines.append("CA_timestamp: not available")
+        if event.connected:
+            lines.append("message PV: %s" % event.messagePV)
+        else:
+            lines.append("message PV: %s (disconnected)" % event.messagePV)
+        lines.append("message: %s" % event.message)
+        if event.suppressed:
+            n = event.suppressed
+            lines.append("suppressed: %d trigger(s) since last email" % n)
+        if event.history is not None:
+            lines.append(str(event.history).rstrip("\n"))
+    lines.append("")
+    lines.append("user: %s" % cli.getUserName(agent_db))
+    lines.append("host: %s" % socket.gethostname())
+    lines.append("program: %s" % sys.argv[0])
+    lines.append("PID: %d" % os.getpid())
+    lines.append("recipients: %s" % ", ".join(first.recipients))
+    return subject, "\n".join(lines) + "\n"
+
+
+def _template(watches):
+    """message template of the (first) watch, *None* if not known"""
+    watch = (watches or [None])[0]
+    return getattr(watch, "template", None)
+
+
+def count_sent(watches):
+    """an email was sent for a trigger of each of ``watches`` (*None*: not known)"""
+    changed = []
+    for watch in watches or ():
+        if watch is not None:
+            watch.emails_sent += 1
+            if watch not in changed:
+                changed.append(watch)
+    for watch in changed:
+        watch.status_changed()
+
+
+def send_digest(events, agent_db, watches=None):
+    """
+    construct and send one email for all ``events`` (same recipients)
+
+    A single event is sent as the usual pvMail message, with the
+    template of its watch (from ``watches``, one for each event).
+    """
+    cli.logger(f"send_digest: {len(events)} trigger(s)")
+    agent_db = ini_config.snapshot(agent_db)
+    emailer = cli.get_emailer(agent_db)
+
+    try:
+        if len(events) == 1:
+            template = _template(watches)
+            cli._send(
+                emailer, events[0], agent_db, logger=cli.logger, template=template
+            )
+        else:
+            subject, msg = render_digest(events, agent_db)
+            cli.logger(msg)
+            recipients = list(events[0].recipients)
+            emailer(subject, msg, recipients, agent_db.get(), logger=cli.logger)
+            cli.logger("digest sent")
+    except Exception as exc:
+        metrics.emails_failed.inc()
+        cli.logger(f"problem sending email: {exc}")
+    else:
+        metrics.emails_sent.inc()
+        metrics.send_latency.observe(time.time() - events[0].time)
+        count_sent(watches)
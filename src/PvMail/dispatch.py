@@ -0,0 +1,143 @@
+"""
+Bounded pool of send workers.
+
+Each trigger is submitted with a *key* (the trigger PV name).  All jobs
+with the same key go to the same worker thread, so the messages for
+one watch are sent in the order of their triggers, while different
+watches are sent in parallel.  The queues are bounded: when a worker's
+queue is full, the job is dropped (and counted, see
+``pvmail_send_dropped_total`` in :mod:`PvMail.metrics`) rather than
+blocking the EPICS callback thread that submitted it.  If an
+*overflow* function is given (such as when messages are spooled), the
+job is handed to it instead of being dropped.
+
+EXAMPLE::
+
+    >>> pool = SendPool(workers=4)
+    >>> pool.submit(pvm.triggerPV, SendMessage, pvm, config)
+    >>> pool.qsize()
+    1
+    >>> pool.shutdown()
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import queue
+import threading
+
+from . import metrics
+
+SEND_WORKERS = 4
+SEND_QUEUE_SIZE = 1000  # total, shared evenly by the workers
+
+_SHUTDOWN = object()
+
+
+class SendPool(object):
+    """
+    Fixed number of worker threads, each with its own bounded FIFO queue.
+
+    :param int workers: number of worker threads
+    :param int maxsize: maximum number of jobs waiting in all queues
+    :param obj logger: optional message logging method
+    :param obj overflow: optional function, called as ``overflow(func, *args)``
+        (in the submitting thread) with a job that does not fit in its queue
+    """
+
+    def __init__(
+        self, workers=SEND_WORKERS, maxsize=SEND_QUEUE_SIZE, logger=None, overflow=None
+    ):
+        self.logger = logger
+        self.overflow = overflow
+        self.dropped = 0
+        self.running = True
+        self._lock = threading.Lock()  # no job queued after shutdown
+        self._stopping = threading.Event()
+        per_worker = max(1, maxsize // workers)
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._threads = []
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(
+                target=self._worker, args=(q,), name=f"pvMail-send-{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger(message)
+
+    def _worker(self, q):
+        while True:
+            job = q.get()
+            if job is _SHUTDOWN:
+                break
+            func, args = job
+            try:
+                func(*args)
+            except Exception as exc:
+                self._log(f"send worker: {func.__name__} failed: {exc}")
+            if self._stopping.is_set() and q.empty():
+                break  # queue was full at shutdown, no room for _SHUTDOWN
+
+    def submit(self, key, func, *args):
+        """
+        queue ``func(*args)`` on the worker for ``key``, never blocks
+
+        Returns ``False`` if the job was dropped (pool stopped, or queue
+        full and no *overflow*).
+        """
+        q = self._queues[hash(key) % len(self._queues)]
+        with self._lock:
+            if not self.running:
+                self._log(f"send pool stopped, dropped job for {key}")
+                return False
+            try:
+                q.put_nowait((func, args))
+                return True
+            except queue.Full:
+                pass
+        if self.overflow is not None:
+            self._log(f"send queue full, overflow job for {key}")
+            try:
+                self.overflow(func, *args)
+                return True
+            except Exception as exc:
+                self._log(f"send overflow: {func.__name__} failed: {exc}")
+        self.dropped += 1
+        metrics.send_dropped.inc()
+        self._log(f"send queue full, dropped job for {key}")
+        return False
+
+    def qsize(self):
+        """number of jobs waiting to be sent"""
+        return sum(q.qsize() for q in self._queues)
+
+    def shutdown(self, wait=True, timeout=None):
+        """
+        stop accepting jobs, let the workers finish the queued jobs and exit
+
+        Never blocks when ``wait`` is False, even if a queue is full.
+
+        :param bool wait: if True, wait for the workers to exit
+        :param float timeout: maximum time (s) to wait for each worker
+        """
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+        self._stopping.set()
+        queued = self.qsize()
+        if queued:
+            self._log(f"send pool shutdown: {queued} queued job(s) still to send")
+        for q in self._queues:
+            try:
+                q.put_nowait(_SHUTDOWN)
+            except queue.Full:
+                pass  # the worker stops when its queue is empty
+        if wait:
+            for t in self._threads:
+                t.join(timeout)
+            left = sum(1 for t in self._threads if t.is_alive())
+            if left:
+                self._log(f"send pool shutdown: {left} worker(s) still sending")
@@ -0,0 +1,247 @@
+"""
+Recent values of context PVs, included in the email of a trigger.
+
+A watch may name *context PVs*: PVs that are not triggers, but whose
+values just before a trigger help to understand it.  The monitor
+updates of each context PV are kept in a :class:`RingBuffer` of fixed
+size, and the email reports the samples of the last *history_window*
+seconds before the trigger (and the value held at the start of that
+window).
+
+In a watch table (see :mod:`PvMail.watches`), these are set at the top
+level (for all watches) or for each watch::
+
+    [[watch]]
+    trigger_PV = "ioc:shutter:trip"
+    message_PV = "ioc:shutter:why"
+    context_PVs = ["ioc:vac:pressure", "ioc:beam:current"]
+    history_window = 60
+    history_samples = 600
+
+Each sample is a time and a value, stored as two C doubles, so a
+context PV uses ``16 * (history_samples + 1)`` bytes, whatever its
+update rate.  Values that are not numbers (strings, arrays) are stored as NaN.
+The total is logged at startup and reported by the
+``pvmail_history_bytes`` metric.
+
+The monitor callback writes the new sample in place, nothing is
+allocated.  At a trigger, :meth:`ContextHistory.snapshot` only notes
+how many samples each buffer holds.  The samples are copied when the
+email is rendered, by the thread that sends it.  Samples overwritten in
+between (if a context PV updated more than *history_samples* times
+since the trigger) are left out, they are never reported wrong.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import array
+import math
+import time
+
+HISTORY_KEYS = "context_PVs history_window history_samples".split()
+HISTORY_WINDOW_S = 60.0
+HISTORY_SAMPLES = 600
+
+
+def _number(value):
+    """the value as float, NaN if it is not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class RingBuffer(object):
+    """
+    The latest ``size`` (time, value) samples of one PV.
+
+    :param int size: number of samples kept
+
+    Samples are numbered from 0 in the order they are written,
+    :attr:`written` is the number of the next sample.  One more slot
+    than ``size`` is allocated, for the sample being written while the
+    latest ``size`` are read.
+    """
+
+    __slots__ = ("size", "slots", "times", "values", "written")
+
+    def __init__(self, size=HISTORY_SAMPLES):
+        if size < 1:
+            raise ValueError(f"history needs at least 1 sample, not {size}")
+        self.size = size
+        self.slots = size + 1
+        self.times = array.array("d", bytes(8 * self.slots))
+        self.values = array.array("d", bytes(8 * self.slots))
+        self.written = 0
+
+    def __len__(self):
+        return min(self.written, self.size)
+
+    @property
+    def nbytes(self):
+        """memory used by the samples (bytes)"""
+        return self.slots * (self.times.itemsize + self.values.itemsize)
+
+    def append(self, t, value):
+        """write a sample, over the oldest one if full"""
+        n = self.written
+        i = n % self.slots
+        self.times[i] = t
+        self.values[i] = value
+        self.written = n + 1  # last: a reader never sees a half-written sample
+
+    def samples(self, since=None, end=None):
+        """
+        return list of (time, value), oldest first
+
+        :param float since: only samples from this time on, and the one
+            before (the value held at ``since``), *None*: all
+        :param int end: only samples written before sample number ``end``
+            (from :attr:`written`), *None*: all
+        """
+        if end is None:
+            end = self.written
+        first = max(0, end - self.size)
+        slots = self.slots
+        copied = [
+            (self.times[n % slots], self.values[n % slots]) for n in range(first, end)
+        ]
+        # samples overwritten (or being overwritten) while copying
+        lost = self.written - slots + 1 - first
+        if lost > 0:
+            copied = copied[lost:]
+        if since is not None:
+            i = 0
+            while i < len(copied) - 1 and copied[i + 1][0] <= since:
+                i += 1
+            copied = copied[i:]
+        return copied
+
+
+class HistorySnapshot(object):
+    """
+    The context PV samples before one trigger, copied only when read.
+
+    :param dict marks: {pvname: (RingBuffer, samples written)} at the trigger
+    :param float until: time of the trigger
+    :param float window: report samples this long (s) before ``until``
+    """
+
+    __slots__ = ("marks", "until", "window")
+
+    def __init__(self, marks, until, window):
+        self.marks = marks
+        self.until = until
+        self.window = window
+
+    def samples(self):
+        """return {pvname: [(time, value), ...]} of the window"""
+        since = self.until - self.window
+        return {
+            pvname: buffer.samples(since, end)
+            for pvname, (buffer, end) in self.marks.items()
+        }
+
+    def __str__(self):
+        lines = [f"\ncontext PVs, {self.window:g} s before the trigger:"]
+        for pvname, samples in self.samples().items():
+            lines.append(f"{pvname} ({len(samples)} sample(s)):")
+            for t, value in samples:
+                lines.append(f"  {t - self.until:+10.3f} s  {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+class ContextHistory(object):
+    """
+    Ring buffers of the context PVs of one watch.
+
+    :param [str] pvnames: names of the context PVs
+    :param float window: time (s) before a trigger reported in the email
+    :param int samples: samples kept for each PV
+    """
+
+    def __init__(self, pvnames, window=HISTORY_WINDOW_S, samples=HISTORY_SAMPLES):
+        self.pvnames = list(dict.fromkeys(pvnames))  # unique, in order
+        self.window = window
+        self.buffers = {pvname: RingBuffer(samples) for pvname in self.pvnames}
+        self.pv = {pvname: None for pvname in self.pvnames}
+        self.pv_cb_index = {}
+
+    @property
+    def nbytes(self):
+        """memory used by the samples of all context PVs (bytes)"""
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+    def make_pvs(self, make_pv):
+        """create the PVs (if not created yet) with ``make_pv(pvname)``, return them"""
+        for pvname, pv in self.pv.items():
+            if pv is None:
+                self.pv[pvname] = make_pv(pvname)
+        return list(self.pv.values())
+
+    def start(self):
+        """record the monitor updates of the context PVs"""
+        for pvname, pv in self.pv.items():
+            buffer = self.buffers[pvname]
+            if pv.connected:  # the value held now
+                buffer.append(pv.timestamp or time.time(), _number(pv.value))
+            self.pv_cb_index[pvname] = pv.add_callback(self._callback(buffer))
+
+    @staticmethod
+    def _callback(buffer):
+        append = buffer.append
+
+        def receive(value=None, timestamp=None, **kw):
+            append(timestamp or time.time(), _number(value))
+
+        return receive
+
+    def stop(self):
+        """stop recording, disconnect the context PVs"""
+        for pvname, pv in self.pv.items():
+            if pv is not None:
+                index = self.pv_cb_index.pop(pvname, None)
+                if index is not None:
+                    pv.remove_callback(index)
+                pv.disconnect()
+                self.pv[pvname] = None
+
+    def snapshot(self, until):
+        """
+        mark the samples before a trigger at time ``until``, copy nothing
+
+        Returns a :class:`HistorySnapshot`.
+        """
+        marks = {pvname: (b, b.written) for pvname, b in self.buffers.items()}
+        return HistorySnapshot(marks, until, self.window)
+
+    def summary(self):
+        """one line report: PVs and memory used"""
+        n = len(self.pvnames)
+        per_pv = self.nbytes // n if n else 0
+        return (
+            f"context history: {n} PV(s), {self.window:g} s window,"
+            f" {self.nbytes} bytes ({per_pv} bytes per PV)"
+        )
+
+
+def from_settings(settings, defaults=None):
+    """
+    return a :class:`ContextHistory` from a dictionary (such as a watch table entry)
+
+    Returns *None* if no context PVs are given.
+    """
+    kwargs = {}
+    for source in (defaults or {}, settings):
+        kwargs.update({k: source[k] for k in HISTORY_KEYS if k in source})
+    pvnames = kwargs.pop("context_PVs", [])
+    if isinstance(pvnames, str):
+        pvnames = pvnames.split(",")
+    pvnames = [v.strip() for v in pvnames if len(v.strip()) > 0]
+    if not pvnames:
+        return None
+    return ContextHistory(
+        pvnames,
+        window=kwargs.get("history_window", HISTORY_WINDOW_S),
+        samples=kwargs.get("history_samples", HISTORY_SAMPLES),
+    )
@@ -6,17 +6,33 @@ To identify the configuration file (and create if it does not exist already)::
     [joeuser] $ pvMail_mail_config_file
     /home/joeuser/.pvMail/pvMail.ini
 
+The file is read once per process (see :func:`cached`).  It is read
+again only when its modification time or size change, checked at most
+once every ``CHECK_INTERVAL_S``, so SMTP credentials can be changed
+without restarting pvMail.  A changed file that is not valid is
+ignored (and logged) and the previous settings are kept.  Each email
+is sent with a :class:`ConfigSnapshot` (see :func:`snapshot`), so a
+reload never changes the settings of an email being sent.
 """
 
 # Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
 
+import copy
 import datetime
 import os
 import sys
+import threading
+import time
 from configparser import ConfigParser
+from configparser import Error as ConfigParserError
 
 APPLICATION = "pvMail"
 INI_FILE = "pvMail.ini"
+CHECK_INTERVAL_S = 2.0
+REQUIRED_OPTIONS = dict(sendmail=("user",), SMTP=("user", "server"))
+
+_cached = None
+_cached_lock = threading.Lock()
 
 
 class Unknown_MTA(Exception):
@@ -27,6 +43,41 @@ class NoConfigFile(Exception):
     pass
 
 
+class InvalidConfig(Exception):
+    pass
+
+
+class ConfigSnapshot(object):
+    """
+    Settings of a :class:`Config` at one moment, never changed.
+
+    Can be used wherever a :class:`Config` is expected to send email.
+    """
+
+    def __init__(self, ini_file, mail_transfer_agent, agent_db):
+        self.ini_file = ini_file
+        self.mail_transfer_agent = mail_transfer_agent
+        self.agent_db = agent_db
+
+    def get(self):
+        """
+        return the chosen configuration dictionary
+        """
+        return self.agent_db[self.mail_transfer_agent]
+
+    def snapshot(self):
+        return self
+
+
+def validate(mail_transfer_agent, agent_db):
+    """raise :class:`InvalidConfig` if these settings cannot send email"""
+    if mail_transfer_agent not in agent_db:
+        raise InvalidConfig(f"no [{mail_transfer_agent}] mail_transfer_agent settings")
+    for option in REQUIRED_OPTIONS.get(mail_transfer_agent, ()):
+        if not agent_db[mail_transfer_agent].get(option):
+            raise InvalidConfig(f"[{mail_transfer_agent}] needs {option!r}")
+
+
 class Config(object):
     def __init__(self):
         if "PVMAIL_INI_FILE" in os.environ:
@@ -41,7 +92,7 @@ class Config(object):
             self.ini_file = os.path.join(self.ini_dir, INI_FILE)
 
         self.mail_transfer_agent = "sendmail"
-        if sys.platform not in ("linux2"):
+        if not sys.platform.startswith("linux"):
             # only use sendmail on linux systems
             self.mail_transfer_agent = "SMTP"
 
@@ -60,6 +111,12 @@ class Config(object):
                 connection_security="STARTTLS",
             ),
         )
+        self._defaults = copy.deepcopy(self.agent_db)
+        self._stamp = None  # (mtime, size) of the file read
+        self._next_check = 0
+        self._reload_lock = threading.Lock()
+        self._snapshot = self._make_snapshot()
+        self.error = None  # why the latest change of the file was ignored
 
         try:
             self.read()
@@ -71,25 +128,84 @@ class Config(object):
         """choose the mail transfer agent"""
         if agent in self.agent_db:
             self.mail_transfer_agent = agent
+            self._snapshot = self._make_snapshot()
         else:
             raise Unknown_MTA(str(agent))
 
+    def _make_snapshot(self):
+        return ConfigSnapshot(self.ini_file, self.mail_transfer_agent, self.agent_db)
+
+    def _stat(self):
+        st = os.stat(self.ini_file)
+        return st.st_mtime_ns, st.st_size
+
     def read(self):
-        """read the configuration file"""
+        """
+        read the configuration file
+
+        The new settings replace the old ones only if they are all read
+        and valid, otherwise an exception is raised and nothing changes.
+        """
         if not os.path.exists(self.ini_file):
             raise NoConfigFile(str(self.ini_file))
 
+        stamp = self._stat()
         config = ConfigParser()
         config.read(self.ini_file)
 
-        self.mail_transfer_agent = config.get("mailer", "mail_transfer_agent")
+        mail_transfer_agent = config.get("mailer", "mail_transfer_agent")
+        agent_db = copy.deepcopy(self._defaults)
 
         for section in config.sections():
             if section not in ("header", "mailer"):
                 for option in config.options(section):
-                    if section not in self.agent_db:
-                        self.agent_db[section] = {}
-                    self.agent_db[section][option] = config.get(section, option)
+                    if section not in agent_db:
+                        agent_db[section] = {}
+                    agent_db[section][option] = config.get(section, option)
+        validate(mail_transfer_agent, agent_db)
+
+        self.mail_transfer_agent = mail_transfer_agent
+        self.agent_db = agent_db
+        self._stamp = stamp
+        self._snapshot = self._make_snapshot()
+
+    def reload(self):
+        """
+        read the file again if it changed, return True if the settings changed
+
+        A file that cannot be read or is not valid is logged and ignored.
+        """
+        from . import logs
+
+        try:
+            if self._stat() == self._stamp:
+                return False
+        except FileNotFoundError:
+            return False  # keep the settings, may be replaced in a moment
+        with self._reload_lock:
+            try:
+                self.read()
+            except (ConfigParserError, InvalidConfig, OSError) as exc:
+                if str(exc) != self.error:
+                    logs.log.warning("ignored changes to %s: %s", self.ini_file, exc)
+                self.error = str(exc)
+                return False
+        self.error = None
+        logs.info("reloaded configuration file %s", self.ini_file)
+        return True
+
+    def snapshot(self):
+        """
+        return the current settings as a :class:`ConfigSnapshot`
+
+        The file is checked for changes at most once every
+        ``CHECK_INTERVAL_S``, otherwise there is no disk I/O.
+        """
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + CHECK_INTERVAL_S
+            self.reload()
+        return self._snapshot
 
     def write(self):
         """
@@ -119,6 +235,32 @@ class Config(object):
         return self.agent_db[self.mail_transfer_agent]
 
 
+def cached():
+    """return the process-wide :class:`Config`, created on first use"""
+    global _cached
+
+    if _cached is None:
+        with _cached_lock:
+            if _cached is None:
+                _cached = Config()
+    return _cached
+
+
+def snapshot(config=None):
+    """
+    return the settings to send one email
+
+    :param obj config: a :class:`Config` (the current settings are
+        returned), a :class:`ConfigSnapshot` or an object with the same
+        methods (returned as is), or *None* for :func:`cached`
+    """
+    if config is None:
+        config = cached()
+    if hasattr(config, "snapshot"):
+        return config.snapshot()
+    return config
+
+
 def main():
     con = Config()
     print(con.ini_file)
@@ -0,0 +1,307 @@
+"""
+Log file written by a background thread, with optional rotation.
+
+:func:`PvMail.cli.logger` puts the time, message and arguments on a
+queue and returns; it never waits for the disk.  A
+:class:`logging.handlers.QueueListener` thread makes the log records,
+formats them and writes them to the log file.  The message is
+formatted only if it is written, so pass the values as arguments::
+
+    logger("%s = %s", pvname, value)
+
+The program name, process ID and host name are found once, at setup.
+Other records of the ``PvMail`` logger (``logs.log.warning(...)``)
+go through the same queue.
+
+Each line of the log file looks like::
+
+    (12345,pvMail,2024-03-01 12:00:00.123456) pvMail:trigger = 1
+
+or, with ``json_lines=True`` (``--log-format json``), is a JSON object::
+
+    {"time": "2024-03-01T12:00:00.123456", "pid": 12345, "program": "pvMail",
+     "host": "ioc1", "level": "INFO", "message": "pvMail:trigger = 1"}
+
+Rotate the log file when it reaches a size (``--log-rotate 10MB``) or
+at an interval (``--log-rotate midnight``, or ``H``, ``D``, ``W0`` ...
+as in :class:`logging.handlers.TimedRotatingFileHandler`), optionally
+compressing the old files with gzip (``--log-compress``).
+
+The GUI shows the end of the log file with a :class:`LogTail`.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import atexit
+import collections
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import socket
+import sys
+import time
+
+LOGGER_NAME = "PvMail"
+BACKUP_COUNT = 5
+TAIL_LINES = 1000
+TAIL_BYTES_PER_LINE = 256  # to find the start of the last lines of a file
+SIZE_UNITS = dict(B=1, KB=1024, MB=1024**2, GB=1024**3)
+
+log = logging.getLogger(LOGGER_NAME)
+_listener = None
+_records = None
+
+
+class TextFormatter(logging.Formatter):
+    """``(pid,program,date) message``, as written by pvMail 4.0"""
+
+    def __init__(self):
+        super().__init__()
+        self.prefix = f"({os.getpid()},{os.path.basename(sys.argv[0])},"
+
+    def format(self, record):
+        now = datetime.datetime.fromtimestamp(record.created)
+        text = f"{self.prefix}{now}) {record.getMessage()}"
+        if record.exc_text:
+            text += "\n" + record.exc_text
+        return text
+
+
+class JSONFormatter(logging.Formatter):
+    """one JSON object per line"""
+
+    def __init__(self):
+        super().__init__()
+        self.static = dict(
+            pid=os.getpid(),
+            program=os.path.basename(sys.argv[0]),
+            host=socket.gethostname(),
+        )
+
+    def format(self, record):
+        entry = dict(time=datetime.datetime.fromtimestamp(record.created).isoformat())
+        entry.update(self.static)
+        entry["level"] = record.levelname
+        entry["message"] = record.getMessage()
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """queue the record as is: the message is formatted by the writer thread"""
+
+    def prepare(self, record):
+        if record.exc_info:  # traceback objects must not wait in the queue
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def prepare(self, record):
+        if isinstance(record, tuple):  # from info()
+            created, message, args = record
+            record = logging.LogRecord(
+                LOGGER_NAME, logging.INFO, "", 0, message, args, None
+            )
+            record.created = created
+        return record
+
+
+def info(message, *args):
+    """
+    log at INFO level, formatted and written by the writer thread
+
+    Only the time is taken here, so this is cheap enough for a CA
+    monitor callback.  Before :func:`setup`, same as ``log.info()``.
+    """
+    if log.isEnabledFor(logging.INFO):
+        records = _records
+        if records is None:
+            log.info(message, *args)
+        else:
+            records.put((time.time(), message, args))
+
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+
+def _gzip_rotator(source, dest):
+    import gzip
+    import shutil
+
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def parse_rotate(text):
+    """
+    return dict of file handler arguments from a ``--log-rotate`` value
+
+    A size (such as ``100000``, ``500KB``, ``10MB``) rotates by size,
+    anything else (such as ``midnight`` or ``H``) rotates by time.
+    """
+    text = text.strip().upper()
+    number = text.rstrip("KMGB")
+    unit = text[len(number) :] or "B"
+    if number.isdigit() and unit in SIZE_UNITS:
+        return dict(maxBytes=int(number) * SIZE_UNITS[unit])
+    return dict(when=text)
+
+
+def file_handler(filename, rotate=None, backups=BACKUP_COUNT, compress=False):
+    """
+    return the handler that writes the log file
+
+    :param str filename: log file
+    :param str rotate: size or interval to rotate the file, see :func:`parse_rotate`
+    :param int backups: number of rotated files to keep
+    :param bool compress: if True, gzip the rotated files
+    """
+    if rotate is None:
+        return logging.FileHandler(filename)
+    kwargs = parse_rotate(rotate)
+    if "maxBytes" in kwargs:
+        handler = logging.handlers.RotatingFileHandler(
+            filename, backupCount=backups, **kwargs
+        )
+    else:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            filename, backupCount=backups, **kwargs
+        )
+    if compress:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup(
+    filename,
+    rotate=None,
+    backups=BACKUP_COUNT,
+    compress=False,
+    json_lines=False,
+    level=logging.INFO,
+):
+    """
+    start writing the pvMail log to ``filename`` from a background thread
+
+    Replaces the handlers of an earlier call.  The writer is stopped
+    (after writing all queued records) at exit or by :func:`shutdown`.
+
+    :param str filename: log file
+    :param str rotate: size or interval to rotate the file, see :func:`parse_rotate`
+    :param int backups: number of rotated files to keep
+    :param bool compress: if True, gzip the rotated files
+    :param bool json_lines: if True, write JSON lines instead of text
+    :param int level: lowest level to log
+    """
+    global _listener, _records
+
+    shutdown()
+    handler = file_handler(filename, rotate, backups, compress)
+    handler.setFormatter(JSONFormatter() if json_lines else TextFormatter())
+
+    records = queue.SimpleQueue()  # unbounded: putting never blocks
+    _listener = _QueueListener(records, handler)
+    _listener.start()
+
+    log.addHandler(_QueueHandler(records))
+    _records = records
+    log.setLevel(level)
+    log.propagate = False
+    return _listener
+
+
+def shutdown():
+    """write the queued records, then stop the writer thread"""
+    global _listener, _records
+
+    _records = None
+    for handler in list(log.handlers):
+        if isinstance(handler, _QueueHandler):
+            log.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
+
+
+class LogTail(object):
+    """
+    Follow a log file, as ``tail -F`` does, keeping its last lines.
+
+    Each call to :meth:`read` returns only the lines added since the
+    last call, so the cost does not depend on the size of the file.
+    When the file is rotated (replaced by a new file) or truncated, the
+    rest of the old file is read, then the new file from its start.
+
+    :param str filename: log file (need not exist yet)
+    :param int max_lines: number of most recent lines kept in :attr:`lines`
+    """
+
+    def __init__(self, filename, max_lines=TAIL_LINES):
+        self.filename = str(filename)
+        self.lines = collections.deque(maxlen=max_lines)
+        self._fp = None
+        self._id = None  # (device, inode) of the open file
+        self._partial = ""
+
+    def _open(self, at_tail):
+        try:
+            fp = open(self.filename, "r", errors="replace")
+        except FileNotFoundError:
+            return
+        st = os.fstat(fp.fileno())
+        self._fp, self._id = fp, (st.st_dev, st.st_ino)
+        start = st.st_size - self.lines.maxlen * TAIL_BYTES_PER_LINE
+        if at_tail and start > 0:
+            fp.seek(start)
+            fp.readline()  # skip the partial line
+
+    def _replaced(self):
+        """has the file been rotated or truncated since it was opened?"""
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return False  # wait for the new file
+        if (st.st_dev, st.st_ino) != self._id:
+            return True
+        return st.st_size < self._fp.tell()
+
+    def _read_lines(self):
+        text = self._partial + self._fp.read()
+        lines = text.split("\n")
+        self._partial = lines.pop()  # incomplete last line, if any
+        return lines
+
+    def read(self):
+        """return the list of new (complete) lines, also kept in :attr:`lines`"""
+        new = []
+        if self._fp is None:
+            self._open(at_tail=True)
+        elif self._replaced():
+            new += self._read_lines()  # the rest of the old file
+            if self._partial:
+                new.append(self._partial)
+            self.close()
+            self._open(at_tail=False)
+        if self._fp is not None:
+            new += self._read_lines()
+        self.lines.extend(new)
+        return new[-self.lines.maxlen :]
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+        self._fp, self._id, self._partial = None, None, ""
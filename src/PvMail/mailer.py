@@ -4,10 +4,30 @@ Send a message by email to one or more recipients (by SMTP or sendmail).
 
 # Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
 
+import functools
 import os
+import re
+import select
+import smtplib
+import subprocess
 import sys
+import threading
+import time
 
+from . import metrics
+
+SENDMAIL_PROGRAMS = ("/usr/lib/sendmail", "/usr/sbin/sendmail", "/usr/bin/sendmail")
+SENDMAIL_TIMEOUT = 30
 SMTP_TIMEOUT = 10
+SMTP_IDLE_TIMEOUT = 60
+SMTP_MAX_IDLE = 4
+SMTP_MAX_RECIPIENTS = 100  # per transaction, the minimum servers must accept
+# refusals after which the SMTP session is still usable
+SMTP_REFUSED = (
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPDataError,
+)
 
 
 class MailerError(Exception):
@@ -41,7 +61,7 @@ def sendMail_sendmail(
 
     """
 
-    if sys.platform not in ("linux2"):
+    if not sys.platform.startswith("linux"):
         raise MailerError(f"Cannot use this method on {sys.platform=!r}")
 
     sender = sender or sendmail_cfg["user"]
@@ -50,73 +70,228 @@ def sendMail_sendmail(
             recipients,
         ]
 
-    def _sendmail_handler(email_program, from_addr, recipients, subject, message):
-        to_addr = str(" ".join(recipients))
-        mail_command = "%s -F %s -t %s" % (email_program, from_addr, to_addr)
-        mail_message = [
-            mail_command,
-        ]
-        for who in recipients:
-            mail_message.append("To: " + who)
-        mail_message.append("Subject: " + subject)
-        mail_message.append(message)
-        cmd = """cat << +++ | %s\n+++""" % "\n".join(mail_message)
-        return mail_command, cmd
-
-    def _mail_handler(email_program, from_addr, recipients, subject, message):
-        # to_addr = str(" ".join(recipients))
-        # mail_command = "%s %s" % (email_program, to_addr)
-        # mail_message = "%s\n%s" % (subject, message)
-        # # TODO: needs to do THIS
-        # """
-        # cat /tmp/message.txt | mail jemian@anl.gov
-        # """
-        # # cmd = '''echo %s | %s''' % (mail_message, mail_command)
-        # # return mail_command, cmd    # lgtm [py/unreachable-statement]
-        raise MailerError("code needs improvement here")
-
-    cmd = None
-    for email_program, handler in (
-        ("/usr/lib/sendmail", _sendmail_handler),
-        ("/usr/bin/sendmail", _sendmail_handler),
-        ("/usr/bin/mail", _mail_handler),
-    ):
-        if os.path.exists(email_program):
-            results = handler(email_program, sender, recipients, subject, message)
-            mail_command, cmd = results
-            break
-
-    if cmd is None:
-        raise MailerError("Cannot find mail transport agent for sendmail.")
+    email_program = _find_sendmail()
+    # -oi: a line with a single "." does not end the message
+    mail_command = [email_program, "-oi", "-F", sender, "--"] + list(recipients)
 
     if logger is not None:
         logger("sending email to: " + str(recipients))
         logger("email program: " + email_program)
-        logger("mail command: " + mail_command)
+        logger("mail command: " + " ".join(mail_command))
         logger("email From: " + sender)
 
+    mail_message = _compose(subject, message, recipients, sender)
     try:
-        if logger is not None:
-            logger("email command:\n" + cmd)
-        if os.path.exists(email_program):
-            os.popen(cmd)  # send the message
-        else:
-            if logger is not None:
-                logger("email program (%s) does not exist" % email_program)
-    except Exception as reason:
-        # err_msg = traceback.format_exc()
-        final_msg = f"{cmd=!r}\ntraceback: {reason}"
-        logger(final_msg)
-        raise MailerError(final_msg)
+        result = subprocess.run(
+            mail_command,
+            input=mail_message.encode(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=SENDMAIL_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        raise MailerError(f"{email_program} did not finish in {SENDMAIL_TIMEOUT} s")
+    except OSError as reason:
+        raise MailerError(f"{mail_command=!r}: {reason}")
+
+    if result.returncode != 0:
+        stderr = result.stderr.decode(errors="replace").strip()
+        raise MailerError(f"{email_program} exit status {result.returncode}: {stderr}")
 
     if logger is not None:
         logger("sendmail sent")
 
 
+def _find_sendmail():
+    """return the path to the sendmail program"""
+    for email_program in SENDMAIL_PROGRAMS:
+        if os.path.exists(email_program):
+            return email_program
+    raise MailerError("Cannot find mail transport agent for sendmail.")
+
+
+def _compose(subject, message, recipients, sender):
+    """return the text of the email message, with headers"""
+    if isinstance(recipients, str):
+        recipients = (recipients,)
+    return _headers(tuple(recipients), sender, subject) + message
+
+
+@functools.lru_cache(maxsize=1024)
+def _headers(recipients, sender, subject):
+    """
+    return the headers (and the blank line after them) of a message
+
+    The same for each email of a watch, so they are made only once.
+    """
+    import email.message
+
+    msg = email.message.Message()
+    for who in recipients:
+        msg["To"] = who
+    msg["From"] = sender
+    msg["Subject"] = subject
+    msg.set_payload("")
+    return str(msg)
+
+
+def _crlf_bytes(text):
+    """return the message text as bytes with CRLF line endings"""
+    return text.replace("\r\n", "\n").replace("\n", "\r\n").encode()
+
+
+class _PipeSocket(object):
+    """
+    Socket-like connection to the stdin & stdout of a process.
+
+    Each read or write must finish within ``timeout`` (s), else the
+    process is killed and :class:`TimeoutError` is raised (seen by
+    :mod:`smtplib` as a lost connection).
+    """
+
+    def __init__(self, process, timeout=SENDMAIL_TIMEOUT):
+        self.process = process
+        self.timeout = timeout
+        self._buffer = b""
+
+    def _wait(self, fd, deadline, write=False):
+        """wait until ``fd`` is ready, kill the process at the deadline"""
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            fds = ([], [fd]) if write else ([fd], [])
+            ready = select.select(*fds, [], remaining)
+            if ready[0] or ready[1]:
+                return
+        self.process.kill()
+        raise TimeoutError(f"no answer from sendmail in {self.timeout} s")
+
+    def sendall(self, data):
+        fd = self.process.stdin.fileno()
+        deadline = time.monotonic() + self.timeout
+        view = memoryview(data)
+        while view:
+            self._wait(fd, deadline, write=True)
+            view = view[os.write(fd, view[: select.PIPE_BUF]) :]
+
+    def makefile(self, mode="rb"):
+        return self  # for readline()
+
+    def readline(self, limit=-1):
+        fd = self.process.stdout.fileno()
+        deadline = time.monotonic() + self.timeout
+        while b"\n" not in self._buffer and not 0 <= limit <= len(self._buffer):
+            self._wait(fd, deadline)
+            chunk = os.read(fd, 4096)
+            if not chunk:  # end of file
+                break
+            self._buffer += chunk
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        if limit >= 0:
+            end = min(end, limit)
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+    def close(self):
+        if self.process.stdin is not None and not self.process.stdin.closed:
+            self.process.stdin.close()
+        try:
+            self.process.wait(self.timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class SendmailSession(smtplib.SMTP):
+    """
+    SMTP session with a local ``sendmail -bs`` process.
+
+    Speaks SMTP over the stdin and stdout of one long-lived sendmail
+    process, so many messages can be submitted without starting a new
+    process (or opening a network connection) for each.
+
+    EXAMPLE::
+
+        >>> with SendmailSession() as session:
+        ...     session.sendmail(sender, recipients, text)
+    """
+
+    def __init__(self, email_program=None):
+        self.email_program = email_program or _find_sendmail()
+        super().__init__(local_hostname="localhost", timeout=SENDMAIL_TIMEOUT)
+        self.connect()
+
+    def connect(self, host=None, port=None, source_address=None):
+        process = subprocess.Popen(
+            [self.email_program, "-bs"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.sock = _PipeSocket(process, self.timeout)
+        self.file = None
+        code, msg = self.getreply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, msg)
+        return code, msg
+
+
+def sendMail_sendmail_batch(batch, sendmail_cfg, sender=None, logger=None):
+    """
+    Send many email messages through one ``sendmail -bs`` session (linux only).
+
+    :param [tuple] batch: (subject, message, recipients) for each email
+    :param dict sendmail_cfg: such as returned from :mod:`PvMail.ini_config.Config.get`
+    :param str sender: "From" address, if *None* use *sendmail_cfg['user']* value
+    :param obj logger: optional message logging method
+    :returns: for each email, *None* if sent or the exception raised
+
+    If the sendmail process exits or does not answer in time, a new one
+    is started for the next email.
+    """
+    if not sys.platform.startswith("linux"):
+        raise MailerError(f"Cannot use this method on {sys.platform=!r}")
+    sender = sender or sendmail_cfg["user"]
+
+    results = []
+    with SendmailSession() as session:
+        if logger is not None:
+            logger(f"sendmail session: {session.email_program} -bs")
+        for subject, message, recipients in batch:
+            if isinstance(recipients, str):
+                recipients = [recipients]
+            data = _crlf_bytes(_compose(subject, message, recipients, sender))
+            try:
+                session.sendmail(sender, list(recipients), data)
+                results.append(None)
+                continue
+            except smtplib.SMTPException as exc:
+                if logger is not None:
+                    logger(f"sendmail session: not sent to {recipients}: {exc}")
+                results.append(exc)
+            try:
+                session.rset()
+            except smtplib.SMTPServerDisconnected:
+                try:
+                    session.close()
+                    session.connect()
+                except (OSError, smtplib.SMTPException) as exc:
+                    if logger is not None:
+                        logger(f"sendmail session: cannot restart: {exc}")
+                    results += [exc] * (len(batch) - len(results))
+                    break
+    if logger is not None:
+        n_sent = results.count(None)
+        logger(f"sendmail session: {n_sent} of {len(results)} message(s) sent")
+    return results
+
+
 def sendMail_SMTP(subject, message, recipients, smtp_cfg, sender=None, logger=None):
     """
     send email message through SMTP server
 
+    Connections are reused from :data:`smtp_pool`.
+
     :param str subject: short text for email subject
     :param str message: full text of email body
     :param [str] recipients: list of email addresses to receive the message
@@ -140,33 +315,20 @@ def sendMail_SMTP(subject, message, recipients, smtp_cfg, sender=None, logger=No
         >>> sendMail_SMTP(subject, message, recipients, smtp_cfg)
 
     """
-    import email
-    import smtplib
-
     host = smtp_cfg.get("server", None)
     if host is None:
         raise MailerError("must define an SMTP host to be used")
-    port = smtp_cfg.get("port", None)
     username = smtp_cfg.get("user", None)
     if username is None:
         raise MailerError("must define a username for the SMTP server")
     if sender is None:
         sender = username
-    password = smtp_cfg.get("password", None)
     connection_security = smtp_cfg.get("connection_security", None)
     if connection_security not in (None, "STARTTLS"):
         msg = "connection_security must be: STARTTLS or not defined, found: "
         raise MailerError(msg + connection_security)
 
-    msg = email.message.Message()
-    if isinstance(recipients, str):
-        msg["To"] = recipients
-    else:
-        for who in recipients:
-            msg["To"] = who
-    msg["From"] = sender
-    msg["Subject"] = subject
-    msg.set_payload(message)
+    msg = _compose(subject, message, recipients, sender)
 
     if logger is not None:
         logger("sending email to: " + str(recipients))
@@ -174,6 +336,18 @@ def sendMail_SMTP(subject, message, recipients, smtp_cfg, sender=None, logger=No
         logger("SMTP user: " + username)
         logger("email From: " + sender)
 
+    smtp_pool.sendmail(smtp_cfg, username, recipients, msg, logger=logger)
+    if logger is not None:
+        logger("SMTP complete")
+
+
+def _smtp_connect(smtp_cfg, logger=None):
+    """open a new (authenticated) connection to the SMTP server"""
+    host = smtp_cfg["server"]
+    port = smtp_cfg.get("port", None)
+    password = smtp_cfg.get("password", None)
+
+    t0 = time.perf_counter()
     smtpserver = smtplib.SMTP(timeout=SMTP_TIMEOUT)
     # smtpserver.set_debuglevel(1)
     if port is None:
@@ -191,17 +365,147 @@ def sendMail_SMTP(subject, message, recipients, smtp_cfg, sender=None, logger=No
             logger("SMTP STARTTLS")
 
     if password is not None:
-        smtpserver.login(username, password)
+        smtpserver.login(smtp_cfg["user"], password)
         if logger is not None:
             logger("SMTP authenticated")
+    metrics.smtp_connect.observe(time.perf_counter() - t0)
+    return smtpserver
 
-    smtpserver.sendmail(username, recipients, str(msg))
-    smtpserver.close()
-    if logger is not None:
-        logger("SMTP complete")
 
+class SMTPConnectionPool(object):
+    """
+    Keep authenticated SMTP connections open for reuse.
+
+    Connections are kept per SMTP configuration (server, port, user and
+    credentials).  An idle connection is checked with NOOP before it is
+    reused and replaced if the server has dropped it.  Connections idle
+    for longer than *idle_timeout* seconds are closed.
 
-def send_message(subject, message, recipients, config):
+    :param float idle_timeout: close connections idle this long (s)
+    :param int max_idle: most idle connections kept per configuration
+    """
+
+    def __init__(self, idle_timeout=SMTP_IDLE_TIMEOUT, max_idle=SMTP_MAX_IDLE):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self._idle = {}  # key: [(release_time, connection), ...]
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    @staticmethod
+    def _key(smtp_cfg):
+        return tuple(
+            smtp_cfg.get(k)
+            for k in ("server", "port", "user", "password", "connection_security")
+        )
+
+    def acquire(self, smtp_cfg, logger=None):
+        """return a live connection for this configuration"""
+        key = self._key(smtp_cfg)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                _t, smtpserver = idle.pop()
+            try:
+                if smtpserver.noop()[0] == 250:
+                    if logger is not None:
+                        logger("SMTP connection reused")
+                    return smtpserver
+            except Exception:
+                pass
+            _close(smtpserver)  # stale
+        return _smtp_connect(smtp_cfg, logger=logger)
+
+    def release(self, smtp_cfg, smtpserver):
+        """return a connection to the pool for reuse"""
+        key = self._key(smtp_cfg)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((time.monotonic(), smtpserver))
+                smtpserver = None
+            if self._reaper is None:
+                self._reaper = threading.Timer(self.idle_timeout, self._reap)
+                self._reaper.daemon = True
+                self._reaper.start()
+        if smtpserver is not None:
+            _close(smtpserver)
+
+    def sendmail(self, smtp_cfg, from_addr, recipients, msg, logger=None):
+        """
+        send one message on a pooled connection
+
+        A dropped connection is replaced only before the transaction
+        (see :meth:`acquire`).  Once MAIL FROM is sent, the message is
+        not sent again: the server may have accepted it before the
+        connection was lost.  If the sender, the recipients or the
+        message are refused, the session is reset (RSET) and kept.
+        """
+        smtpserver = self.acquire(smtp_cfg, logger=logger)
+        try:
+            t0 = time.perf_counter()
+            result = smtpserver.sendmail(from_addr, recipients, msg)
+            metrics.smtp_transaction.observe(time.perf_counter() - t0)
+        except SMTP_REFUSED:
+            try:
+                smtpserver.rset()
+            except Exception:
+                _close(smtpserver)
+            else:
+                self.release(smtp_cfg, smtpserver)
+            raise
+        except Exception:
+            _close(smtpserver)
+            raise
+        self.release(smtp_cfg, smtpserver)
+        return result
+
+    def _reap(self):
+        """close connections that have been idle too long"""
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            for key, idle in list(self._idle.items()):
+                keep = [(t, c) for t, c in idle if now - t < self.idle_timeout]
+                expired += [c for t, c in idle if now - t >= self.idle_timeout]
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+            self._reaper = None
+            if self._idle:
+                self._reaper = threading.Timer(self.idle_timeout, self._reap)
+                self._reaper.daemon = True
+                self._reaper.start()
+        for smtpserver in expired:
+            _close(smtpserver)
+
+    def close(self):
+        """close all idle connections"""
+        with self._lock:
+            connections = [c for idle in self._idle.values() for _t, c in idle]
+            self._idle.clear()
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+        for smtpserver in connections:
+            _close(smtpserver)
+
+
+def _close(smtpserver):
+    """end an SMTP session, ignore errors"""
+    try:
+        smtpserver.quit()
+    except Exception:
+        smtpserver.close()
+
+
+smtp_pool = SMTPConnectionPool()
+
+
+def send_message(subject, message, recipients, config, logger=None):
     """
     send an email message
 
@@ -209,10 +513,165 @@ def send_message(subject, message, recipients, config):
     :param str message: full text of email body
     :param [str] recipients: list of email addresses to receive the message
     :param dict config: such as returned from :mod:`PvMail.ini_config.Config`
+    :param obj logger: optional message logging method
     """
     email_agent_dict = dict(sendmail=sendMail_sendmail, SMTP=sendMail_SMTP)
     agent = email_agent_dict[config.mail_transfer_agent]
-    agent(subject, message, recipients, config.get())
+    agent(subject, message, recipients, config.get(), logger=logger)
+
+
+def send_many(messages, config, logger=None):
+    """
+    send many email messages, return the result for each recipient
+
+    Messages with the same sender are sent together on one connection,
+    with that sender in the From header and as the envelope sender (SMTP
+    ``MAIL FROM``, default: ``config.get()["user"]``).  With SMTP, if the
+    server advertises PIPELINING, the commands of each transaction are
+    sent without waiting for each reply.  Long recipient lists are split
+    into transactions of at most SMTP_MAX_RECIPIENTS (or the server's
+    RCPTMAX limit, or fewer if the server answers 452).
+
+    :param [tuple] messages: (subject, message, recipients[, sender]) for each email
+    :param dict config: such as returned from :mod:`PvMail.ini_config.Config`
+    :param obj logger: optional message logging method
+    :returns: for each message, a dictionary of ``{recipient: (code, reply)}``,
+        code is 250 if accepted (*None* if the message could not be sent)
+    """
+    messages = [
+        (m[0], m[1], [m[2]] if isinstance(m[2], str) else list(m[2])) + tuple(m[3:])
+        for m in messages
+    ]
+    cfg = config.get()
+    by_sender = {}
+    for i, m in enumerate(messages):
+        sender = m[3] if len(m) > 3 else cfg["user"]
+        by_sender.setdefault(sender, []).append(i)
+
+    results = [{} for _ in messages]
+    if config.mail_transfer_agent == "sendmail":
+        for sender, indexes in by_sender.items():
+            batch = [messages[i][:3] for i in indexes]
+            status = sendMail_sendmail_batch(batch, cfg, sender=sender, logger=logger)
+            for i, exc in zip(indexes, status):
+                reply = (250, b"OK") if exc is None else (None, str(exc))
+                results[i] = {who: reply for who in messages[i][2]}
+        return results
+
+    smtpserver = None
+    try:
+        for sender, indexes in by_sender.items():
+            for i in indexes:
+                subject, message, recipients = messages[i][:3]
+                data = _crlf_bytes(_compose(subject, message, recipients, sender))
+                try:
+                    if smtpserver is None:
+                        smtpserver = smtp_pool.acquire(cfg, logger=logger)
+                    results[i] = _send_transactions(
+                        smtpserver, sender, recipients, data
+                    )
+                except (smtplib.SMTPException, OSError) as exc:
+                    if smtpserver is not None:
+                        _close(smtpserver)
+                        smtpserver = None
+                    for who in recipients:
+                        results[i].setdefault(who, (None, str(exc)))
+    finally:
+        if smtpserver is not None:
+            smtp_pool.release(cfg, smtpserver)
+
+    if logger is not None:
+        n = sum(1 for r in results for code, _ in r.values() if code == 250)
+        logger(f"send_many: {len(messages)} message(s), {n} recipient(s) accepted")
+    return results
+
+
+def _rcpt_limit(smtpserver):
+    """most recipients per transaction for this server"""
+    limits = smtpserver.esmtp_features.get("limits", "")
+    match = re.search(r"RCPTMAX=(\d+)", limits, re.IGNORECASE)
+    if match is not None:
+        return max(1, min(SMTP_MAX_RECIPIENTS, int(match.group(1))))
+    return SMTP_MAX_RECIPIENTS
+
+
+def _send_transactions(smtpserver, from_addr, recipients, data):
+    """send ``data`` to all ``recipients`` in as many transactions as needed"""
+    smtpserver.ehlo_or_helo_if_needed()
+    limit = _rcpt_limit(smtpserver)
+    if smtpserver.does_esmtp and smtpserver.has_extn("pipelining"):
+        transaction = _pipelined_transaction
+    else:
+        transaction = _lockstep_transaction
+
+    results = {}
+    pending = list(recipients)
+    while pending:
+        chunk, pending = pending[:limit], pending[limit:]
+        t0 = time.perf_counter()
+        replies = transaction(smtpserver, from_addr, chunk, data)
+        metrics.smtp_transaction.observe(time.perf_counter() - t0)
+        deferred = [who for who in chunk if replies[who][0] == 452]
+        if deferred and len(deferred) < len(chunk):
+            # server has a lower limit: send the rest in the next transaction
+            limit = len(chunk) - len(deferred)
+            pending = deferred + pending
+            chunk = [who for who in chunk if who not in deferred]
+        results.update({who: replies[who] for who in chunk})
+    return results
+
+
+def _lockstep_transaction(smtpserver, from_addr, chunk, data):
+    """one SMTP transaction, waiting for the reply to each command"""
+    code, resp = smtpserver.mail(from_addr)
+    if code != 250:
+        smtpserver.rset()
+        return {who: (code, resp) for who in chunk}
+    replies = {who: smtpserver.rcpt(who) for who in chunk}
+    accepted = [who for who in chunk if replies[who][0] in (250, 251)]
+    if not accepted:
+        smtpserver.rset()
+        return replies
+    try:
+        final = smtpserver.data(data)
+    except smtplib.SMTPDataError as exc:
+        smtpserver.rset()
+        final = (exc.smtp_code, exc.smtp_error)
+    replies.update({who: final for who in accepted})
+    return replies
+
+
+def _pipelined_transaction(smtpserver, from_addr, chunk, data):
+    """one SMTP transaction, MAIL, RCPT and DATA sent together (RFC 2920)"""
+    commands = ["MAIL FROM:%s" % smtplib.quoteaddr(from_addr)]
+    commands += ["RCPT TO:%s" % smtplib.quoteaddr(who) for who in chunk]
+    commands.append("DATA")
+    smtpserver.send("\r\n".join(commands) + "\r\n")
+
+    mail_reply = smtpserver.getreply()
+    replies = {who: smtpserver.getreply() for who in chunk}
+    data_reply = smtpserver.getreply()
+
+    if mail_reply[0] != 250:
+        replies = {who: mail_reply for who in chunk}
+    accepted = [who for who in chunk if replies[who][0] in (250, 251)]
+    if data_reply[0] == 354:
+        if accepted:
+            body = re.sub(rb"(?m)^\.", b"..", data)
+            if not body.endswith(b"\r\n"):
+                body += b"\r\n"
+            smtpserver.send(body + b".\r\n")
+            final = smtpserver.getreply()
+        else:
+            smtpserver.send(b".\r\n")  # end the empty message, then discard it
+            smtpserver.getreply()
+            smtpserver.rset()
+            final = data_reply
+    else:
+        final = data_reply
+        smtpserver.rset()
+    replies.update({who: final for who in accepted})
+    return replies
 
 
 def main():
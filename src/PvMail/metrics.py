@@ -0,0 +1,277 @@
+"""
+Counters, histograms and gauges, served over HTTP for Prometheus.
+
+Start the metrics endpoint with ``pvMail --metrics-port 9101``, then::
+
+    $ curl http://127.0.0.1:9101/metrics
+
+=====================================  =========  =====================================
+metric                                 type       counts or measures
+=====================================  =========  =====================================
+``pvmail_monitors_total{pv}``          counter    CA monitor updates, by PV role
+``pvmail_triggers_total``              counter    triggers (0 to 1 edges, or conditions)
+``pvmail_triggers_suppressed_total``   counter    triggers suppressed, by ``reason``
+``pvmail_emails_sent_total``           counter    emails handed to the mail agent
+``pvmail_emails_failed_total``         counter    emails the mail agent did not take
+``pvmail_send_dropped_total``          counter    emails dropped, send queue full
+``pvmail_send_latency_seconds``        histogram  trigger to email accepted
+``pvmail_smtp_connect_seconds``        histogram  open, secure and login to SMTP
+``pvmail_smtp_transaction_seconds``    histogram  MAIL, RCPT and DATA of one message
+``pvmail_pvs_connected``               gauge      connected PVs
+``pvmail_queue_depth``                 gauge      messages waiting to be sent
+``pvmail_history_bytes``               gauge      memory of the context PV histories
+=====================================  =========  =====================================
+
+Counters are incremented without a lock (about 0.1 microsecond), so a
+CA monitor callback is not slowed down.  Two threads incrementing at
+the very same moment might, rarely, lose a count.  Histograms, updated
+once per email, take a lock.  Gauges are computed only when the
+endpoint is read.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import bisect
+import threading
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{k}="{v}"' for k, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """
+    Count that only goes up.
+
+    :param str name: metric name
+    :param str help: one line description
+    :param [str] labelnames: label names, use :meth:`labels` to get
+        the counter for one set of label values
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.value = 0
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def inc(self, amount=1):
+        self.value += amount  # no lock: cheap enough for a CA callback
+
+    def labels(self, *values):
+        """return the counter for these label values (created if needed)"""
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = Counter(self.name, self.help)
+            return child
+
+    def samples(self):
+        """yield (name, labels, value) for the text format"""
+        if not self.labelnames:
+            yield self.name, "", self.value
+        for values, child in sorted(self._children.items()):
+            yield self.name, _labels(self.labelnames, values), child.value
+
+
+class Gauge(object):
+    """
+    Value read when the metrics are collected.
+
+    :param str name: metric name
+    :param str help: one line description
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._function = None
+
+    def set_function(self, function):
+        """``function()`` returns the value, *None* to report nothing"""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            yield self.name, "", self._function()
+
+
+class Histogram(object):
+    """
+    Distribution of observed values (such as durations, in seconds).
+
+    :param str name: metric name
+    :param str help: one line description
+    :param [float] buckets: upper bounds of the buckets, in increasing order
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last: +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = _number(float(bound))
+            yield f"{self.name}_bucket", f'{{le="{le}"}}', cumulative
+        yield f"{self.name}_sum", "", total
+        yield f"{self.name}_count", "", cumulative
+
+
+class Registry(object):
+    """Collection of metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """return the text exposition of all metrics"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if value is not None:
+                    lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+monitors = REGISTRY.register(
+    Counter("pvmail_monitors_total", "CA monitor updates received", ["pv"])
+)
+trigger_monitors = monitors.labels("trigger")
+message_monitors = monitors.labels("message")
+input_monitors = monitors.labels("input")
+triggers = REGISTRY.register(
+    Counter("pvmail_triggers_total", "triggers (0 to 1 edges, or conditions)")
+)
+suppressed = REGISTRY.register(
+    Counter(
+        "pvmail_triggers_suppressed_total", "triggers suppressed by policy", ["reason"]
+    )
+)
+emails_sent = REGISTRY.register(
+    Counter("pvmail_emails_sent_total", "emails handed to the mail agent")
+)
+emails_failed = REGISTRY.register(
+    Counter("pvmail_emails_failed_total", "emails the mail agent did not take")
+)
+send_dropped = REGISTRY.register(
+    Counter("pvmail_send_dropped_total", "emails dropped, send queue full")
+)
+send_latency = REGISTRY.register(
+    Histogram("pvmail_send_latency_seconds", "time from trigger to email accepted")
+)
+smtp_connect = REGISTRY.register(
+    Histogram("pvmail_smtp_connect_seconds", "time to connect and login to SMTP")
+)
+smtp_transaction = REGISTRY.register(
+    Histogram("pvmail_smtp_transaction_seconds", "time to send one SMTP message")
+)
+pvs_connected = REGISTRY.register(Gauge("pvmail_pvs_connected", "connected PVs"))
+queue_depth = REGISTRY.register(
+    Gauge("pvmail_queue_depth", "messages waiting to be sent")
+)
+history_bytes = REGISTRY.register(
+    Gauge("pvmail_history_bytes", "bytes used by context PV histories")
+)
+
+
+def _make_server(address):
+    """the HTTP server (http.server is imported only if metrics are served)"""
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # not every scrape in the pvMail log
+
+    class Server(http.server.ThreadingHTTPServer):
+        daemon_threads = True
+
+    return Server(address, MetricsHandler)
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    serve the metrics (in a background thread), return the server
+
+    Call ``server.shutdown()`` to stop.  Use ``port=0`` for any free
+    port, then read ``server.server_address``.
+    """
+    server = _make_server((host, port))
+    server.registry = registry
+    thread = threading.Thread(
+        target=server.serve_forever, name="pvMail-metrics", daemon=True
+    )
+    thread.start()
+    return server
@@ -0,0 +1,139 @@
+"""
+Rate control for a flapping trigger PV.
+
+A :class:`SendPolicy` decides, for each trigger of one watch, if an
+email is sent.  It is evaluated in the EPICS monitor callback, so it
+only does a few arithmetic operations and dictionary lookups.
+
+=================  ================================================================
+rule               a trigger is suppressed if ...
+=================  ================================================================
+rearm_interval     it comes less than *rearm_interval* s after the last email
+rate_limit         no token is left in a bucket refilled at *rate_limit* emails
+                   per minute, holding up to *rate_burst* tokens
+suppress_window    an email with the same message was sent within the last
+                   *suppress_window* s
+=================  ================================================================
+
+The number of suppressed triggers is reported in the next email sent.
+
+In a watch table (see :mod:`PvMail.watches`), these are set at the top
+level (for all watches) or for each watch::
+
+    rearm_interval = 1
+    rate_limit = 6
+    rate_burst = 3
+    suppress_window = 600
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import time
+
+from . import metrics
+
+POLICY_KEYS = "rearm_interval rate_limit rate_burst suppress_window".split()
+MAX_MESSAGE_HASHES = 256
+
+
+class SendPolicy(object):
+    """
+    Per-watch debounce, rate limit and duplicate-message suppression.
+
+    :param float rearm_interval: minimum time (s) between emails, 0: none
+    :param float rate_limit: emails per minute, 0: no limit
+    :param int rate_burst: most emails sent at once within the rate limit
+    :param float suppress_window: time (s) to suppress a repeated message, 0: none
+    :param obj clock: returns the time (s), for replay in virtual time
+    """
+
+    def __init__(
+        self,
+        rearm_interval=0,
+        rate_limit=0,
+        rate_burst=1,
+        suppress_window=0,
+        clock=time.monotonic,
+    ):
+        self.clock = clock
+        self.rearm_interval = rearm_interval
+        self.rate = rate_limit / 60.0  # tokens per second
+        self.burst = max(1, rate_burst)
+        self.suppress_window = suppress_window
+
+        self.suppressed = 0  # since the last email sent
+        self.counts = dict(rearm=0, rate=0, duplicate=0)
+        self._last_sent = None
+        self._tokens = float(self.burst)
+        self._tokens_time = None
+        self._sent = {}  # hash(message): time sent
+
+    def apply(self, event, now=None):
+        """
+        return ``event`` (with the count of suppressed triggers) or *None*
+
+        :param obj event: :class:`~PvMail.trigger.TriggerEvent`
+        :param float now: time (s, from ``clock``), for testing
+        """
+        if now is None:
+            now = self.clock()
+        reason = self._check(event, now)
+        if reason is not None:
+            self.suppressed += 1
+            self.counts[reason] += 1
+            metrics.suppressed.labels(reason).inc()
+            return None
+        if self.suppressed:
+            event = event._replace(suppressed=self.suppressed)
+            self.suppressed = 0
+        return event
+
+    def _check(self, event, now):
+        """return the reason to suppress this trigger, or *None*"""
+        last = self._last_sent
+        if self.rearm_interval and last is not None:
+            if now - last < self.rearm_interval:
+                return "rearm"
+
+        if self.suppress_window:
+            key = hash(str(event.message))
+            sent = self._sent.get(key)
+            if sent is not None and now - sent < self.suppress_window:
+                return "duplicate"
+
+        if self.rate:
+            if self._tokens_time is not None:
+                elapsed = now - self._tokens_time
+                self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._tokens_time = now
+            if self._tokens < 1:
+                return "rate"
+            self._tokens -= 1
+
+        if self.suppress_window:
+            if len(self._sent) >= MAX_MESSAGE_HASHES:
+                self._forget(now)
+            self._sent[key] = now
+        self._last_sent = now
+        return None
+
+    def _forget(self, now):
+        """drop message hashes older than the suppression window"""
+        window = self.suppress_window
+        self._sent = {k: t for k, t in self._sent.items() if now - t < window}
+        while len(self._sent) >= MAX_MESSAGE_HASHES:  # all recent: drop oldest
+            del self._sent[min(self._sent, key=self._sent.get)]
+
+
+def from_settings(settings, defaults=None):
+    """
+    return a :class:`SendPolicy` from a dictionary (such as a watch table entry)
+
+    Returns *None* if no policy keys are given.
+    """
+    kwargs = {}
+    for source in (defaults or {}, settings):
+        kwargs.update({k: source[k] for k in POLICY_KEYS if k in source})
+    if not kwargs:
+        return None
+    return SendPolicy(**kwargs)
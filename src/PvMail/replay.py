@@ -0,0 +1,276 @@
+"""
+Replay recorded monitor updates to see what pvMail would have sent.
+
+The updates are read from ``camonitor`` output or from a CSV file and
+fed, in time order, to the same trigger logic used with live PVs
+(:meth:`PvMail.cli.PvMail.receiveTriggerMonitor`).  Time is virtual:
+it is the recorded timestamp of each update, so re-arm intervals, rate
+limits (:mod:`PvMail.policy`) and digest windows (:mod:`PvMail.digest`)
+behave as they would have, but the replay runs as fast as the updates
+can be processed.  No EPICS connection is made and no email is sent.
+
+``camonitor`` output, one update per line::
+
+    pvMail:trigger                 2024-03-01 12:00:00.123456 1
+    pvMail:message                 2024-03-01 12:00:00.100000 beam dump
+
+CSV file, with a header row naming the columns ``time``, ``pv`` and
+``value``.  The time is either UNIX seconds or an ISO 8601 date.  A
+date without a time zone is local time, as in ``camonitor`` output::
+
+    time,pv,value
+    1709316000.123456,pvMail:trigger,1
+
+Replay with the watches of a watch table, or a single trigger/message
+PV pair, such as::
+
+    $ pvMail --replay run.camonitor --watches watches.toml
+    $ pvMail --replay run.csv pvMail:trigger pvMail:message joe@example.org
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import collections
+import csv
+import datetime
+import re
+import time
+
+from . import digest
+from . import rules
+from . import watches
+
+Sample = collections.namedtuple("Sample", "time pvname value")
+
+
+def _parse_time(text):
+    """UNIX time (s) of a timestamp: seconds or an ISO 8601 date"""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    text = text.strip().replace("T", " ")
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    # fromisoformat() needs 6 digits for the fraction of a second
+    text = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), text)
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def _parse_value(text):
+    """number if the text is numeric, otherwise the text"""
+    text = text.strip()
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def read_camonitor(filename):
+    """
+    return list of :data:`Sample` from ``camonitor`` output
+
+    Lines that are not updates (such as ``*** disconnected``) are skipped.
+    """
+    samples = []
+    with open(filename) as fp:
+        for line in fp:
+            parts = line.split(None, 3)
+            if len(parts) < 3 or parts[-1].startswith("***"):
+                continue
+            pvname, date, clock = parts[:3]
+            value = parts[3] if len(parts) == 4 else ""
+            try:
+                t = _parse_time(f"{date} {clock}")
+            except ValueError:
+                continue  # such as <undefined> timestamp
+            samples.append(Sample(t, pvname, _parse_value(value)))
+    return samples
+
+
+def read_csv(filename):
+    """return list of :data:`Sample` from a CSV file with time, pv, value columns"""
+    samples = []
+    with open(filename, newline="") as fp:
+        for row in csv.DictReader(fp):
+            t = _parse_time(row["time"])
+            samples.append(Sample(t, row["pv"], _parse_value(row["value"])))
+    return samples
+
+
+def read_samples(filenames):
+    """return :data:`Sample` from all files, in time order"""
+    samples = []
+    for filename in filenames:
+        if filename.lower().endswith(".csv"):
+            samples += read_csv(filename)
+        else:
+            samples += read_camonitor(filename)
+    samples.sort(key=lambda sample: sample.time)  # stable: same time keeps order
+    return samples
+
+
+class VirtualClock(object):
+    """time (s) that only moves when the replay advances it"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ReplayWatch(watches.Watch):
+    """A :class:`~PvMail.watches.Watch` fed from recorded updates."""
+
+    def __init__(self, engine, *args, **kwargs):
+        super().__init__(engine, *args, **kwargs)
+        self.message_seen = False
+        if self.policy is not None:
+            self.policy.clock = engine.clock
+
+    def receiveMessageMonitor(self, value, **kw):
+        self.message_seen = True
+        super().receiveMessageMonitor(value, **kw)
+
+    def snapshot(self, value=None):
+        event = super().snapshot(value)
+        return event._replace(time=self.engine.clock(), connected=self.message_seen)
+
+
+class ReplayEngine(watches.WatchEngine):
+    """
+    Replay recorded updates through the watches, in virtual time.
+
+    Each email that would have been sent is kept in :attr:`sent` as
+    (time, list of :class:`~PvMail.trigger.TriggerEvent`).
+
+    :param obj config: email configuration from ini_config.Config()
+    """
+
+    def __init__(self, config=None, watch_class=ReplayWatch):
+        self.clock = VirtualClock()
+        self.sent = []
+        self.triggers = 0
+        super().__init__(config, watch_class=watch_class)
+
+    def _make_pool(self, workers):
+        return None  # nothing is sent
+
+    def _make_coalescer(self, window, max_delay):
+        return digest.Coalescer(
+            self._send_digest,
+            window=window,
+            max_delay=max_delay,
+            clock=self.clock,
+            start=False,
+        )
+
+    def dispatch(self, watch, event):
+        self.triggers += 1
+        super().dispatch(watch, event)
+
+    def send_event(self, watch, event):
+        self.sent.append((self.clock.now, [event]))
+
+    def _send_digest(self, events, watches):
+        self.sent.append((self.clock.now, events))
+
+    def _advance(self, now):
+        """move the clock to ``now``, sending the digests due by then"""
+        for coalescer in self.coalescers.values():
+            if coalescer is None:
+                continue
+            while True:
+                deadline = coalescer.next_deadline()
+                if deadline is None or deadline > now:
+                    break
+                self.clock.now = max(self.clock.now, deadline)
+                for events, due_watches in coalescer.take_due():
+                    self._send_digest(events, due_watches)
+        self.clock.now = max(self.clock.now, now)
+
+    def replay(self, samples):
+        """
+        feed ``samples`` (in time order) to the watches, return a report
+
+        The report is a dictionary of counts and rates, see :func:`report`.
+        """
+        triggers, messages = {}, {}
+        inputs = rules.RuleIndex()
+        for watch in self.watches:
+            triggers.setdefault(watch.triggerPV, []).append(watch)
+            messages.setdefault(watch.messagePV, []).append(watch)
+            if watch.condition is not None:
+                pvnames = list(watch.condition.inputs.values())
+                inputs.add(watch.condition, [None] + pvnames, watch.condition_fired)
+            watch.running = True
+
+        t0 = time.perf_counter()
+        n = 0
+        for n, sample in enumerate(samples, start=1):
+            self._advance(sample.time)
+            for watch in messages.get(sample.pvname, ()):
+                watch.receiveMessageMonitor(value=sample.value)
+            inputs.update(sample.pvname, sample.value, timestamp=sample.time)
+            for watch in triggers.get(sample.pvname, ()):
+                watch.receiveTriggerMonitor(value=sample.value, timestamp=sample.time)
+        for coalescer in self.coalescers.values():  # digests held at the end
+            while coalescer is not None and coalescer.next_deadline() is not None:
+                self._advance(coalescer.next_deadline())
+        elapsed = time.perf_counter() - t0
+        for watch in self.watches:
+            watch.running = False
+
+        if n == 0:
+            return report(self, 0, None, None, elapsed)
+        return report(self, n, samples[0].time, samples[-1].time, elapsed)
+
+
+def report(engine, n_samples, first, last, elapsed):
+    """summarize a replay as a dictionary"""
+    suppressed = dict(rearm=0, rate=0, duplicate=0)
+    for watch in engine.watches:
+        if watch.policy is not None:
+            for reason, count in watch.policy.counts.items():
+                suppressed[reason] += count
+    digests = [events for _t, events in engine.sent if len(events) > 1]
+    duration = 0 if first is None else last - first
+    return dict(
+        samples=n_samples,
+        first=first,
+        last=last,
+        duration_s=duration,
+        triggers=engine.triggers + sum(suppressed.values()),
+        suppressed=suppressed,
+        emails=len(engine.sent),
+        digests=len(digests),
+        coalesced=sum(len(events) for events in digests),
+        elapsed_s=elapsed,
+        samples_per_s=n_samples / elapsed if elapsed else 0,
+        speedup=duration / elapsed if elapsed else 0,
+    )
+
+
+def print_report(result, engine=None):
+    """print the report of a replay, then each email if ``engine`` is given"""
+    if engine is not None:
+        for t, events in engine.sent:
+            when = datetime.datetime.fromtimestamp(t)
+            pvs = ", ".join(event.triggerPV for event in events)
+            print(f"{when}  {len(events):>4} trigger(s)  {pvs}")
+        print()
+    if result["first"] is not None:
+        for key in ("first", "last"):
+            print(f"{key:>12}: {datetime.datetime.fromtimestamp(result[key])}")
+    print(f"{'samples':>12}: {result['samples']}")
+    print(f"{'triggers':>12}: {result['triggers']}")
+    for reason, count in result["suppressed"].items():
+        print(f"{'suppressed':>12}: {count} ({reason})")
+    print(f"{'emails':>12}: {result['emails']}")
+    print(f"{'digests':>12}: {result['digests']} ({result['coalesced']} triggers)")
+    print(f"{'replay time':>12}: {result['elapsed_s']:.3f} s")
+    print(f"{'throughput':>12}: {result['samples_per_s']:.0f} samples/s")
+    print(f"{'speedup':>12}: {result['speedup']:.0f} x real time")
@@ -0,0 +1,128 @@
+"""
+Evaluate only the conditions that use the PV that changed.
+
+Many watches may have conditions (see :mod:`PvMail.condition`) on the
+same input PVs, such as a beam or shutter status used by all of them.
+A :class:`RuleIndex` is an inverted index from each PV name to the
+conditions that use it.  A monitor update of a PV updates only those
+conditions, each with its own latest values of its other PVs, instead
+of evaluating all conditions again::
+
+    index = RuleIndex()
+    index.add(condition, ["ioc:pressure", "ioc:beam"], fire)
+    index.update("ioc:beam", 1)     # evaluates only the conditions on ioc:beam
+
+:class:`~PvMail.watches.WatchEngine` keeps one index for the input PVs
+of all its watches, so each input PV is monitored once (one channel,
+one callback), whatever the number of watches that use it.  Compare
+with evaluating every condition on every update::
+
+    $ python -m PvMail.benchmarks.rules --rules 10000 --pvs 20000
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+from . import logs
+from . import metrics
+
+
+class RuleIndex(object):
+    """
+    Inverted index: PV name to the conditions (rules) that use it.
+
+    :attr:`rules` is {pvname: [(Condition, PV index in the condition, fire)]}.
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self.n_rules = 0
+        self.pv = {}  # pvname: PV object, if monitored by this index
+        self.pv_cb_index = {}
+
+    def __len__(self):
+        return self.n_rules
+
+    def add(self, condition, pvnames, fire):
+        """
+        index a :class:`~PvMail.condition.Condition`
+
+        :param obj condition: the condition
+        :param [str] pvnames: PV name of each of its PVs, in order (the
+            trigger PV first), *None* for a PV not updated by this index
+        :param obj fire: ``fire(**kw)`` is called when an update by this
+            index makes the condition true, ``kw`` as given to :meth:`update`
+        """
+        for index, pvname in enumerate(pvnames):
+            if pvname is not None:
+                self.rules.setdefault(pvname, []).append((condition, index, fire))
+        self.n_rules += 1
+
+    def pvnames(self):
+        """names of all the PVs used by the conditions"""
+        return list(self.rules)
+
+    def update(self, pvname, value, severity=None, status=None, **kw):
+        """
+        new value of ``pvname``: update its conditions, return how many triggered
+
+        Other keyword arguments (such as ``timestamp``) are passed to ``fire``.
+        """
+        triggered = 0
+        for condition, index, fire in self.rules.get(pvname, ()):
+            if condition.update(index, value, severity, status):
+                fire(**kw)
+                triggered += 1
+        return triggered
+
+    def make_pvs(self, make_pv):
+        """create the PVs (if not created yet) with ``make_pv(pvname)``, return them"""
+        for pvname in self.rules:
+            if self.pv.get(pvname) is None:
+                self.pv[pvname] = make_pv(pvname)
+        return list(self.pv.values())
+
+    def get(self, pvname):
+        """return (value, severity) of a PV of this index, (None, None) if not known"""
+        pv = self.pv.get(pvname)
+        if pv is None or not pv.connected:
+            return None, None
+        return pv.get(), getattr(pv, "severity", None)
+
+    def start(self):
+        """update the conditions from the monitors of the PVs"""
+        for pvname, pv in self.pv.items():
+            if pvname not in self.pv_cb_index:
+                callback = self._callback(pvname)
+                self.pv_cb_index[pvname] = pv.add_callback(callback)
+
+    def _callback(self, pvname):
+        update = self.update
+
+        def receive(value=None, severity=None, status=None, **kw):
+            metrics.input_monitors.inc()
+            logs.info("%s = %s", pvname, value)
+            kw.pop("pvname", None)
+            update(pvname, value, severity, status, **kw)
+
+        return receive
+
+    def stop(self):
+        """stop the monitors, disconnect the PVs"""
+        for pvname, pv in self.pv.items():
+            index = self.pv_cb_index.pop(pvname, None)
+            if index is not None:
+                pv.remove_callback(index)
+            pv.disconnect()
+        self.pv = {}
+
+    def connected(self):
+        """number of connected PVs"""
+        return sum(1 for pv in self.pv.values() if pv.connected)
+
+    def summary(self):
+        """one line report: conditions, PVs, PVs used by more than one condition"""
+        shared = sum(1 for rules in self.rules.values() if len(rules) > 1)
+        return (
+            f"{self.n_rules} condition(s) on {len(self.rules)} input PV(s),"
+            f" {shared} used by more than one"
+        )
@@ -0,0 +1,203 @@
+"""
+Durable outbound spool: messages are written to disk before sending.
+
+When a spool is used (``pvMail --spool DIR``), each rendered email is
+written to a file in the spool directory, then delivered by a
+background thread.  A file is deleted only after the mail transfer
+agent accepts the message.  If sending fails, the deliverer retries
+with exponential backoff.  Messages left in the spool (such as when
+the mail server was down at exit) are sent when pvMail starts again.
+
+The spool directory is laid out like a maildir:
+
+==========  ================================================================
+directory   contents
+==========  ================================================================
+``tmp/``    messages being written (removed at startup)
+``new/``    messages waiting to be sent, oldest first
+``failed/`` messages refused permanently by the mail server, or that
+            cannot be read (such as a truncated file)
+==========  ================================================================
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import collections
+import itertools
+import json
+import os
+import smtplib
+import threading
+import time
+
+from . import ini_config
+from . import mailer
+
+BACKOFF_INITIAL_S = 1.0
+BACKOFF_MAX_S = 300.0
+
+_counter = itertools.count()
+
+
+def _is_permanent(exc):
+    """Was the message refused permanently (SMTP 5xx)?"""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _msg in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code >= 500
+    return False
+
+
+def _fsync_dir(path):
+    """make the latest changes of directory ``path`` durable"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Spool(object):
+    """
+    Directory of messages waiting to be sent.
+
+    :param str directory: spool directory (created if needed)
+    :param bool fsync: if True, each message is on disk before :meth:`put` returns
+    :param obj logger: optional message logging method
+    """
+
+    def __init__(self, directory, fsync=True, logger=None):
+        self.directory = os.path.abspath(directory)
+        self.fsync = fsync
+        self.logger = logger
+        for subdir in ("tmp", "new", "failed"):
+            os.makedirs(os.path.join(self.directory, subdir), exist_ok=True)
+        tmp = os.path.join(self.directory, "tmp")
+        for name in os.listdir(tmp):  # incomplete writes
+            os.remove(os.path.join(tmp, name))
+
+        self.sent = 0
+        self.failures = 0
+        self.running = False
+        self._queue = collections.deque(sorted(os.listdir(self._path("new"))))
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _path(self, subdir, name=""):
+        return os.path.join(self.directory, subdir, name)
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger(message)
+
+    def put(self, subject, message, recipients):
+        """write a message to the spool, return its file name"""
+        name = "%020d.%d.%06d.json" % (time.time_ns(), os.getpid(), next(_counter))
+        entry = dict(subject=subject, message=message, recipients=list(recipients))
+        tmp = self._path("tmp", name)
+        with open(tmp, "w") as fp:
+            json.dump(entry, fp)
+            if self.fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        os.rename(tmp, self._path("new", name))
+        if self.fsync:
+            _fsync_dir(self._path("new"))
+        with self._cond:
+            self._queue.append(name)
+            self._cond.notify()
+        return name
+
+    def emailer(self, subject, message, recipients, cfg=None, logger=None):
+        """spool the message, same signature as :func:`PvMail.mailer.sendMail_SMTP`"""
+        name = self.put(subject, message, recipients)
+        if logger is not None:
+            logger(f"message spooled: {name}")
+
+    def start(self, agent_db):
+        """
+        start delivering spooled messages (in a background thread)
+
+        :param obj agent_db: email configuration from ini_config.Config()
+        """
+        self.running = True
+        self._thread = threading.Thread(
+            target=self._deliver, args=(agent_db,), name="pvMail-spool", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """stop delivering, messages not yet sent remain in the spool"""
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _deliver(self, agent_db):
+        backoff = 0
+        while True:
+            with self._cond:
+                if backoff:
+                    self._cond.wait_for(lambda: not self.running, backoff)
+                self._cond.wait_for(lambda: not self.running or self._queue)
+                if not self.running:
+                    return
+                name = self._queue[0]
+
+            try:
+                sent = self.send(name, agent_db)
+            except Exception as exc:
+                if _is_permanent(exc):
+                    self._fail(name, f"refused: {exc}")
+                else:
+                    self.failures += 1
+                    backoff = min(BACKOFF_MAX_S, 2 * backoff or BACKOFF_INITIAL_S)
+                    self._log(f"spool: {name} not sent ({exc}), retry in {backoff} s")
+                    continue
+            else:
+                self.sent += sent
+                backoff = 0
+            with self._cond:
+                self._queue.popleft()
+
+    def _fail(self, name, why):
+        """move a message that will never be sent to ``failed/``"""
+        try:
+            os.rename(self._path("new", name), self._path("failed", name))
+        except FileNotFoundError:
+            self._log(f"spool: {name} {why}, file is gone")
+            return
+        if self.fsync:
+            _fsync_dir(self._path("failed"))
+        self._log(f"spool: {name} {why}, moved to failed/")
+
+    def send(self, name, agent_db):
+        """
+        send one spooled message, remove it when the MTA accepts it
+
+        Returns *False* if the message cannot be read (it is moved to
+        ``failed/``), *True* once sent.
+        """
+        path = self._path("new", name)
+        try:
+            with open(path) as fp:
+                entry = json.load(fp)
+            subject, message = entry["subject"], entry["message"]
+            recipients = entry["recipients"]
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            self._fail(name, f"cannot be read ({exc!r})")
+            return False
+        mailer.send_message(
+            subject,
+            message,
+            recipients,
+            ini_config.snapshot(agent_db),
+            logger=self.logger,
+        )
+        os.remove(path)
+        return True
@@ -0,0 +1,278 @@
+"""
+Subject and body of the email, from templates compiled once.
+
+A template is text with ``{placeholders}``, as in :meth:`str.format`,
+with an optional format spec (``{value:.3f}``) or conversion
+(``{message!r}``).  Set the templates of a watch (or the default for
+all watches, at the top level) in the watch table::
+
+    subject = "pvMail: {triggerPV} = {value}"
+
+    [[watch]]
+    name = "shutter"
+    trigger_PV = "ioc:shutter:trip"
+    message_PV = "ioc:shutter:why"
+    body = \"\"\"
+    {message}
+
+    shutter tripped at {ca_date} (value {old_value} -> {value})
+    {host}: {program} (PID {pid})
+    \"\"\"
+
+=====================  ===============================================
+placeholder            value
+=====================  ===============================================
+``triggerPV``          name of the trigger PV
+``value``              new value of the trigger PV
+``old_value``          previous value of the trigger PV
+``messagePV``          name of the message PV
+``message``            value of the message PV at the trigger
+``connected``          message PV connected (True or False)
+``disconnected``       `` (disconnected)`` if not connected, else empty
+``date``               date and time the trigger was received
+``time``               same, as UNIX time (s)
+``ca_date``            CA timestamp of the trigger, as a date
+``ca_timestamp``       CA timestamp (whole seconds) or ``not available``
+``recipients``         email addresses, comma-separated
+``suppressed``         triggers suppressed since the last email
+``suppressed_note``    a line about them, empty if none
+``history``            context PV values before the trigger, empty if none
+``user``               user name, as in the default message
+``host``               host name
+``program``            program name
+``pid``                process ID
+=====================  ===============================================
+
+When a template is compiled, it is split into text and placeholders,
+and the placeholders that do not change while pvMail runs (``user``,
+``host``, ``program``, ``pid``) are replaced by their text.  Rendering
+a message only fills in the values of the trigger.
+
+A template is rendered once with :data:`SAMPLE_EVENT` when it is
+created, so a bad format spec (such as ``{time:%Q}``) is reported when
+the watch table is loaded.  A template that still cannot be rendered
+for a trigger (such as ``{value:.3f}`` of a string PV) is logged and
+the email is rendered with the default templates, it is not lost.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import datetime
+import functools
+import os
+import socket
+import string
+import sys
+
+from . import logs
+from .trigger import TriggerEvent
+
+DEFAULT_SUBJECT = "pvMail.py: {triggerPV}"
+DEFAULT_BODY = (
+    "\n\n{message}\n\n"
+    "user: {user}\n"
+    "host: {host}\n"
+    "date: {date} (UNIX, not PV)\n"
+    "CA_timestamp: {ca_timestamp}\n"
+    "program: {program}\n"
+    "PID: {pid}\n"
+    "trigger PV: {triggerPV}\n"
+    "message PV: {messagePV}{disconnected}\n"
+    "recipients: {recipients}\n"
+    "{suppressed_note}"
+    "{history}"
+)
+TEMPLATE_KEYS = ("subject", "body")
+SAMPLE_EVENT = TriggerEvent(
+    triggerPV="ioc:trigger",
+    value=1,
+    old_value=0,
+    ca_timestamp=1709316000.0,
+    messagePV="ioc:message",
+    message="message",
+    connected=True,
+    recipients=("joeuser@example.org",),
+    time=1709316000.25,
+)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+@functools.lru_cache(maxsize=256)
+def _join(recipients):
+    return ", ".join(recipients)
+
+
+# placeholder: Python expression of the TriggerEvent ``e``
+EVENT_FIELDS = {
+    "triggerPV": "e.triggerPV",
+    "value": "e.value",
+    "old_value": "e.old_value",
+    "messagePV": "e.messagePV",
+    "message": "e.message",
+    "connected": "e.connected",
+    "disconnected": '("" if e.connected else " (disconnected)")',
+    "date": "_date(e.time)",
+    "time": "e.time",
+    "ca_date": (
+        '("not available" if e.ca_timestamp is None else _date(e.ca_timestamp))'
+    ),
+    "ca_timestamp": (
+        '("not available" if e.ca_timestamp is None else "%d" % e.ca_timestamp)'
+    ),
+    "recipients": "_join(e.recipients)",
+    "suppressed": "e.suppressed",
+    "suppressed_note": (
+        '("suppressed: %d trigger(s) since last email\\n" % e.suppressed'
+        ' if e.suppressed else "")'
+    ),
+    "history": '("" if e.history is None else str(e.history))',
+}
+PROCESS_FIELDS = ("user", "host", "program", "pid")
+_NAMESPACE = dict(_date=datetime.datetime.fromtimestamp, _join=_join)
+_CONVERSIONS = dict(r=repr, a=ascii, s=str)
+
+
+def process_constants(user):
+    """values of the placeholders that do not change while pvMail runs"""
+    return dict(
+        user=user,
+        host=socket.gethostname(),
+        program=sys.argv[0],
+        pid=os.getpid(),
+    )
+
+
+def _expression(value, spec, conversion):
+    """Python expression to format ``value`` (an expression) as str.format() does"""
+    if conversion is not None:
+        value = f"{_CONVERSIONS[conversion].__name__}({value})"
+    if spec:
+        return f"format({value}, {spec!r})"
+    return f"str({value})"
+
+
+class MessageTemplate(object):
+    """
+    Subject and body templates, compiled once.
+
+    Each template is compiled to a Python function of the trigger event
+    that joins the text and the values of the placeholders.
+
+    :param str subject: subject template
+    :param str body: body template
+    """
+
+    def __init__(self, subject=DEFAULT_SUBJECT, body=DEFAULT_BODY):
+        self.subject = subject
+        self.body = body
+        self._parsed = (self._parse(subject), self._parse(body))
+        self._compiled = {}  # user: (subject function, body function)
+        for text, parsed in zip((subject, body), self._parsed):
+            try:
+                self._compile(parsed, process_constants("joeuser"))(SAMPLE_EVENT)
+            except (ValueError, TypeError) as exc:
+                raise TemplateError(f"{text!r}: {exc}")
+
+    @staticmethod
+    def _parse(text):
+        """split into (literal, field name, spec, conversion), check the names"""
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as exc:
+            raise TemplateError(f"{text!r}: {exc}")
+        for _literal, name, spec, conversion in parsed:
+            if name is None:
+                continue
+            if name not in EVENT_FIELDS and name not in PROCESS_FIELDS:
+                raise TemplateError(f"unknown placeholder {{{name}}} in {text!r}")
+            if conversion not in (None, "s", "r", "a"):
+                raise TemplateError(f"unknown conversion !{conversion} in {text!r}")
+            if "{" in spec:
+                raise TemplateError(f"nested placeholder in {text!r}")
+        return parsed
+
+    @staticmethod
+    def _compile(parsed, constants):
+        """
+        return a function ``f(event)`` that renders the parsed template
+
+        Constants are rendered now and merged with the text around them.
+        """
+        parts = []  # str: text, tuple: (expression,)
+        for literal, name, spec, conversion in parsed:
+            pieces = [literal]
+            if name in constants:
+                value = constants[name]
+                if conversion is not None:
+                    value = _CONVERSIONS[conversion](value)
+                pieces.append(format(value, spec))
+            elif name is not None:
+                pieces.append((_expression(EVENT_FIELDS[name], spec, conversion),))
+            for piece in pieces:
+                if isinstance(piece, str) and parts and isinstance(parts[-1], str):
+                    parts[-1] += piece
+                elif piece:
+                    parts.append(piece)
+        items = [repr(p) if isinstance(p, str) else p[0] for p in parts]
+        if len(items) == 0:
+            source = "''"
+        elif len(items) == 1:
+            source = items[0] if isinstance(parts[0], str) else f"str({items[0]})"
+        else:
+            source = '"".join((' + ", ".join(items) + "))"
+        return eval("lambda e: " + source, dict(_NAMESPACE))
+
+    def compiled(self, user):
+        """return the compiled (subject, body) functions for this user name"""
+        compiled = self._compiled.get(user)
+        if compiled is None:
+            constants = process_constants(user)
+            compiled = tuple(self._compile(p, constants) for p in self._parsed)
+            self._compiled[user] = compiled
+        return compiled
+
+    def render(self, event, user):
+        """
+        return (subject, message) of the email for ``event``
+
+        If this template cannot be rendered for ``event``, the default
+        templates are used.
+        """
+        subject, body = self.compiled(user)
+        try:
+            return subject(event), body(event)
+        except Exception as exc:
+            if self is DEFAULT:
+                raise
+            logs.log.warning(
+                "%s: template not rendered (%s), default template used",
+                event.triggerPV,
+                exc,
+            )
+            return DEFAULT.render(event, user)
+
+
+DEFAULT = MessageTemplate()
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(subject=DEFAULT_SUBJECT, body=DEFAULT_BODY):
+    """return the :class:`MessageTemplate`, the same object for the same text"""
+    return MessageTemplate(subject, body)
+
+
+def from_settings(settings, defaults=None):
+    """
+    return a :class:`MessageTemplate` from a dictionary (such as a watch table entry)
+
+    Returns *None* if no template keys are given.
+    """
+    kwargs = {}
+    for source in (defaults or {}, settings):
+        kwargs.update({k: source[k] for k in TEMPLATE_KEYS if k in source})
+    if not kwargs:
+        return None
+    return compile_template(**kwargs)
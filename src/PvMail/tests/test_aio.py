@@ -0,0 +1,184 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+from .. import aio
+from ..condition import Condition
+from ..history import ContextHistory
+from ..trigger import TriggerEvent
+from ..benchmarks.smtp_sink import SMTPSink
+
+pytest.importorskip("caproto")
+
+
+class _Config(object):
+    mail_transfer_agent = "SMTP"
+
+    def __init__(self, smtp_cfg):
+        self.smtp_cfg = smtp_cfg
+
+    def get(self):
+        return self.smtp_cfg
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def ca_env(monkeypatch):
+    """keep Channel Access traffic of the test on the local host"""
+    port = str(_free_port())
+    monkeypatch.setenv("EPICS_CA_SERVER_PORT", port)
+    monkeypatch.setenv("EPICS_CAS_SERVER_PORT", port)
+    monkeypatch.setenv("EPICS_CA_ADDR_LIST", "127.0.0.1")
+    monkeypatch.setenv("EPICS_CA_AUTO_ADDR_LIST", "NO")
+    monkeypatch.setenv("EPICS_CAS_INTF_ADDR_LIST", "127.0.0.1")
+
+
+async def _wait_for(condition, timeout=5):
+    for _ in range(int(timeout / 0.02)):
+        if condition():
+            return
+        await asyncio.sleep(0.02)
+    raise TimeoutError
+
+
+def test_async_smtp():
+    sink = SMTPSink()
+    sink.start()
+
+    async def send():
+        pool = aio.AsyncSMTPPool(sink.config(), size=2)
+        data = b"Subject: test\r\n\r\n.hidden\r\nbody\r\n"
+        sends = [pool.sendmail("pvmail", ["joe", "sally"], data) for _ in range(5)]
+        await asyncio.gather(*sends)
+        await pool.close()
+
+    asyncio.run(send())
+    sink.stop()
+    assert len(sink.messages) == 5
+    assert sink.connections == 2
+    sender, recipients, data = sink.messages[0]
+    assert (sender, recipients) == ("pvmail", ["joe", "sally"])
+    assert data == b"Subject: test\r\n\r\n..hidden\r\nbody\r\n"
+
+
+def test_engine(ca_env):
+    from caproto.asyncio.client import Context
+    from caproto.asyncio.server import start_server
+
+    from ..benchmarks.ioc import make_pvdb
+
+    sink = SMTPSink()
+    sink.start()
+    pvdb = make_pvdb(n_pairs=2)
+
+    async def session():
+        server = asyncio.create_task(start_server(pvdb, interfaces=["127.0.0.1"]))
+        engine = aio.AsyncWatchEngine(_Config(sink.config()))
+        context_history = ContextHistory(["sim:1:trigger"])
+        engine.add(
+            "pvMail:trigger",
+            "pvMail:message",
+            "joe@example.org",
+            history=context_history,
+        )
+        condition = Condition(
+            "rises(value) and severity(value) == NO_ALARM and B == 7",
+            dict(B="sim:1:trigger"),
+        )
+        engine.add(
+            "sim:0:trigger", "sim:0:message", "sally@example.org", condition=condition
+        )
+        engine.add("sim:99:trigger", "sim:99:message", "nobody")  # not served
+        engine.connect_timeout = 1
+        context = Context()
+        runner = asyncio.create_task(engine.run(context=context))
+        await _wait_for(lambda: sum(w.running for w in engine.watches) == 2)
+        buffer = context_history.buffers["sim:1:trigger"]
+        await _wait_for(lambda: len(buffer) == 1)  # value at subscription
+        await pvdb["sim:1:trigger"].write(7)
+        await _wait_for(lambda: len(buffer) == 2)
+        await _wait_for(lambda: condition.values == [0, 7])
+
+        await pvdb["pvMail:message"].write("beam dump")
+        await pvdb["pvMail:trigger"].write(1)
+        await pvdb["sim:0:trigger"].write(0)  # no edge
+        await _wait_for(lambda: len(sink.messages) == 1)
+        await pvdb["sim:0:trigger"].write(1)
+        await _wait_for(lambda: len(sink.messages) == 2)
+
+        engine.stop()
+        await runner
+        await context.disconnect()
+        server.cancel()
+
+    asyncio.run(session())
+    sink.stop()
+    rcpts = sorted(r for _, recipients, _ in sink.messages for r in recipients)
+    assert rcpts == ["joe@example.org", "sally@example.org"]
+    body = [d for _, r, d in sink.messages if r == ["joe@example.org"]][0]
+    assert b"beam dump" in body
+    assert b"sim:1:trigger (2 sample(s)):" in body
+
+
+class _NoPVs(object):
+    """client context of an engine without watches"""
+
+    async def get_pvs(self, *names, timeout=None):
+        return []
+
+
+def test_shutdown_digest():
+    sink = SMTPSink()
+    sink.start()
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def session():
+        engine = aio.AsyncWatchEngine(_Config(sink.config()))
+        engine.set_digest(60)
+        coalescer = engine.coalescers[None]
+        close = coalescer.close
+
+        def slow_close():
+            time.sleep(0.3)
+            close()
+
+        coalescer.close = slow_close
+        runner = asyncio.create_task(engine.run(context=_NoPVs()))
+        await _wait_for(lambda: engine._stop is not None)
+        coalescer.add(
+            TriggerEvent(
+                triggerPV="pvMail:trigger",
+                value=1,
+                old_value=0,
+                ca_timestamp=None,
+                messagePV="pvMail:message",
+                message="beam dump",
+                connected=True,
+                recipients=("joe@example.org",),
+                time=time.time(),
+            )
+        )  # held for 60 s
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0.05)
+        engine.stop()
+        t0 = time.monotonic()
+        await runner
+        ticker.cancel()
+        return t0
+
+    t0 = asyncio.run(session())
+    sink.stop()
+    assert len(sink.messages) == 1  # sent at shutdown
+    assert len([t for t in ticks if t > t0]) > 5  # loop not blocked by close()
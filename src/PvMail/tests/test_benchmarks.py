@@ -0,0 +1,25 @@
+from ..benchmarks import suite
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert suite.percentile(values, 50) == 50
+    assert suite.percentile(values, 99) == 99
+    assert suite.percentile([3.0], 90) == 3.0
+
+
+def test_compare():
+    baseline = dict(metrics=dict(latency_p50_ms=1.0, triggers_per_s=1000.0))
+    same = dict(metrics=dict(latency_p50_ms=1.1, triggers_per_s=900.0))
+    assert suite.compare(same, baseline, tolerance=0.2) == []
+
+    worse = dict(metrics=dict(latency_p50_ms=1.5, triggers_per_s=500.0))
+    names = [r[0] for r in suite.compare(worse, baseline, tolerance=0.2)]
+    assert names == ["latency_p50_ms", "triggers_per_s"]
+
+
+def test_latency():
+    latencies = suite.measure_latency(5)
+    assert len(latencies) == 5
+    assert all(0 < t < 5 for t in latencies)
+    assert suite.measure_throughput(10, 2) > 0
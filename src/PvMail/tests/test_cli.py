@@ -0,0 +1,203 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from .. import cli
+from .. import ini_config
+from ..benchmarks.simulator import SimulatedIOC
+
+
+def _pvmail(ioc, events):
+    pvm = ioc.watch_class(cli.PvMail)(events=events)
+    pvm.triggerPV = "pvMail:trigger"
+    pvm.messagePV = "pvMail:message"
+    pvm.recipients = ["joe@example.org"]
+    pvm.do_start()
+    return pvm
+
+
+def test_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(tmp_path / "pvMail.ini"))
+    ioc = SimulatedIOC({"pvMail:message": "beam dump"})
+    events = queue.Queue()
+    pvm = _pvmail(ioc, events)
+
+    ioc.put("pvMail:trigger", 1, timestamp=1234.5)
+    ioc.put("pvMail:message", "changed after the trigger")
+    _pvm, event = events.get_nowait()
+    assert event.message == "beam dump"
+    assert event.ca_timestamp == 1234.5
+    assert event.connected
+    assert event.recipients == ("joe@example.org",)
+
+    sent = []
+    cli._send(lambda *args, **kw: sent.append(args), event, ini_config.Config())
+    subject, message, recipients, _cfg = sent[0]
+    assert subject == "pvMail.py: pvMail:trigger"
+    assert message.startswith("\n\nbeam dump\n")
+    assert "CA_timestamp: 1234\n" in message
+    assert recipients == ["joe@example.org"]
+    pvm.do_stop()
+
+
+def test_spool_overflow(tmp_path, monkeypatch):
+    from .. import dispatch
+    from .. import spool
+
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(tmp_path / "pvMail.ini"))
+    assert cli.spool_overflow() is None
+    outbox = spool.Spool(tmp_path / "spool")
+    monkeypatch.setattr(cli, "outbox", outbox)
+
+    ioc = SimulatedIOC({"pvMail:message": "beam dump"})
+    events = queue.Queue()
+    pvm = _pvmail(ioc, events)
+    ioc.put("pvMail:trigger", 1)
+    _pvm, event = events.get_nowait()
+
+    release = threading.Event()
+    pool = dispatch.SendPool(workers=1, maxsize=1, overflow=cli.spool_overflow())
+    pool.submit("key", release.wait)
+    config = ini_config.Config()
+    for _ in range(4):
+        assert pool.submit("key", cli.SendMessage, pvm, config, event)
+    assert len(outbox) >= 3  # at most one job queued, the others spooled
+    release.set()
+    pool.shutdown()
+    assert len(outbox) == 4
+    assert pool.dropped == 0
+    pvm.do_stop()
+
+
+def test_event_loop(monkeypatch):
+    sent = []
+    monkeypatch.setattr(
+        cli, "SendMessage", lambda pvm, config, event: sent.append(time.time())
+    )
+
+    ioc = SimulatedIOC()
+    events = queue.Queue()
+    pvm = _pvmail(ioc, events)
+
+    loop = threading.Thread(target=cli.event_loop, args=(events, 60))
+    loop.start()
+
+    latencies = []
+    for _ in range(10):
+        t0 = time.time()
+        ioc.put("pvMail:trigger", 1)
+        while len(sent) < len(latencies) + 1 and time.time() - t0 < 1:
+            time.sleep(0.0001)
+        latencies.append(sent[-1] - t0)
+        ioc.put("pvMail:trigger", 0)
+
+    events.put(None)
+    loop.join()
+    pvm.do_stop()
+
+    # one email per edge, dispatched without waiting for a polling interval
+    assert len(sent) == 10
+    assert max(latencies) < cli.RETRY_INTERVAL_S / 4
+
+
+def test_latency_before_after():
+    from ..benchmarks import latency
+
+    polling = latency.measure_polling(n_triggers=3)
+    event = latency.measure_event_loop(n_triggers=3)
+    assert max(event) < min(polling)
+
+
+def test_lazy_imports():
+    code = (
+        "import sys, PvMail.cli, PvMail.ini_config, PvMail.mailer;"
+        "print(' '.join(sorted(sys.modules)))"
+    )
+    run = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    modules = run.stdout.split()
+    for heavy in ("epics", "PyQt5", "pydm", "http.server", "importlib.metadata"):
+        assert heavy not in modules
+
+
+def test_replay_without_pyepics(tmp_path):
+    (tmp_path / "run.csv").write_text("time,pv,value\n1.0,a,0\n2.0,a,1\n")
+    code = (
+        "import sys\n"
+        "from PvMail.cli import main\n"
+        "sys.argv = ['pvMail', 'a', 'b', 'joe@example.org', '--replay', 'run.csv',"
+        " '-l', 'pvMail.log']\n"
+        "main()\n"
+        "print('epics' in sys.modules)\n"
+    )
+    env = dict(os.environ, LOGNAME="pvmail")
+    env["PVMAIL_INI_FILE"] = str(tmp_path / "pvMail.ini")
+    run = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert run.returncode == 0, run.stderr
+    assert run.stdout.splitlines()[-1] == "False"
+
+
+def test_replay_with_spool(tmp_path, monkeypatch):
+    from .. import logs
+    from .. import spool
+    from ..benchmarks.smtp_sink import SMTPSink
+
+    sink = SMTPSink()
+    sink.start()
+    config = ini_config.ConfigSnapshot(
+        str(tmp_path / "pvMail.ini"), "SMTP", dict(SMTP=sink.config())
+    )
+    monkeypatch.setattr(ini_config, "_cached", config)
+    monkeypatch.setattr(cli, "outbox", None)
+    spool.Spool(tmp_path / "spool").put("subject", "message", ["joe@example.org"])
+    (tmp_path / "run.csv").write_text("time,pv,value\n1.0,a,0\n2.0,a,1\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LOGNAME", "pvmail")
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        "pvMail a b joe@example.org --replay run.csv --spool spool".split(),
+    )
+    try:
+        cli.main()
+        time.sleep(0.5)  # time enough for a deliverer to send
+    finally:
+        logs.shutdown()
+        sink.stop()
+    assert sink.messages == []
+    assert len(list((tmp_path / "spool" / "new").iterdir())) == 1
+    assert cli.outbox is None
+
+
+def test_not_connected(monkeypatch):
+    monkeypatch.setattr(cli, "CONNECTION_TEST_TIMEOUT", 0.05)
+    ioc = SimulatedIOC()
+    base = ioc.watch_class(cli.PvMail)
+
+    class Unreachable(base):
+        def make_pv(self, pvname):
+            pv = super().make_pv(pvname)
+            pv.connected = pvname != "pvMail:message"
+            return pv
+
+    pvm = Unreachable()
+    pvm.triggerPV = "pvMail:trigger"
+    pvm.messagePV = "pvMail:message"
+    pvm.recipients = ["joe@example.org"]
+    with pytest.raises(RuntimeWarning, match="could not connect to message PV"):
+        pvm.do_start()
+    assert not pvm.running
+    assert list(pvm.pv.values()) == [None, None]
+    assert ioc.pvs["pvMail:trigger"] == []  # disconnected
@@ -0,0 +1,138 @@
+import pytest
+
+from .. import replay
+from ..benchmarks.simulator import SimulatedIOC
+from ..condition import Condition
+from ..condition import ConditionError
+from ..condition import compile_condition
+from ..condition import from_settings
+from ..watches import WatchEngine
+from ..watches import WatchTableError
+
+
+class RecordingEngine(WatchEngine):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.events = []
+
+    def dispatch(self, watch, event):
+        self.events.append(event)
+
+
+def _fired(condition, updates):
+    """return the updates (index, value, severity) that trigger"""
+    return [u for u in updates if condition.update(*u)]
+
+
+def test_default():
+    condition = Condition()
+    values = [0, 1, 0, 2, 1, 1, 0, 1]  # as pvMail 4.0: 0 to 1 only
+    assert _fired(condition, [(0, v, None) for v in values]) == [(0, 1, None)] * 2
+
+
+def test_hysteresis():
+    condition = Condition("above(value, 5, 1)")
+    condition.reset([0])
+    values = [6, 4.5, 5.5, 3.9, 5.1, 6]
+    fired = _fired(condition, [(0, v, None) for v in values])
+    assert [v for _, v, _ in fired] == [6, 5.1]
+
+    condition = Condition("below(value, 1e-3, 1e-4)")
+    condition.reset([1])
+    values = [9e-4, 1.05e-3, 9e-4, 1.2e-3, 9e-4]
+    fired = _fired(condition, [(0, v, None) for v in values])
+    assert [v for _, v, _ in fired] == [9e-4, 9e-4]
+
+
+def test_several_pvs():
+    condition = Condition(
+        "rises(value) and valve == 0 or severity(vacuum) >= MAJOR",
+        dict(valve="sim:valve", vacuum="sim:vacuum"),
+    )
+    assert condition.update(0, 0) is False
+    assert condition.update(0, 1) is False  # valve and vacuum not known yet
+    condition.update(1, 1)
+    condition.update(2, 1e-9)
+    assert condition.update(0, 0) is False
+    condition.update(1, 0)
+    assert condition.update(0, 1) is True
+    assert condition.update(2, 1e-6, severity=2) is False  # still true
+    condition.update(0, 0)
+    condition.update(2, 1e-9, severity=0)
+    assert condition.update(2, 1e-6, severity=2) is True
+
+
+def test_errors():
+    for text in (
+        "__import__('os').system('ls')",
+        "value.real > 0",
+        "value[0]",
+        "unknown > 1",
+        "above(value)",
+        "above(value, level)",
+        "old(1)",
+        "value >",
+        "(lambda: 1)()",
+    ):
+        with pytest.raises(ConditionError):
+            compile_condition(text)
+    with pytest.raises(ConditionError):
+        compile_condition("value > 1", ("old",))
+    assert compile_condition("value > 1") is compile_condition("value > 1")
+    assert Condition("value > 'high'").update(0, 2) is False  # not evaluated
+    assert from_settings({}) is None
+
+
+def test_watch(tmp_path):
+    table = tmp_path / "watches.toml"
+    table.write_text(
+        'recipients = ["ops@example.org"]\n'
+        "[[watch]]\n"
+        'trigger_PV = "sim:pressure"\n'
+        'message_PV = "sim:message"\n'
+        'condition = "value > 1e-6 and valve == 1"\n'
+        'inputs = {valve = "sim:valve"}\n'
+    )
+    ioc = SimulatedIOC({"sim:pressure": 1e-9})
+    engine = RecordingEngine(watch_class=ioc.watch_class())
+    engine.load(table)
+    assert engine.start() == 1
+
+    ioc.put("sim:pressure", 1e-5)
+    ioc.put("sim:valve", 1)  # the input triggers
+    ioc.put("sim:pressure", 2e-5)
+    ioc.put("sim:pressure", 1e-9)
+    ioc.put("sim:pressure", 1e-5)  # the trigger PV triggers
+    assert [event.value for event in engine.events] == [1e-5, 1e-5]
+
+    engine.stop()
+    assert ioc.pvs["sim:valve"] == []
+
+    table.write_text(
+        "[[watch]]\n"
+        'trigger_PV = "sim:pressure"\n'
+        'message_PV = "sim:message"\n'
+        'condition = "value > limit"\n'
+    )
+    with pytest.raises(WatchTableError):
+        WatchEngine().load(table)
+
+
+def test_replay(tmp_path):
+    (tmp_path / "run.csv").write_text(
+        "time,pv,value\n"
+        "1.0,sim:valve,0\n"
+        "1.0,sim:pressure,0\n"
+        "2.0,sim:pressure,6\n"
+        "3.0,sim:valve,1\n"
+        "4.0,sim:pressure,4\n"
+    )
+    engine = replay.ReplayEngine()
+    engine.add(
+        "sim:pressure",
+        "sim:message",
+        "ops@example.org",
+        condition=Condition("value > 5 and valve == 1", dict(valve="sim:valve")),
+    )
+    engine.replay(replay.read_samples([str(tmp_path / "run.csv")]))
+    assert [t for t, events in engine.sent] == [3.0]
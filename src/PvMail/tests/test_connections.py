@@ -0,0 +1,44 @@
+import threading
+import time
+
+from .. import connections
+
+
+class FakePV(object):
+    """connects (calls its connection callbacks) after ``delay`` s"""
+
+    def __init__(self, pvname, delay=None):
+        self.pvname = pvname
+        self.connected = False
+        self.connection_callbacks = []
+        if delay is not None:
+            threading.Timer(delay, self._connect).start()
+
+    def _connect(self):
+        self.connected = True
+        for callback in list(self.connection_callbacks):
+            callback(pvname=self.pvname, conn=True, pv=self)
+
+
+def test_bulk():
+    bulk = connections.BulkConnection()
+    pvs = [FakePV(f"pv:{i}", delay=0.05 + 0.0001 * i) for i in range(500)]
+    bulk.add(pvs)
+    t0 = time.perf_counter()
+    assert bulk.wait(timeout=5) == []
+    assert time.perf_counter() - t0 < 2  # not 500 waits
+    assert len(bulk.latency) == 500
+    assert all(pv.connection_callbacks == [] for pv in pvs)
+    assert bulk.summary().startswith("500 of 500 PV(s) connected")
+
+
+def test_timeout():
+    bulk = connections.BulkConnection()
+    pvs = [FakePV(f"pv:{i}") for i in range(100)]  # never connect
+    pvs.append(FakePV("ok", delay=0))
+    bulk.add(pvs)
+    t0 = time.perf_counter()
+    not_connected = bulk.wait(timeout=0.2)
+    assert 0.2 <= time.perf_counter() - t0 < 1  # one timeout for all
+    assert len(not_connected) == 100
+    assert list(bulk.latency) == ["ok"]
@@ -0,0 +1,132 @@
+import time
+
+from .. import cli
+from .. import ini_config
+from ..benchmarks.simulator import SimulatedIOC
+from ..digest import Coalescer
+from ..digest import render_digest
+from ..history import HistorySnapshot
+from ..history import RingBuffer
+from ..template import MessageTemplate
+from ..trigger import TriggerEvent
+from ..watches import WatchEngine
+
+
+def _event(n, recipients=("joe@example.org",)):
+    return TriggerEvent(
+        triggerPV=f"sim:{n}:trigger",
+        value=1,
+        old_value=0,
+        ca_timestamp=1000.0 + n,
+        messagePV=f"sim:{n}:message",
+        message=f"message {n}",
+        connected=True,
+        recipients=recipients,
+        time=time.time(),
+    )
+
+
+def _collect(batches):
+    return lambda events, watches: batches.append(events)
+
+
+def test_coalescer():
+    batches = []
+    coalescer = Coalescer(_collect(batches), window=0.1, max_delay=1)
+    for n in range(5):
+        coalescer.add(_event(n))
+    coalescer.add(_event(9, recipients=("sally@example.org", "joe@example.org")))
+    assert coalescer.pending() == 6
+    time.sleep(0.3)
+    assert coalescer.pending() == 0
+    assert sorted(len(events) for events in batches) == [1, 5]
+    coalescer.close()
+
+
+def test_max_delay():
+    batches = []
+    coalescer = Coalescer(_collect(batches), window=0.1, max_delay=0.25)
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 0.5:  # keep extending the window
+        coalescer.add(_event(0))
+        time.sleep(0.02)
+    assert len(batches) >= 1  # held no longer than max_delay
+    coalescer.close()
+    assert sum(len(events) for events in batches) > 10
+
+
+def test_close_sends_held():
+    batches = []
+    coalescer = Coalescer(_collect(batches), window=60)
+    coalescer.add(_event(0))
+    coalescer.close()
+    assert len(batches) == 1
+
+
+def test_render_digest(tmp_path, monkeypatch):
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(tmp_path / "pvMail.ini"))
+    events = [_event(n) for n in range(3)]
+    buffer = RingBuffer(4)
+    buffer.append(995.0, 1.0)
+    marks = {"sim:beam": (buffer, buffer.written)}
+    history = HistorySnapshot(marks, until=1000.0, window=60)
+    events[1] = events[1]._replace(history=history)
+    subject, message = render_digest(events, ini_config.Config())
+    assert subject == "pvMail.py: 3 triggers (sim:0:trigger, ...)"
+    for n in range(3):
+        assert f"trigger PV: sim:{n}:trigger\n" in message
+        assert f"message: message {n}\n" in message
+    assert message.startswith("\n\n3 triggers between ")
+    assert "message 1\n\ncontext PVs, 60 s before the trigger:\nsim:beam" in message
+    assert message.endswith("recipients: joe@example.org\n")
+
+
+def test_template(tmp_path, monkeypatch):
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(tmp_path / "pvMail.ini"))
+    sent = []
+
+    def emailer(subject, msg, recipients, *args, **kw):
+        sent.append(subject)
+
+    monkeypatch.setattr(cli, "get_emailer", lambda agent_db: emailer)
+
+    ioc = SimulatedIOC()
+    engine = WatchEngine(ini_config.Config(), watch_class=ioc.watch_class())
+    engine.set_digest(60)
+    engine.add(
+        "sim:0:trigger",
+        "sim:0:message",
+        "joe@example.org",
+        template=MessageTemplate(subject="custom: {triggerPV}"),
+    )
+    changes = []
+    engine.on_change = changes.append
+    engine.start()
+    ioc.put("sim:0:trigger", 1)  # a digest of one trigger
+    engine.stop()
+    assert sent == ["custom: sim:0:trigger"]
+    assert engine.watches[0].emails_sent == 1
+    assert changes.count(engine.watches[0]) == 2  # trigger, then email sent
+
+
+def test_counts(tmp_path, monkeypatch):
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(tmp_path / "pvMail.ini"))
+    sent = []
+
+    def emailer(subject, msg, recipients, *args, **kw):
+        sent.append(subject)
+
+    monkeypatch.setattr(cli, "get_emailer", lambda agent_db: emailer)
+
+    ioc = SimulatedIOC()
+    engine = WatchEngine(ini_config.Config(), watch_class=ioc.watch_class())
+    engine.set_digest(60)
+    for i in range(2):
+        engine.add(f"sim:{i}:trigger", f"sim:{i}:message", "joe@example.org")
+    engine.start()
+    for value in (1, 0, 1):
+        ioc.put("sim:0:trigger", value)
+    ioc.put("sim:1:trigger", 1)
+    engine.stop()
+    assert len(sent) == 1  # one digest of three triggers
+    assert [w.emails_sent for w in engine.watches] == [2, 1]
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from .. import metrics
+from ..dispatch import SendPool
+
+
+def test_fifo_per_key():
+    sent = {}
+    pool = SendPool(workers=4)
+
+    def send(key, i):
+        time.sleep(0.0005)
+        sent.setdefault(key, []).append(i)
+
+    for i in range(20):
+        for key in ("a", "b", "c"):
+            assert pool.submit(key, send, key, i)
+    pool.shutdown()
+
+    for key in ("a", "b", "c"):
+        assert sent[key] == list(range(20))
+    assert pool.qsize() == 0
+    assert not pool.submit("a", send, "a", 99)
+
+
+def test_bounded():
+    release = threading.Event()
+    pool = SendPool(workers=1, maxsize=5)
+
+    accepted = [pool.submit("key", release.wait) for _ in range(10)]
+    # one job is running, 5 are queued, the rest are dropped
+    assert accepted.count(True) in (5, 6)
+    assert pool.dropped == accepted.count(False)
+    assert pool.qsize() <= 5
+
+    release.set()
+    pool.shutdown()
+    assert pool.qsize() == 0
+
+
+def test_overflow():
+    release = threading.Event()
+    overflow = []
+    pool = SendPool(workers=1, maxsize=2, overflow=lambda *job: overflow.append(job))
+    dropped = metrics.send_dropped.value
+    accepted = [pool.submit("key", release.wait) for _ in range(5)]
+    assert all(accepted)
+    assert pool.dropped == 0
+    assert len(overflow) in (2, 3)  # one job running, two queued
+    assert overflow[0] == (release.wait,)
+
+    pool.overflow = None
+    assert not pool.submit("key", release.wait)
+    assert pool.dropped == 1
+    assert metrics.send_dropped.value == dropped + 1
+    release.set()
+    pool.shutdown()
+
+
+def test_shutdown_full_queue():
+    release = threading.Event()
+    done = []
+    pool = SendPool(workers=1, maxsize=3)
+    pool.submit("key", release.wait)
+    time.sleep(0.05)  # running
+    for i in range(3):
+        assert pool.submit("key", done.append, i)
+
+    t0 = time.monotonic()
+    pool.shutdown(wait=False)  # no room for the shutdown job
+    assert time.monotonic() - t0 < 1
+    assert not pool.submit("key", done.append, 99)
+
+    release.set()
+    for t in pool._threads:
+        t.join(5)
+        assert not t.is_alive()
+    assert done == [0, 1, 2]
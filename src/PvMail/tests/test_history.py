@@ -0,0 +1,109 @@
+import math
+
+import pytest
+
+from ..benchmarks.simulator import SimulatedIOC
+from ..history import ContextHistory
+from ..history import RingBuffer
+from ..history import from_settings
+from ..template import DEFAULT
+from ..watches import WatchEngine
+from ..watches import WatchTableError
+
+
+class RecordingEngine(WatchEngine):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.events = []
+
+    def dispatch(self, watch, event):
+        self.events.append(event)
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(4)
+    assert buffer.nbytes == 80
+    assert buffer.samples() == []
+    for t in range(10):
+        buffer.append(t, 10 * t)
+    assert len(buffer) == 4
+    assert buffer.samples() == [(6, 60), (7, 70), (8, 80), (9, 90)]
+    assert buffer.samples(since=7.5) == [(7, 70), (8, 80), (9, 90)]
+    assert buffer.samples(end=9) == [(6, 60), (7, 70), (8, 80)]
+
+    buffer.append(10, 100)  # the next one overwrites sample 6
+    assert buffer.samples(end=9) == [(7, 70), (8, 80)]
+
+
+def test_snapshot():
+    history = ContextHistory(["sim:pressure"], window=5, samples=100)
+    buffer = history.buffers["sim:pressure"]
+    for t in range(20):
+        buffer.append(t, t / 10)
+    snapshot = history.snapshot(until=19.5)
+    buffer.append(20, 2.0)  # not in the snapshot
+
+    assert snapshot.samples()["sim:pressure"][0] == (14, 1.4)  # held at 14.5
+    assert snapshot.samples()["sim:pressure"][-1] == (19, 1.9)
+    text = str(snapshot)
+    assert "sim:pressure (6 sample(s)):" in text
+    assert "    -0.500 s  1.9" in text
+
+
+def test_from_settings():
+    assert from_settings({}) is None
+    history = from_settings(
+        {"context_PVs": "sim:a, sim:b"}, defaults={"history_samples": 10}
+    )
+    assert history.pvnames == ["sim:a", "sim:b"]
+    assert history.nbytes == 2 * 11 * 16
+    with pytest.raises(ValueError):
+        from_settings({"context_PVs": ["sim:a"], "history_samples": 0})
+
+
+def test_watch(tmp_path):
+    table = tmp_path / "watches.toml"
+    table.write_text(
+        'recipients = ["ops@example.org"]\n'
+        "history_window = 60\n"
+        "[[watch]]\n"
+        'trigger_PV = "sim:trigger"\n'
+        'message_PV = "sim:message"\n'
+        'context_PVs = ["sim:pressure", "sim:name"]\n'
+    )
+    ioc = SimulatedIOC({"sim:pressure": 1e-9, "sim:name": "text"})
+    engine = RecordingEngine(watch_class=ioc.watch_class())
+    engine.load(table)
+    assert engine.start() == 1
+    assert engine.history_bytes() == 2 * 601 * 16
+
+    t0 = ioc.values["sim:pressure"][1]
+    for i in range(1, 5):
+        ioc.put("sim:pressure", i * 1e-9, timestamp=t0 + i)
+    ioc.put("sim:trigger", 1, timestamp=t0 + 5)
+    ioc.put("sim:pressure", 1.0, timestamp=t0 + 6)  # after the trigger
+
+    (event,) = engine.events
+    samples = event.history.samples()
+    values = [v for t, v in samples["sim:pressure"]]
+    assert values == pytest.approx([1e-9, 1e-9, 2e-9, 3e-9, 4e-9])
+    assert math.isnan(samples["sim:name"][0][1])
+    subject, body = DEFAULT.render(event, "pvmail")
+    assert "context PVs, 60 s before the trigger:" in body
+    assert "      -1.000 s  4e-09" in body
+
+    engine.stop()
+    assert ioc.pvs["sim:pressure"] == []
+
+
+def test_watch_table_error(tmp_path):
+    table = tmp_path / "watches.toml"
+    table.write_text(
+        "[[watch]]\n"
+        'trigger_PV = "sim:trigger"\n'
+        'message_PV = "sim:message"\n'
+        'context_PVs = ["sim:pressure"]\n'
+        "history_samples = 0\n"
+    )
+    with pytest.raises(WatchTableError):
+        WatchEngine().load(table)
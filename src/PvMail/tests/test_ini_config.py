@@ -1,8 +1,44 @@
 from ..ini_config import Config
 
 
-def test_Config():
+def test_Config(tmp_path, monkeypatch):
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(tmp_path / "pvMail.ini"))
     con = Config()
     assert con is not None
     assert isinstance(con.ini_file, str)
     assert len(con.agent_db) > 0
+
+
+def test_reload(tmp_path, monkeypatch):
+    ini_file = tmp_path / "pvMail.ini"
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(ini_file))
+    con = Config()
+    con.setAgent("SMTP")
+    con.write()
+    con.read()
+    before = con.snapshot()
+    assert before.get()["password"] == "keep_this_private"
+    assert con.reload() is False
+
+    text = ini_file.read_text()
+    ini_file.write_text(text.replace("keep_this_private", "rotated"))
+    assert con.reload() is True
+    assert con.snapshot().get()["password"] == "rotated"
+    assert before.get()["password"] == "keep_this_private"  # unchanged
+
+    # not valid: ignored, the settings are kept
+    ini_file.write_text(text.replace("mail_transfer_agent = SMTP", "nothing = 0"))
+    assert con.reload() is False
+    assert con.error is not None
+    assert con.snapshot().get()["password"] == "rotated"
+
+
+def test_snapshot_no_io(tmp_path, monkeypatch):
+    monkeypatch.setenv("PVMAIL_INI_FILE", str(tmp_path / "pvMail.ini"))
+    con = Config()
+    con.snapshot()
+    calls = []
+    monkeypatch.setattr(con, "_stat", lambda: calls.append(1))
+    for _ in range(1000):
+        con.snapshot()
+    assert calls == []  # checked at most once per CHECK_INTERVAL_S
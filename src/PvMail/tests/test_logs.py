@@ -0,0 +1,96 @@
+import gzip
+import json
+import logging
+import threading
+
+from .. import cli
+from .. import logs
+
+
+class _Value(object):
+    """records the thread that formats it"""
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.get_ident())
+        return "1"
+
+
+def test_text(tmp_path):
+    logfile = tmp_path / "pvMail.log"
+    logs.setup(logfile)
+    value = _Value()
+    cli.logger("%s = %s", "pvMail:trigger", value)
+    cli.logger("100% plain")
+    logs.shutdown()
+
+    lines = logfile.read_text().splitlines()
+    assert lines[0].startswith("(")
+    assert lines[0].endswith(") pvMail:trigger = 1")
+    assert lines[1].endswith(") 100% plain")
+    assert value.threads and threading.get_ident() not in value.threads
+
+
+def test_lazy(tmp_path):
+    logs.setup(tmp_path / "pvMail.log", level=logging.WARNING)
+    value = _Value()
+    cli.logger("%s = %s", "pvMail:trigger", value)
+    logs.shutdown()
+    assert value.threads == []
+
+
+def test_json(tmp_path):
+    logfile = tmp_path / "pvMail.log"
+    logs.setup(logfile, json_lines=True)
+    cli.logger("checkpoint")
+    logs.shutdown()
+    entry = json.loads(logfile.read_text())
+    assert entry["message"] == "checkpoint"
+    assert entry["level"] == "INFO"
+    assert set(entry) >= {"time", "pid", "program", "host"}
+
+
+def test_rotate(tmp_path):
+    assert logs.parse_rotate("10MB") == dict(maxBytes=10 * 1024**2)
+    assert logs.parse_rotate("500") == dict(maxBytes=500)
+    assert logs.parse_rotate("midnight") == dict(when="MIDNIGHT")
+
+    logfile = tmp_path / "pvMail.log"
+    logs.setup(logfile, rotate="1KB", backups=2, compress=True)
+    for i in range(100):
+        cli.logger("line %d of the log", i)
+    logs.shutdown()
+
+    rotated = sorted(p.name for p in tmp_path.iterdir())
+    assert rotated == ["pvMail.log", "pvMail.log.1.gz", "pvMail.log.2.gz"]
+    with gzip.open(tmp_path / "pvMail.log.1.gz", "rt") as fp:
+        assert "of the log" in fp.read()
+
+
+def test_tail(tmp_path):
+    logfile = tmp_path / "pvMail.log"
+    tail = logs.LogTail(logfile, max_lines=3)
+    assert tail.read() == []  # no file yet
+
+    logfile.write_text("".join(f"line {i}\n" for i in range(10)))
+    assert tail.read() == ["line 7", "line 8", "line 9"]
+    with open(logfile, "a") as fp:
+        fp.write("line 10\nline 1")  # last line not complete
+    assert tail.read() == ["line 10"]
+    with open(logfile, "a") as fp:
+        fp.write("1\n")
+    assert tail.read() == ["line 11"]
+    assert list(tail.lines) == ["line 9", "line 10", "line 11"]
+
+    # rotate: the rest of the old file, then the new file
+    with open(logfile, "a") as fp:
+        fp.write("line 12\n")
+    logfile.rename(tmp_path / "pvMail.log.1")
+    logfile.write_text("new 0\n")
+    assert tail.read() == ["line 12", "new 0"]
+
+    logfile.write_text("cut\n")  # truncated, shorter than before
+    assert tail.read() == ["cut"]
+    tail.close()
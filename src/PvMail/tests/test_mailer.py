@@ -0,0 +1,216 @@
+import socket
+import smtplib
+import time
+
+import pytest
+
+from .. import mailer
+from ..benchmarks.smtp_sink import SMTPSink
+
+
+@pytest.fixture
+def sink():
+    sink = SMTPSink()
+    sink.start()
+    yield sink
+    sink.stop()
+
+
+def test_smtp_pool(sink):
+    pool = mailer.SMTPConnectionPool()
+    cfg = sink.config()
+    for i in range(5):
+        pool.sendmail(cfg, cfg["user"], ["joe@example.org"], f"Subject: {i}\n\n{i}")
+    assert len(sink.messages) == 5
+    assert sink.connections == 1  # connection was reused
+
+    # server drops the idle connection: reconnect
+    for _t, smtpserver in pool._idle[pool._key(cfg)]:
+        smtpserver.sock.shutdown(socket.SHUT_RDWR)
+    pool.sendmail(cfg, cfg["user"], ["joe@example.org"], "Subject: again\n\n")
+    assert len(sink.messages) == 6
+    assert sink.connections == 2
+
+    pool.close()
+    assert pool._idle == {}
+
+
+def test_smtp_pool_refused():
+    sink = SMTPSink(refuse=("nobody@example.org",))
+    sink.start()
+    pool = mailer.SMTPConnectionPool()
+    cfg = sink.config()
+    try:
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.sendmail(cfg, cfg["user"], ["nobody@example.org"], "Subject: 1\n\n")
+        pool.sendmail(cfg, cfg["user"], ["joe@example.org"], "Subject: 2\n\n")
+    finally:
+        pool.close()
+        sink.stop()
+    assert [m[1] for m in sink.messages] == [["joe@example.org"]]
+    assert sink.connections == 1  # the session was reset and reused
+
+
+def test_smtp_pool_lost_after_data():
+    sink = SMTPSink(hang_up=True)
+    sink.start()
+    pool = mailer.SMTPConnectionPool()
+    cfg = sink.config()
+    try:
+        with pytest.raises(smtplib.SMTPServerDisconnected):
+            pool.sendmail(cfg, cfg["user"], ["joe@example.org"], "Subject: 1\n\n")
+    finally:
+        pool.close()
+        sink.stop()
+    assert len(sink.messages) == 1  # not sent twice
+    assert pool._idle == {}
+
+
+def test_smtp_pool_idle_timeout(sink):
+    pool = mailer.SMTPConnectionPool(idle_timeout=0.05)
+    cfg = sink.config()
+    pool.sendmail(cfg, cfg["user"], ["joe@example.org"], "Subject: 1\n\n")
+    assert len(pool._idle) == 1
+    time.sleep(0.2)
+    assert pool._idle == {}
+
+
+def test_sendMail_SMTP(sink):
+    mailer.sendMail_SMTP("subject", "message", ["joe@example.org"], sink.config())
+    mailer.sendMail_SMTP("subject", "message", ["sally@example.org"], sink.config())
+    assert [m[1] for m in sink.messages] == [["joe@example.org"], ["sally@example.org"]]
+    assert b"Subject: subject" in sink.messages[0][2]
+    mailer.smtp_pool.close()
+
+
+FAKE_SENDMAIL = r"""#!{python}
+import sys
+import time
+
+log = open({log!r}, "a")
+if sys.argv[1:] == ["-bs"]:
+    def reply(text):
+        sys.stdout.write(text + "\r\n")
+        sys.stdout.flush()
+
+    reply("220 localhost fake sendmail")
+    for line in sys.stdin:
+        verb = line[:4].upper()
+        if verb == "DATA":
+            reply("354 go ahead")
+            for line in sys.stdin:
+                if line.rstrip("\r\n") == ".":
+                    break
+                log.write(line.rstrip("\r\n") + "\n")
+            log.write("=====\n")
+            log.flush()
+            reply("250 queued")
+        if verb == "EHLO":
+            reply("250-localhost")
+        if verb == "RCPT" and "crash" in line:
+            sys.exit(1)
+        if verb == "RCPT" and "hang" in line:
+            time.sleep(60)
+        if verb == "RCPT" and "nobody" in line:
+            reply("550 no such user")
+        elif verb == "QUIT":
+            reply("221 bye")
+            break
+        elif verb != "DATA":
+            reply("250 OK")
+else:
+    log.write(" ".join(sys.argv[1:]) + "\n" + sys.stdin.read() + "=====\n")
+    sys.exit(75 if "fail@example.org" in sys.argv else 0)
+"""
+
+
+@pytest.fixture
+def fake_sendmail(tmp_path, monkeypatch):
+    import sys
+
+    log = tmp_path / "sendmail.log"
+    program = tmp_path / "sendmail"
+    program.write_text(FAKE_SENDMAIL.format(python=sys.executable, log=str(log)))
+    program.chmod(0o755)
+    monkeypatch.setattr(mailer, "SENDMAIL_PROGRAMS", (str(program),))
+    return log
+
+
+def test_sendmail(fake_sendmail):
+    cfg = dict(user="pvmail")
+    message = "line 1\n+++\n.\nlast line"  # used to break the shell heredoc
+    mailer.sendMail_sendmail("subject", message, ["joe@example.org"], cfg)
+    text = fake_sendmail.read_text()
+    assert text.startswith("-oi -F pvmail -- joe@example.org\n")
+    assert "Subject: subject\n" in text
+    assert message in text
+
+    with pytest.raises(mailer.MailerError, match="exit status 75"):
+        mailer.sendMail_sendmail("subject", message, ["fail@example.org"], cfg)
+
+
+def test_sendmail_batch(fake_sendmail):
+    batch = [
+        ("first", "message 1", ["joe@example.org"]),
+        ("second", "message 2", ["nobody@example.org"]),
+        ("third", "message 3", "sally@example.org"),
+    ]
+    results = mailer.sendMail_sendmail_batch(batch, dict(user="pvmail"))
+    assert results[0] is None
+    assert results[1] is not None  # recipient refused
+    assert results[2] is None
+    text = fake_sendmail.read_text()
+    assert text.count("=====") == 2
+    assert "Subject: third" in text
+
+
+def test_sendmail_batch_lost(fake_sendmail, monkeypatch):
+    monkeypatch.setattr(mailer, "SENDMAIL_TIMEOUT", 0.5)
+    batch = [
+        ("first", "message 1", ["joe@example.org"]),
+        ("second", "message 2", ["crash@example.org"]),  # sendmail exits
+        ("third", "message 3", ["sally@example.org"]),
+        ("fourth", "message 4", ["hang@example.org"]),  # no answer, killed
+        ("fifth", "message 5", ["joe@example.org"]),
+    ]
+    t0 = time.monotonic()
+    results = mailer.sendMail_sendmail_batch(batch, dict(user="pvmail"))
+    assert time.monotonic() - t0 < 10
+    assert [r is None for r in results] == [True, False, True, False, True]
+    assert isinstance(results[3], smtplib.SMTPServerDisconnected)
+    text = fake_sendmail.read_text()
+    assert text.count("=====") == 3
+
+
+class _Config(object):
+    mail_transfer_agent = "SMTP"
+
+    def __init__(self, smtp_cfg):
+        self.smtp_cfg = smtp_cfg
+
+    def get(self):
+        return self.smtp_cfg
+
+
+@pytest.mark.parametrize("pipelining", [True, False])
+def test_send_many(pipelining):
+    sink = SMTPSink(pipelining=pipelining, max_recipients=3)
+    sink.start()
+    recipients = [f"user{i}@example.org" for i in range(7)]
+    messages = [
+        ("first", "message 1", recipients),
+        ("second", ".starts with a dot", "joe@example.org", "ops@example.org"),
+        ("third", "message 3", ["sally@example.org"]),
+    ]
+    results = mailer.send_many(messages, _Config(sink.config()))
+    sink.stop()
+    mailer.smtp_pool.close()
+
+    assert [len(r) for r in results] == [7, 1, 1]
+    assert all(code == 250 for r in results for code, _reply in r.values())
+    # 7 recipients, server accepts 3 per transaction
+    assert [len(m[1]) for m in sink.messages] == [3, 3, 1, 1, 1]
+    user = sink.config()["user"]
+    assert [m[0] for m in sink.messages] == [user] * 4 + ["ops@example.org"]
+    assert sink.connections == 1
+    assert b"\r\n..starts with a dot" in sink.messages[4][2]
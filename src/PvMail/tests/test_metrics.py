@@ -0,0 +1,56 @@
+import queue
+import urllib.request
+
+from .. import cli
+from .. import metrics
+from ..benchmarks.simulator import SimulatedIOC
+
+
+def test_render():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("c_total", "a counter", ["kind"]))
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+    hist = registry.register(metrics.Histogram("h_seconds", "a histogram", (0.1, 1)))
+    for value in (0.05, 0.5, 5):
+        hist.observe(value)
+    gauge = registry.register(metrics.Gauge("g", "a gauge"))
+    gauge.set_function(lambda: 7)
+
+    text = registry.render()
+    assert '# TYPE c_total counter\nc_total{kind="a"} 3\n' in text
+    assert 'h_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'h_seconds_bucket{le="1.0"} 2\n' in text
+    assert 'h_seconds_bucket{le="+Inf"} 3\n' in text
+    assert "h_seconds_sum 5.55\nh_seconds_count 3\n" in text
+    assert text.endswith("g 7\n")
+
+
+def test_instrumented_trigger():
+    before = metrics.triggers.value, metrics.trigger_monitors.value
+    ioc = SimulatedIOC()
+    events = queue.Queue()
+    pvm = ioc.watch_class(cli.PvMail)(events=events)
+    pvm.triggerPV, pvm.messagePV = "pvMail:trigger", "pvMail:message"
+    pvm.recipients = ["joe@example.org"]
+    pvm.do_start()
+    ioc.put("pvMail:trigger", 1)
+    ioc.put("pvMail:trigger", 0)
+    pvm.do_stop()
+    assert events.qsize() == 1
+    assert metrics.triggers.value == before[0] + 1
+    assert metrics.trigger_monitors.value >= before[1] + 2
+    assert cli.connected_pvs([pvm]) == 0  # disconnected by do_stop()
+
+
+def test_serve():
+    server = metrics.serve(0)
+    try:
+        url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+    assert "# TYPE pvmail_emails_sent_total counter" in text
+    assert "pvmail_send_latency_seconds_count" in text
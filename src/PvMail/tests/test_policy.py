@@ -0,0 +1,55 @@
+import time
+
+from ..policy import SendPolicy
+from ..policy import from_settings
+from ..trigger import TriggerEvent
+
+
+def _event(message="interlock"):
+    return TriggerEvent("sim:trigger", 1, 0, None, "sim:message", message, True, (), 0)
+
+
+def _sent(policy, times, message="interlock"):
+    """return the times at which an email is sent"""
+    return [t for t in times if policy.apply(_event(message), now=t) is not None]
+
+
+def test_rearm():
+    policy = SendPolicy(rearm_interval=1)
+    times = [i * 0.1 for i in range(30)]  # 10 Hz for 3 s
+    assert _sent(policy, times) == [0.0, 1.0, 2.0]
+    assert policy.counts["rearm"] == 27
+
+
+def test_rate_limit():
+    policy = SendPolicy(rate_limit=6, rate_burst=2)  # one token per 10 s
+    times = [0, 1, 2, 3, 11, 12, 25]
+    assert _sent(policy, times) == [0, 1, 11, 25]
+    assert policy.counts["rate"] == 3
+
+
+def test_duplicate():
+    policy = SendPolicy(suppress_window=60)
+    assert policy.apply(_event("A"), now=0) is not None
+    assert policy.apply(_event("A"), now=10) is None
+    event = policy.apply(_event("B"), now=20)
+    assert event.suppressed == 1  # reported in the next email
+    assert policy.suppressed == 0
+    assert policy.apply(_event("A"), now=61).suppressed == 0
+
+
+def test_from_settings():
+    assert from_settings({"trigger_PV": "sim:trigger"}) is None
+    policy = from_settings({"rate_limit": 60}, defaults={"rearm_interval": 2})
+    assert policy.rearm_interval == 2
+    assert policy.rate == 1.0
+
+
+def test_overhead():
+    policy = SendPolicy(rearm_interval=1, rate_limit=60, suppress_window=60)
+    event = _event()
+    n = 10_000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        policy.apply(event)
+    assert (time.perf_counter() - t0) / n < 20e-6
@@ -0,0 +1,72 @@
+from .. import replay
+
+CAMONITOR = """\
+pvMail:message                 2024-03-01 12:00:00.000000 beam dump
+pvMail:trigger                 2024-03-01 12:00:00.000000 0
+pvMail:trigger                 2024-03-01 12:00:01.000000 1
+pvMail:trigger                 2024-03-01 12:00:01.500000 0
+pvMail:trigger                 2024-03-01 12:00:02.000000 1
+pvMail:trigger                 2024-03-01 12:00:02.500000 0
+pvMail:trigger                 *** disconnected
+pvMail:trigger                 2024-03-01 12:00:30.000000 1
+"""
+
+CSV = """\
+time,pv,value
+1709316000.5,sim:1:trigger,0
+1709316000.5,sim:2:trigger,0
+2024-03-01T18:00:01.000000001Z,sim:1:trigger,1
+1709316001.5,sim:2:trigger,1
+"""
+
+TABLE = """\
+recipients = ["ops@example.org"]
+rearm_interval = 10
+
+[[watch]]
+trigger_PV = "pvMail:trigger"
+message_PV = "pvMail:message"
+"""
+
+
+def test_read(tmp_path):
+    (tmp_path / "run.camonitor").write_text(CAMONITOR)
+    samples = replay.read_camonitor(tmp_path / "run.camonitor")
+    assert len(samples) == 7
+    assert samples[0].value == "beam dump"
+    assert samples[2].value == 1
+    assert samples[2].time - samples[1].time == 1
+
+    (tmp_path / "run.csv").write_text(CSV)
+    samples = replay.read_samples([str(tmp_path / "run.csv")])
+    assert [s.pvname for s in samples][-2:] == ["sim:1:trigger", "sim:2:trigger"]
+
+
+def test_replay(tmp_path):
+    (tmp_path / "run.camonitor").write_text(CAMONITOR)
+    (tmp_path / "watches.toml").write_text(TABLE)
+    engine = replay.ReplayEngine()
+    engine.load(tmp_path / "watches.toml")
+    result = engine.replay(replay.read_samples([str(tmp_path / "run.camonitor")]))
+
+    assert result["samples"] == 7
+    assert result["triggers"] == 3
+    assert result["suppressed"]["rearm"] == 1  # second trigger, 1 s later
+    assert result["emails"] == 2
+    first, last = [events[0] for _t, events in engine.sent]
+    assert (first.message, first.connected) == ("beam dump", True)
+    assert last.suppressed == 1
+
+
+def test_replay_digest(tmp_path):
+    (tmp_path / "run.csv").write_text(CSV)
+    engine = replay.ReplayEngine()
+    engine.add("sim:1:trigger", "sim:1:message", "ops@example.org")
+    engine.add("sim:2:trigger", "sim:2:message", "ops@example.org")
+    engine.set_digest(5)
+    result = engine.replay(replay.read_samples([str(tmp_path / "run.csv")]))
+
+    assert result["triggers"] == 2
+    assert (result["emails"], result["digests"], result["coalesced"]) == (1, 1, 2)
+    t, events = engine.sent[0]
+    assert t == events[-1].time + 5  # window after the latest trigger
@@ -0,0 +1,70 @@
+from ..benchmarks import rules as bench
+from ..benchmarks.simulator import SimulatedIOC
+from ..condition import Condition
+from ..rules import RuleIndex
+from ..watches import WatchEngine
+
+
+class RecordingEngine(WatchEngine):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.events = []
+
+    def dispatch(self, watch, event):
+        self.events.append(event)
+
+
+def test_index():
+    fired = []
+    index = RuleIndex()
+    first = Condition("value == 1 and beam == 1", dict(beam="sim:beam"))
+    second = Condition("value > 2 or beam == 0", dict(beam="sim:beam"))
+    first.reset([1, 0])
+    second.reset([0, 1])
+    index.add(first, ["sim:a", "sim:beam"], lambda **kw: fired.append(("a", kw)))
+    index.add(second, [None, "sim:beam"], lambda **kw: fired.append(("b", kw)))
+    assert len(index) == 2
+    assert sorted(index.pvnames()) == ["sim:a", "sim:beam"]
+    assert "1 used by more than one" in index.summary()
+
+    assert index.update("sim:other", 1) == 0
+    assert index.update("sim:beam", 1, timestamp=5.0) == 1
+    assert fired == [("a", dict(timestamp=5.0))]
+    assert index.update("sim:beam", 0) == 1
+    assert fired[-1][0] == "b"
+    assert index.get("sim:beam") == (None, None)  # not monitored by the index
+
+
+def test_shared_input():
+    ioc = SimulatedIOC({"sim:beam": 0})
+    engine = RecordingEngine(watch_class=ioc.watch_class())
+    for i in range(3):
+        engine.add(
+            f"sim:{i}:trigger",
+            f"sim:{i}:message",
+            "ops@example.org",
+            condition=Condition("value == 1 and beam == 1", dict(beam="sim:beam")),
+        )
+    assert engine.start() == 3
+    assert len(ioc.pvs["sim:beam"]) == 1  # one PV object for all watches
+
+    ioc.put("sim:0:trigger", 1)
+    ioc.put("sim:2:trigger", 1)
+    assert engine.events == []
+    ioc.put("sim:beam", 1)
+    assert sorted(e.triggerPV for e in engine.events) == [
+        "sim:0:trigger",
+        "sim:2:trigger",
+    ]
+
+    engine.stop()
+    assert ioc.pvs["sim:beam"] == []
+
+
+def test_benchmark():
+    rules = bench.make_rules(200, 300)
+    values = bench.initial_values(300)
+    updates = bench.make_updates(500, 300)
+    _, naive = bench.measure_naive(rules, values, updates)
+    _, indexed = bench.measure_indexed(rules, values, updates)
+    assert indexed == naive > 0
@@ -0,0 +1,88 @@
+import socket
+import time
+
+import pytest
+
+from .. import mailer
+from .. import spool
+from ..benchmarks.smtp_sink import SMTPSink
+
+
+class _Config(object):
+    mail_transfer_agent = "SMTP"
+
+    def __init__(self, smtp_cfg):
+        self.smtp_cfg = smtp_cfg
+
+    def get(self):
+        return self.smtp_cfg
+
+
+def _wait_for(test, timeout=5):
+    t0 = time.time()
+    while not test() and time.time() - t0 < timeout:
+        time.sleep(0.01)
+    return test()
+
+
+@pytest.fixture
+def sink():
+    sink = SMTPSink()
+    sink.start()
+    yield sink
+    sink.stop()
+    mailer.smtp_pool.close()
+
+
+def test_deliver(tmp_path, sink):
+    outbox = spool.Spool(tmp_path)
+    for i in range(3):
+        outbox.emailer(f"subject {i}", "message", ["joe@example.org"])
+    assert len(outbox) == 3
+    assert len(list((tmp_path / "new").iterdir())) == 3
+
+    outbox.start(_Config(sink.config()))
+    assert _wait_for(lambda: len(outbox) == 0)
+    outbox.stop()
+    assert len(sink.messages) == 3
+    assert b"Subject: subject 0" in sink.messages[0][2]
+    assert list((tmp_path / "new").iterdir()) == []
+
+
+def test_retry_and_restart(tmp_path, sink, monkeypatch):
+    monkeypatch.setattr(spool, "BACKOFF_INITIAL_S", 0.01)
+    with socket.socket() as s:  # a port where nobody listens
+        s.bind(("127.0.0.1", 0))
+        down = dict(server="127.0.0.1", port=str(s.getsockname()[1]), user="pvmail")
+
+    outbox = spool.Spool(tmp_path)
+    outbox.put("subject", "message", ["joe@example.org"])
+    config = _Config(down)
+    outbox.start(config)
+    assert _wait_for(lambda: outbox.failures >= 3)
+    outbox.stop()
+    assert len(outbox) == 1  # still spooled
+
+    # a new process finds the message and sends it
+    outbox = spool.Spool(tmp_path)
+    assert len(outbox) == 1
+    outbox.start(_Config(sink.config()))
+    assert _wait_for(lambda: len(outbox) == 0)
+    outbox.stop()
+    assert len(sink.messages) == 1
+
+
+def test_unreadable(tmp_path, sink):
+    outbox = spool.Spool(tmp_path)
+    outbox.put("first", "message", ["joe@example.org"])
+    bad = outbox.put("truncated", "message", ["joe@example.org"])
+    (tmp_path / "new" / bad).write_text('{"subject": "trunc')
+    outbox.put("last", "message", ["joe@example.org"])
+
+    outbox.start(_Config(sink.config()))
+    assert _wait_for(lambda: len(outbox) == 0)
+    outbox.stop()
+    assert len(sink.messages) == 2  # not blocked by the bad file
+    assert outbox.sent == 2
+    assert outbox.failures == 0
+    assert [p.name for p in (tmp_path / "failed").iterdir()] == [bad]
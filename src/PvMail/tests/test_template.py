@@ -0,0 +1,98 @@
+import os
+import socket
+import sys
+
+import pytest
+
+from .. import mailer
+from .. import template
+from ..trigger import TriggerEvent
+from ..watches import WatchEngine
+from ..watches import WatchTableError
+
+EVENT = TriggerEvent(
+    triggerPV="pvMail:trigger",
+    value=1,
+    old_value=0,
+    ca_timestamp=1234.5,
+    messagePV="pvMail:message",
+    message="beam dump",
+    connected=False,
+    recipients=("joe@example.org", "sally@example.org"),
+    time=1709316000.25,
+    suppressed=2,
+)
+
+
+def test_default():
+    subject, msg = template.DEFAULT.render(EVENT, "joe")
+    assert subject == "pvMail.py: pvMail:trigger"
+    assert msg.startswith("\n\nbeam dump\n\nuser: joe\n")
+    assert f"host: {socket.gethostname()}\n" in msg
+    assert f"program: {sys.argv[0]}\nPID: {os.getpid()}\n" in msg
+    assert "CA_timestamp: 1234\n" in msg
+    assert "message PV: pvMail:message (disconnected)\n" in msg
+    assert "recipients: joe@example.org, sally@example.org\n" in msg
+    assert msg.endswith("suppressed: 2 trigger(s) since last email\n")
+
+    msg = template.DEFAULT.render(EVENT._replace(suppressed=0), "joe")[1]
+    assert msg.endswith("recipients: joe@example.org, sally@example.org\n")
+
+
+def test_custom():
+    t = template.MessageTemplate(
+        subject="{triggerPV} = {value:03d} (was {old_value!r})",
+        body="{message:>12}|{pid}|{{literal}}",
+    )
+    subject, msg = t.render(EVENT, "joe")
+    assert subject == "pvMail:trigger = 001 (was 0)"
+    assert msg == f"   beam dump|{os.getpid()}|{{literal}}"
+    assert template.compile_template("a", "b") is template.compile_template("a", "b")
+
+    for bad in ("{nothing}", "{value!x}", "{value", "{value:{spec}}"):
+        with pytest.raises(template.TemplateError):
+            template.MessageTemplate(subject=bad)
+
+
+def test_render_errors():
+    for bad in ("{time:%Q}", "{message:d}", "{pid:%Y}", "{connected:.3z}"):
+        with pytest.raises(template.TemplateError):
+            template.MessageTemplate(body=bad)
+
+    t = template.MessageTemplate(subject="{value:.3f}", body="{value:.3f} {message}")
+    assert t.render(EVENT, "joe") == ("1.000", "1.000 beam dump")
+    string_pv = EVENT._replace(value="open")  # loads, cannot be rendered
+    assert t.render(string_pv, "joe") == template.DEFAULT.render(string_pv, "joe")
+
+
+def test_watch_table(tmp_path):
+    table = tmp_path / "watches.toml"
+    table.write_text(
+        'subject = "alarm: {triggerPV}"\n'
+        "[[watch]]\n"
+        'trigger_PV = "a"\nmessage_PV = "b"\nrecipients = "joe"\n'
+        "[[watch]]\n"
+        'trigger_PV = "c"\nmessage_PV = "d"\nrecipients = "joe"\n'
+        'body = "{message}"\n'
+    )
+    engine = WatchEngine()
+    engine.load(table)
+    first, second = engine.watches
+    assert first.template.render(EVENT, "joe") == (
+        "alarm: pvMail:trigger",
+        template.DEFAULT.render(EVENT, "joe")[1],
+    )
+    assert second.template.render(EVENT, "joe") == (
+        "alarm: pvMail:trigger",
+        "beam dump",
+    )
+
+    table.write_text('[[watch]]\ntrigger_PV = "a"\nmessage_PV = "b"\nbody = "{x}"\n')
+    with pytest.raises(WatchTableError):
+        WatchEngine().load(table)
+
+
+def test_compose_headers():
+    msg = mailer._compose("subject", "From here\n", ["joe", "sally"], "pvmail")
+    assert msg == "To: joe\nTo: sally\nFrom: pvmail\nSubject: subject\n\nFrom here\n"
+    assert mailer._compose("subject", "", "joe", "pvmail").startswith("To: joe\n")
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from .. import throttle
+
+
+def test_latest_value():
+    shown = []
+    t = throttle.Throttle(shown.append)
+    t.flush()
+    assert shown == []
+    for value in ("a", "b", "c"):
+        t.update(value=value)
+    t.flush()
+    t.flush()
+    assert shown == ["c"]
+
+
+def test_keep_edge():
+    shown = []
+    t = throttle.Throttle(shown.append, edge=throttle.rising_edge)
+    t.update(0)
+    t.flush()
+    for value in (1, 0, 1, 0):  # two edges, back to 0 before the flush
+        t.update(value)
+    t.flush()
+    t.update(1)
+    t.flush()
+    assert shown == [0, 1, 0, 1]
+
+
+def test_1kHz():
+    shown = []
+    t = throttle.Throttle(shown.append, edge=throttle.rising_edge)
+    stop = threading.Event()
+
+    def ioc():  # trigger PV toggling at 1 kHz
+        value = 0
+        while not stop.is_set():
+            t.update(value)
+            value = 1 - value
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=ioc)
+    thread.start()
+    flushes = 0
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 0.5:
+        time.sleep(throttle.REFRESH_INTERVAL_MS / 1000)
+        t.flush()
+        flushes += 1
+    stop.set()
+    thread.join()
+
+    assert t.received > 4 * len(shown)
+    assert len(shown) <= 2 * flushes
+    assert shown.count(1) >= flushes - 1  # every interval had an edge
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pytestqt")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtCore  # noqa: E402
+
+from ..benchmarks import watch_table  # noqa: E402
+from ..watch_model import CONNECTED_COLUMN  # noqa: E402
+from ..watch_model import WatchFilterProxyModel  # noqa: E402
+from ..watch_model import WatchTableModel  # noqa: E402
+
+N_WATCHES = 3000
+
+
+@pytest.fixture
+def models(qapp):
+    engine = watch_table.make_engine(N_WATCHES)
+    model = WatchTableModel(engine)
+    proxy = WatchFilterProxyModel()
+    proxy.setSourceModel(model)
+    yield engine, model, proxy
+    model.timer.stop()
+    engine.pool.shutdown()
+
+
+def _column(proxy, column):
+    return [proxy.index(row, column).data() for row in range(proxy.rowCount())]
+
+
+def test_rows_and_sort(models):
+    engine, model, proxy = models
+    assert model.rowCount() == proxy.rowCount() == N_WATCHES
+    assert model.columnCount() == proxy.columnCount() == 7
+
+    proxy.sort(0, QtCore.Qt.AscendingOrder)
+    names = _column(proxy, 0)
+    assert names == sorted(w.label for w in engine.watches)
+
+    proxy.sort(6, QtCore.Qt.DescendingOrder)
+    sent = [int(v) for v in _column(proxy, 6)]
+    assert sent == sorted(sent, reverse=True)
+
+    model.refresh()  # keeps the sort order
+    assert [int(v) for v in _column(proxy, 6)] == sent
+
+
+def test_filter(models):
+    engine, model, proxy = models
+    proxy.sort(1, QtCore.Qt.AscendingOrder)
+    proxy.setFilterText("IOC42:")
+    expected = sorted(w.triggerPV for w in engine.watches if "ioc42:" in w.triggerPV)
+    assert proxy.rowCount() == len(expected) > 0
+    assert _column(proxy, 1) == expected
+
+    proxy.setFilterText("user3@")  # recipients
+    assert proxy.rowCount() == sum(
+        1 for w in engine.watches if w.recipients == ["user3@example.org"]
+    )
+    proxy.setFilterText("")
+    assert proxy.rowCount() == N_WATCHES
+
+
+def test_selection_follows_sort(models):
+    engine, model, proxy = models
+    index = QtCore.QPersistentModelIndex(model.index(10, 0))
+    watch = model.watches[10]
+    model.sort(0, QtCore.Qt.DescendingOrder)
+    assert model.watches[index.row()] is watch
+
+
+def test_data_changed(models, qtbot):
+    engine, model, proxy = models
+    changed = []
+    model.dataChanged.connect(lambda first, last: changed.append((first, last)))
+    for row in (5, 6, 7, 100):
+        model.mark_changed(model.watches[row])
+    with qtbot.waitSignal(model.dataChanged, timeout=2000):
+        pass  # flushed by the model's timer
+    rows = [(first.row(), last.row()) for first, last in changed]
+    assert rows == [(5, 7), (100, 100)]
+    assert {first.column() for first, _last in changed} == {CONNECTED_COLUMN}
+
+    model.watches[5].emails_sent = 12345
+    model.mark_changed(model.watches[5])
+    model.flush()
+    assert changed[-1][0].row() == 5
+    assert model.index(5, 6).data() == "12345"
+
+
+def test_benchmark(qapp):
+    results = watch_table.measure(500, 50, repeat=1)
+    assert "sort by name (both ways)" in results
+    assert "update 50 rows" in results
+    assert all(seconds >= 0 for seconds in results.values())
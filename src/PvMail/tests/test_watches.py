@@ -0,0 +1,89 @@
+import pytest
+
+from ..benchmarks.simulator import SimulatedIOC
+from ..watches import WatchEngine
+from ..watches import WatchTableError
+
+WATCH_TABLE = """
+recipients = ["ops@example.org"]
+digest_window = 5
+
+[groups.vacuum]
+digest_window = 0
+
+[[watch]]
+trigger_PV = "sim:1:trigger"
+message_PV = "sim:1:message"
+
+[[watch]]
+name = "second"
+group = "vacuum"
+trigger_PV = "sim:2:trigger"
+message_PV = "sim:2:message"
+recipients = "joe@example.org, sally@example.org"
+"""
+
+
+class RecordingEngine(WatchEngine):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.sent = []
+
+    def dispatch(self, watch, event):
+        self.sent.append(watch.label)
+
+
+def test_load(tmp_path):
+    table = tmp_path / "watches.toml"
+    table.write_text(WATCH_TABLE)
+
+    engine = WatchEngine()
+    engine.load(table)
+    assert len(engine) == 2
+    assert engine.watches[0].label == "sim:1:trigger"
+    assert engine.watches[0].recipients == ["ops@example.org"]
+    assert engine.watches[1].label == "second"
+    assert engine.watches[1].recipients == ["joe@example.org", "sally@example.org"]
+    assert engine.coalescers[None].window == 5
+    assert engine.coalescers["vacuum"] is None
+    engine.stop()
+
+
+def test_load_incomplete(tmp_path):
+    table = tmp_path / "watches.toml"
+    table.write_text('[[watch]]\ntrigger_PV = "sim:trigger"\n')
+    with pytest.raises(WatchTableError):
+        WatchEngine().load(table)
+
+
+def test_trigger():
+    ioc = SimulatedIOC()
+    engine = RecordingEngine(watch_class=ioc.watch_class())
+    for i in range(100):
+        engine.add(f"sim:{i}:trigger", f"sim:{i}:message", "ops@example.org")
+    assert engine.start() == 100
+
+    ioc.put("sim:7:trigger", 1)
+    ioc.put("sim:7:trigger", 0)
+    ioc.put("sim:42:trigger", 1)
+    assert engine.sent == ["sim:7:trigger", "sim:42:trigger"]
+
+    engine.stop()
+    assert not any(watch.running for watch in engine.watches)
+
+
+def test_status():
+    ioc = SimulatedIOC()
+    engine = RecordingEngine(watch_class=ioc.watch_class())
+    watch = engine.add("sim:1:trigger", "sim:1:message", "ops@example.org")
+    changed = []
+    engine.on_change = changed.append
+    engine.start()
+    assert watch.connected
+    assert watch.last_trigger is None
+
+    ioc.put("sim:1:trigger", 1)
+    assert watch.last_trigger is not None
+    assert changed == [watch]
+    engine.stop()
+    assert not watch.connected
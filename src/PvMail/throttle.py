@@ -0,0 +1,70 @@
+"""
+Pass on a fast-changing PV value at a capped rate, keeping trigger edges.
+
+The GUI shows the trigger and message PVs.  A PV updating at 1 kHz
+must not send 1000 updates per second to the GUI thread.  A
+:class:`Throttle` keeps only the latest value received from the CA
+callbacks.  A GUI timer calls :meth:`Throttle.flush` a few times per
+second to show it.  A 0 to 1 edge received since the last flush is
+always shown, even if the PV went back to 0 before the flush.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import threading
+
+REFRESH_INTERVAL_MS = 100
+_NONE = object()  # no value
+
+
+def rising_edge(old, new):
+    """the trigger condition of :meth:`PvMail.cli.PvMail.receiveTriggerMonitor`"""
+    return old == 0 and new == 1
+
+
+class Throttle(object):
+    """
+    Keep the latest value (from any thread), pass it on when flushed.
+
+    :param obj emit: called as ``emit(value)`` by :meth:`flush`
+    :param obj edge: optional function ``edge(old, new)``, *True* if
+        ``new`` must be shown even if replaced before the next flush
+    """
+
+    def __init__(self, emit, edge=None):
+        self.emit = emit
+        self.edge = edge
+        self.received = 0
+        self.emitted = 0
+        self._lock = threading.Lock()
+        self._last = _NONE  # latest value received
+        self._edge = _NONE  # edge value received since the last flush
+        self._pending = False
+
+    def update(self, value=None, **kw):
+        """receive a new value, can be used as a PyEpics callback"""
+        with self._lock:
+            self.received += 1
+            if (
+                self.edge is not None
+                and self._edge is _NONE
+                and self._last is not _NONE
+                and self.edge(self._last, value)
+            ):
+                self._edge = value
+            self._last = value
+            self._pending = True
+
+    def flush(self):
+        """emit the edge (if any) and the latest value received since the last flush"""
+        with self._lock:
+            if not self._pending:
+                return
+            values = [] if self._edge is _NONE else [self._edge]
+            if not (values and values[0] == self._last):
+                values.append(self._last)
+            self._edge = _NONE
+            self._pending = False
+        for value in values:
+            self.emitted += 1
+            self.emit(value)
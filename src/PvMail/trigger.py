@@ -0,0 +1,46 @@
+"""
+Record of one trigger, captured in the EPICS monitor callback.
+
+The email is rendered and sent only from this record, so the message
+is what the message PV held at the moment of the trigger and no
+Channel Access I/O is needed to send it.
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import collections
+
+_FIELDS = """
+    triggerPV
+    value
+    old_value
+    ca_timestamp
+    messagePV
+    message
+    connected
+    recipients
+    time
+    suppressed
+    history
+""".split()
+
+
+class TriggerEvent(collections.namedtuple("TriggerEvent", _FIELDS, defaults=(0, None))):
+    """
+    Immutable snapshot of a watch when its trigger fired.
+
+    :triggerPV:     (*str*) name of the trigger PV
+    :value:         new value of the trigger PV
+    :old_value:     previous value of the trigger PV
+    :ca_timestamp:  (*float*) CA timestamp of the trigger, or *None*
+    :messagePV:     (*str*) name of the message PV
+    :message:       value of the message PV (from its monitor)
+    :connected:     (*bool*) message PV connection state
+    :recipients:    (*tuple*) email addresses
+    :time:          (*float*) time (UNIX) the trigger was received
+    :suppressed:    (*int*) triggers suppressed since the last email (default: 0)
+    :history:       :class:`~PvMail.history.HistorySnapshot` of the context
+                    PVs, or *None* (default)
+    """
+
+    __slots__ = ()
@@ -28,8 +28,12 @@ from . import DOCS_URL
 from . import __version__ as VERSION
 from . import cli
 from . import ini_config
+from . import logs
+from . import throttle
 from . import utils
 from .email_model import EmailListModel
+from .watch_model import WatchFilterProxyModel
+from .watch_model import WatchTableModel
 
 pyqtSignal = QtCore.pyqtSignal
 
@@ -38,6 +42,8 @@ COLOR_ON = "lightgreen"
 COLOR_OFF = "lightred"
 COLOR_DEFAULT = "#eee"
 LOG_REDISPLAY_DELAY_MS = 1000
+LOG_POLL_INTERVAL_MS = 500
+HISTORY_LINES = logs.TAIL_LINES
 PATH_RESOURCES = pathlib.Path(__file__).parent / "resources"
 PATH_GUI_UI = utils.get_pkg_file_path(PATH_RESOURCES / "gui.ui")
 PATH_ABOUT_UI = utils.get_pkg_file_path(PATH_RESOURCES / "about.ui")
@@ -67,15 +73,24 @@ class PvMail_GUI(object):
         self.ui = uic.loadUi(utils.get_pkg_file_path(ui_file or PATH_GUI_UI))
 
         self.ui.history.clear()
+        # oldest lines are dropped, so appending costs the same for any log size
+        self.ui.history.document().setMaximumBlockCount(HISTORY_LINES)
         self.logger = logger
         self.logfile = logfile
-        self.config = config or ini_config.Config()
+        self.log_tail = None
+        if logfile is not None:
+            self.log_tail = logs.LogTail(logfile, max_lines=HISTORY_LINES)
+            self.log_timer = QtCore.QTimer()
+            self.log_timer.timeout.connect(self.logfile_to_history)
+            self.log_timer.start(LOG_POLL_INTERVAL_MS)
+        self.config = config or ini_config.cached()
 
         self.setStatus("starting")
 
         self.email_address_model = EmailListModel([], self.ui)
         self.pvmail = None
         self.watching = False
+        self.gui_callbacks = []  # (PV, index) of the monitors shown by the GUI
 
         # menu item handlers
         self.ui.actionSend_test_email.triggered.connect(self.doSendTestMessage)
@@ -113,6 +128,15 @@ class PvMail_GUI(object):
         self.messageSignal = PvMailSignalDef()
         self.messageSignal.EPICS_monitor.connect(self.onMessage_gui_thread)
 
+        # CA monitors reach the GUI thread at most once per refresh interval
+        self.triggerThrottle = throttle.Throttle(
+            self.triggerSignal.EPICS_monitor.emit, edge=throttle.rising_edge
+        )
+        self.messageThrottle = throttle.Throttle(self.messageSignal.EPICS_monitor.emit)
+        self.monitor_timer = QtCore.QTimer()
+        self.monitor_timer.timeout.connect(self.flushMonitors)
+        self.monitor_timer.start(throttle.REFRESH_INTERVAL_MS)
+
         self.setStatus("ready")
 
     def show(self):
@@ -174,17 +198,17 @@ class PvMail_GUI(object):
                 self.setStatus("need at least one email address for list of recipients")
                 return
 
-            # report connection failure and abort
-            for key, pv in dict(message=msg_pv, trigger=trig_pv).items():
-                tc = self.pvmail.testConnect(pv, timeout=cli.CONNECTION_TEST_TIMEOUT)
-                if tc is False:
-                    msg = "could not connect to %s PV: %s" % (key, pv)
-                    self.setStatus(msg)
-                    self.pvmail = None
-                    return
-
             self.pvmail.triggerPV = trig_pv
             self.pvmail.messagePV = msg_pv
+            self.pvmail.recipients = self.email_list
+
+            # connect both PVs at the same time, report failure and abort
+            try:
+                self.pvmail.basicChecks()
+            except RuntimeWarning as reason:
+                self.setStatus(str(reason))
+                self.pvmail = None
+                return
 
             for obj in (self.ui.messagePV, self.ui.triggerPV):
                 obj.setReadOnly(True)
@@ -192,7 +216,6 @@ class PvMail_GUI(object):
             self.ui.w_running_stopped.setStyleSheet(f"background-color: {COLOR_ON}")
             self.ui.pv_message.setReadOnly(True)
 
-            self.pvmail.recipients = self.email_list
             self.setStatus("trigger PV: " + self.pvmail.triggerPV)
             self.setStatus("message PV: " + self.pvmail.messagePV)
             self.setStatus("recipients: " + "  ".join(self.email_list))
@@ -201,6 +224,13 @@ class PvMail_GUI(object):
             except Exception as reason:
                 self.setStatus(str(reason))
                 return
+            self.gui_callbacks = [
+                (pv, pv.add_callback(callback))
+                for pv, callback in (
+                    (self.pvmail.pv["trigger"], self.onTrigger_pv_thread),
+                    (self.pvmail.pv["message"], self.onMessage_pv_thread),
+                )
+            ]
             self.ui.w_running_stopped.setText("running")
             self.ui.w_running_stopped.setStyleSheet(
                 (f"background-color: {COLOR_ON}" "; qproperty-alignment: AlignCenter")
@@ -213,6 +243,9 @@ class PvMail_GUI(object):
             self.setStatus("not watching now")
         else:
             self.setStatus("<Stop> button pressed")
+            for pv, index in self.gui_callbacks:
+                pv.remove_callback(index)  # no more updates for the throttles
+            self.gui_callbacks = []
             self.pvmail.do_stop()
             self.ui.w_running_stopped.setText("stopped")
             for obj in (self.ui.messagePV, self.ui.triggerPV):
@@ -264,7 +297,7 @@ class PvMail_GUI(object):
         return self.ui.messagePV.text()
 
     def onMessage_pv_thread(self, value=None, *args, **kw):
-        self.messageSignal.EPICS_monitor.emit(value)  # threadsafe update of the widget
+        self.messageThrottle.update(value)  # shown by flushMonitors()
 
     def onMessage_gui_thread(self, value):
         self.setStatus("message: %s" % str(value))
@@ -284,11 +317,16 @@ class PvMail_GUI(object):
         return self.ui.triggerPV.text()
 
     def onTrigger_pv_thread(self, value=None, char_value=None, *args, **kw):
-        self.triggerSignal.EPICS_monitor.emit(value)  # threadsafe update of the widget
+        self.triggerThrottle.update(value)  # shown by flushMonitors()
+
+    def flushMonitors(self):
+        """show the latest monitor values (and any trigger edge), in the GUI thread"""
+        self.triggerThrottle.flush()
+        self.messageThrottle.flush()
 
     def onTrigger_gui_thread(self, value):
         self.setStatus("trigger: %s" % str(value))
-        color = {0: COLOR_DEFAULT, 1: COLOR_ON}[value]
+        color = {0: COLOR_DEFAULT, 1: COLOR_ON}.get(value, COLOR_DEFAULT)
         self.ui.pv_trigger.SetBackgroundColor(color)
         if self.ui.pv_trigger.text() != str(value):
             self.ui.pv_trigger.text_cache = str(value)
@@ -325,21 +363,95 @@ class PvMail_GUI(object):
             self.ui.history.ensureCursorVisible()
 
     def logfile_to_history(self):
-        # update history with logfile contents
-        self.ui.history.clear()
-        self.ui.history.append(open(self.logfile, "r").read())
+        """append the lines added to the log file since the last call"""
+        if self.log_tail is None:
+            return
+        lines = self.log_tail.read()
+        if len(lines) > 0:
+            text = "\n".join(lines)
+            if not self.ui.history.document().isEmpty():
+                text = "\n" + text
+            cursor = self.ui.history.textCursor()
+            cursor.movePosition(QtGui.QTextCursor.End)
+            cursor.insertText(text)
+            self.ui.history.setTextCursor(cursor)
+
+
+class WatchTable_GUI(object):
+    """GUI for the watches of a watch table, one row per watch."""
+
+    def __init__(self, engine, logfile=None):
+        self.engine = engine
+        self.ui = QtWidgets.QMainWindow()
+        self.ui.setWindowTitle(f"{WINDOW_TITLE}: {len(engine)} watches")
+
+        self.model = WatchTableModel(engine, self.ui)
+        self.proxy = WatchFilterProxyModel(self.ui)
+        self.proxy.setSourceModel(self.model)
+
+        self.filter = QtWidgets.QLineEdit()
+        self.filter.setPlaceholderText("filter: name, PV or recipient")
+        self.filter.setClearButtonEnabled(True)
+        self.filter.textChanged.connect(self.proxy.setFilterText)
+        self.filter.textChanged.connect(self.showCount)
+
+        self.view = QtWidgets.QTableView()
+        self.view.setModel(self.proxy)
+        self.view.setSortingEnabled(True)
+        self.view.setAlternatingRowColors(True)
+        self.view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.view.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        # fixed row heights: no row is measured, scrolling 10k rows stays smooth
+        header = self.view.verticalHeader()
+        header.setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        header.setDefaultSectionSize(self.view.fontMetrics().height() + 6)
+        header.hide()
+        self.view.horizontalHeader().setStretchLastSection(True)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.filter)
+        layout.addWidget(self.view)
+        central = QtWidgets.QWidget()
+        central.setLayout(layout)
+        self.ui.setCentralWidget(central)
+        self.ui.resize(1000, 600)
+        if logfile is not None:
+            self.setStatus(f"log file: {logfile}")
+
+    def show(self):
+        self.showCount()
+        self.ui.show()
+
+    def showCount(self, *args):
+        self.setStatus(f"showing {self.proxy.rowCount()} of {len(self.engine)} watches")
+
+    def setStatus(self, message):
+        self.ui.statusBar().showMessage(str(message))
+
+
+def watches_main(engine, logfile=None):
+    """show the watches of ``engine`` while they run"""
+    app = QtWidgets.QApplication(sys.argv)
+    gui = WatchTable_GUI(engine, logfile=logfile)
+    engine.start()
+    gui.model.refresh()
+    gui.show()
+    try:
+        status = app.exec_()
+    finally:
+        engine.stop()
+    sys.exit(status)
 
 
 def main(triggerPV, messagePV, recipients, logger=None, logfile=None, config=None):
     app = QtWidgets.QApplication(sys.argv)
-    config = config or ini_config.Config()
+    config = config or ini_config.cached()
     gui = PvMail_GUI(logger=logger, logfile=logfile, config=config)
 
     gui.setStatus("PID: " + str(os.getpid()))
     if logfile is not None:
         logfile = pathlib.Path(logfile)
     if logfile is not None and logfile.exists():
-        gui.ui.history.append(open(logfile, "r").read())
         gui.setStatus(f"log file: {logfile}")
     gui.setStatus("email configuration file: " + config.ini_file)
     gui.setStatus("email agent: " + config.mail_transfer_agent)
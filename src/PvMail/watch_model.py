@@ -0,0 +1,173 @@
+"""
+Watch table model for Qt's MVC QTableView
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import datetime
+import threading
+
+from PyQt5 import QtCore
+from PyQt5 import QtGui
+
+REFRESH_INTERVAL_MS = 250
+SortRole = QtCore.Qt.UserRole + 1
+COLOR_DISCONNECTED = "#fcc"
+
+# (header, value of a watch used to sort)
+COLUMNS = (
+    ("name", lambda watch: watch.label),
+    ("trigger PV", lambda watch: watch.triggerPV),
+    ("message PV", lambda watch: watch.messagePV),
+    ("recipients", lambda watch: ", ".join(watch.recipients)),
+    ("connected", lambda watch: watch.connected),
+    ("last trigger", lambda watch: watch.last_trigger or 0.0),
+    ("emails sent", lambda watch: watch.emails_sent),
+)
+CONNECTED_COLUMN = 4
+LAST_TRIGGER_COLUMN = 5
+
+
+class WatchTableModel(QtCore.QAbstractTableModel):
+    def __init__(self, engine, parent=None, *args):
+        """
+        data model for GUI: one row per watch of a WatchEngine
+
+        Cells are computed only when the view asks for them (the visible
+        rows), so the number of watches does not slow the view.  Rows are
+        sorted here, with one Python sort of the watches (see
+        :meth:`sort`), not by a proxy model comparing rows.  Status
+        changes reported by the engine (from any thread) are collected
+        and shown together, one ``dataChanged`` per block of rows, every
+        ``REFRESH_INTERVAL_MS``.
+
+        :param obj engine: :class:`~PvMail.watches.WatchEngine`
+        :param QWidget parent: view widget for this data model
+        """
+        super(WatchTableModel, self).__init__(parent, *args)
+        self.engine = engine
+        self.watches = []
+        self._rows = {}  # watch: row
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._sort_order = None  # (column, order) of the latest sort
+        self.refresh()
+        engine.on_change = self.mark_changed
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(REFRESH_INTERVAL_MS)
+
+    def refresh(self):
+        """show the engine's current list of watches"""
+        self.beginResetModel()
+        self.watches = list(self.engine.watches)
+        if self._sort_order is not None:
+            column, order = self._sort_order
+            self._sort_watches(column, order)
+        self._rows = {watch: row for row, watch in enumerate(self.watches)}
+        self.endResetModel()
+
+    def _sort_watches(self, column, order):
+        descending = order == QtCore.Qt.DescendingOrder
+        self.watches.sort(key=COLUMNS[column][1], reverse=descending)
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        """sort the rows by ``column``, keep the selection on the same watches"""
+        if not 0 <= column < len(COLUMNS):
+            return
+        self.layoutAboutToBeChanged.emit()
+        previous = list(self.watches)
+        self._sort_watches(column, order)
+        self._sort_order = column, order
+        self._rows = {watch: row for row, watch in enumerate(self.watches)}
+        old = self.persistentIndexList()
+        new = [self.index(self._rows[previous[i.row()]], i.column()) for i in old]
+        self.changePersistentIndexList(old, new)
+        self.layoutChanged.emit()
+
+    def mark_changed(self, watch):
+        """the status of ``watch`` changed, can be called from any thread"""
+        with self._lock:
+            self._changed.add(watch)
+
+    def flush(self):
+        """tell the views about the rows changed since the last call"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        rows = sorted(self._rows[w] for w in changed if w in self._rows)
+        last_column = len(COLUMNS) - 1
+        while rows:
+            first = last = rows.pop(0)
+            while rows and rows[0] == last + 1:
+                last = rows.pop(0)
+            self.dataChanged.emit(
+                self.index(first, CONNECTED_COLUMN), self.index(last, last_column)
+            )
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.watches)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return QtCore.QVariant(COLUMNS[section][0])
+        return QtCore.QVariant()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return QtCore.QVariant()
+        watch = self.watches[index.row()]
+        column = index.column()
+        if role == SortRole:
+            return QtCore.QVariant(COLUMNS[column][1](watch))
+        if role == QtCore.Qt.DisplayRole:
+            value = COLUMNS[column][1](watch)
+            if column == CONNECTED_COLUMN:
+                value = "yes" if value else "no"
+            elif column == LAST_TRIGGER_COLUMN:
+                if value:
+                    value = datetime.datetime.fromtimestamp(value)
+                    value = value.isoformat(sep=" ", timespec="seconds")
+                else:
+                    value = ""
+            return QtCore.QVariant(str(value))
+        if role == QtCore.Qt.BackgroundRole and column == CONNECTED_COLUMN:
+            if not watch.connected:
+                return QtGui.QBrush(QtGui.QColor(COLOR_DISCONNECTED))
+        return QtCore.QVariant()
+
+
+class WatchFilterProxyModel(QtCore.QSortFilterProxyModel):
+    def __init__(self, parent=None, *args):
+        """
+        sort the watches by any column, show only those matching a filter
+
+        The filter text is matched (ignoring case) against the name,
+        PV names and recipients of each watch.  Sorting is done by the
+        source :class:`WatchTableModel`, in its order the rows are shown.
+
+        :param QWidget parent: view widget for this data model
+        """
+        super(WatchFilterProxyModel, self).__init__(parent, *args)
+        self.setSortRole(SortRole)
+        self.filter_text = ""
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        """sort the source model (faster than comparing rows one by one)"""
+        self.sourceModel().sort(column, order)
+
+    def setFilterText(self, text):
+        self.filter_text = str(text).strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.filter_text:
+            return True
+        watch = self.sourceModel().watches[source_row]
+        fields = (watch.label, watch.triggerPV, watch.messagePV) + tuple(
+            watch.recipients
+        )
+        return any(self.filter_text in field.lower() for field in fields)
@@ -0,0 +1,360 @@
+"""
+Watch many trigger/message PV pairs from one process.
+
+Instead of running one pvMail process per trigger PV, a single
+:class:`WatchEngine` holds all the watches described in a *watch table*.
+All watches share the process-wide EPICS Channel Access context, one
+email configuration, and one send path.
+
+A watch table is a TOML file.  Top-level ``recipients`` (optional) are
+used by any watch that does not give its own list::
+
+    recipients = ["ops@example.org"]
+
+    [[watch]]
+    trigger_PV = "pvMail:trigger"
+    message_PV = "pvMail:message"
+
+    [[watch]]
+    name = "shutter"
+    trigger_PV = "ioc:shutter:trip"
+    message_PV = "ioc:shutter:why"
+    recipients = "joe@example.org,sally@example.org"
+
+Triggers can be combined into digest emails, see :mod:`PvMail.digest`.
+Triggers from a flapping PV can be suppressed, see :mod:`PvMail.policy`.
+The subject and body of the email can be changed, see :mod:`PvMail.template`.
+The email can report the recent values of other PVs, see :mod:`PvMail.history`.
+A watch can trigger on a condition of several PVs, see :mod:`PvMail.condition`.
+Input PVs used by several watches are monitored once, see :mod:`PvMail.rules`.
+
+Run it with::
+
+    $ pvMail --watches watches.toml
+"""
+
+# Copyright (c) 2009-2024, UChicago Argonne, LLC.  See LICENSE file.
+
+import threading
+
+from . import cli
+from . import condition
+from . import connections
+from . import digest
+from . import dispatch
+from . import history
+from . import metrics
+from . import policy
+from . import rules
+from . import template
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+
+class WatchTableError(Exception):
+    pass
+
+
+class Watch(cli.PvMail):
+    """
+    One trigger/message PV pair managed by a :class:`WatchEngine`.
+
+    Identical to :class:`~PvMail.cli.PvMail` except that triggers
+    are handed to the engine's send path.
+    """
+
+    def __init__(
+        self,
+        engine,
+        label,
+        trigger_PV,
+        message_PV,
+        recipients,
+        group=None,
+        policy=None,
+        template=None,
+        history=None,
+        condition=None,
+    ):
+        super().__init__(engine.config, pool=engine.pool, policy=policy)
+        self.template = template
+        self.history = history
+        self.condition = condition
+        self.engine = engine
+        self.label = label
+        self.group = group
+        self.triggerPV = trigger_PV
+        self.messagePV = message_PV
+        self.recipients = recipients
+
+    def __repr__(self):
+        return f"Watch({self.label!r}, trigger={self.triggerPV!r})"
+
+    @property
+    def connected(self):
+        """are both PVs connected?"""
+        return all(pv is not None and pv.connected for pv in self.pv.values())
+
+    def make_pv(self, pvname):
+        """create the PV, report its connection changes as status changes"""
+        import epics
+
+        return epics.PV(pvname, connection_callback=self._connection_changed)
+
+    def _connection_changed(self, **kw):
+        self.status_changed()
+
+    def status_changed(self):
+        """tell the engine's ``on_change`` function (such as the GUI)"""
+        on_change = self.engine.on_change
+        if on_change is not None:
+            on_change(self)
+
+    def dispatch(self, event):
+        """send the message through the engine"""
+        self.engine.dispatch(self, event)
+
+
+def _recipient_list(recipients):
+    """accept either a list or a comma-separated string of addresses"""
+    if isinstance(recipients, str):
+        recipients = recipients.split(",")
+    return [v.strip() for v in recipients if len(v.strip()) > 0]
+
+
+class WatchEngine(object):
+    """
+    Hold many :class:`Watch` objects in one process.
+
+    :param obj config: email configuration from ini_config.Config()
+    :param class watch_class: class used to create each watch
+    :param int workers: number of send workers shared by all watches
+
+    Set :attr:`on_change` to a function ``on_change(watch)``, to be
+    called (from any thread) when a watch connects or disconnects,
+    triggers, or sends an email.
+    """
+
+    def __init__(self, config=None, watch_class=Watch, workers=dispatch.SEND_WORKERS):
+        self.config = config
+        self.watch_class = watch_class
+        self.on_change = None
+        self.connect_timeout = connections.CONNECT_TIMEOUT
+        self.pool = self._make_pool(workers)
+        self.coalescers = {}  # group name (None: all watches): Coalescer
+        self.watches = []
+        self.index = rules.RuleIndex()  # input PVs of all the conditions
+        self._stop_event = threading.Event()
+
+    def __len__(self):
+        return len(self.watches)
+
+    def _make_pool(self, workers):
+        """create the send pool shared by all watches"""
+        return dispatch.SendPool(
+            workers=workers, logger=cli.logger, overflow=cli.spool_overflow()
+        )
+
+    def add(
+        self,
+        trigger_PV,
+        message_PV,
+        recipients,
+        label=None,
+        group=None,
+        policy=None,
+        template=None,
+        history=None,
+        condition=None,
+    ):
+        """create a new watch and add it to the engine"""
+        recipients = _recipient_list(recipients)
+        if label is None:
+            label = trigger_PV
+        watch = self.watch_class(
+            self,
+            label,
+            trigger_PV,
+            message_PV,
+            recipients,
+            group=group,
+            policy=policy,
+            template=template,
+            history=history,
+            condition=condition,
+        )
+        self.watches.append(watch)
+        return watch
+
+    def set_digest(self, window, max_delay=digest.DIGEST_MAX_DELAY_S, group=None):
+        """
+        combine triggers into digest emails
+
+        :param float window: wait this long (s) after the latest trigger,
+            0 to send each trigger at once
+        :param float max_delay: never hold a trigger longer than this (s)
+        :param str group: watch group, *None* for all watches without
+            their own group setting
+        """
+        old = self.coalescers.pop(group, None)
+        if old is not None:
+            old.close()
+        if window > 0:
+            self.coalescers[group] = self._make_coalescer(window, max_delay)
+        elif group is not None:
+            self.coalescers[group] = None  # this group: no digest
+
+    def _make_coalescer(self, window, max_delay):
+        """create the digest coalescer for one group"""
+        return digest.Coalescer(self._send_digest, window=window, max_delay=max_delay)
+
+    def load(self, filename):
+        """add all the watches described in a watch table (TOML) file"""
+        with open(filename, "rb") as fp:
+            table = tomllib.load(fp)
+
+        default_recipients = table.get("recipients", [])
+        for group, settings in [(None, table)] + list(table.get("groups", {}).items()):
+            if "digest_window" in settings:
+                self.set_digest(
+                    settings["digest_window"],
+                    settings.get("digest_max_delay", digest.DIGEST_MAX_DELAY_S),
+                    group=group,
+                )
+        for i, entry in enumerate(table.get("watch", []), start=1):
+            try:
+                trigger_PV = entry["trigger_PV"]
+                message_PV = entry["message_PV"]
+            except KeyError as exc:
+                raise WatchTableError(f"{filename}: watch #{i} needs {exc}")
+            try:
+                message_template = template.from_settings(entry, defaults=table)
+            except template.TemplateError as exc:
+                raise WatchTableError(f"{filename}: watch #{i}: {exc}")
+            try:
+                context = history.from_settings(entry, defaults=table)
+                trigger_condition = condition.from_settings(entry, defaults=table)
+            except ValueError as exc:
+                raise WatchTableError(f"{filename}: watch #{i}: {exc}")
+            self.add(
+                trigger_PV,
+                message_PV,
+                entry.get("recipients", default_recipients),
+                label=entry.get("name"),
+                group=entry.get("group"),
+                policy=policy.from_settings(entry, defaults=table),
+                template=message_template,
+                history=context,
+                condition=trigger_condition,
+            )
+
+    def start(self):
+        """
+        start watching for triggers on all watches
+
+        All PVs are created first, then connect at the same time, so
+        this takes (at most) about ``connect_timeout`` for any number of
+        watches.  A watch that cannot start is logged and skipped so one
+        bad PV does not stop the others.  Returns the number of running
+        watches.
+
+        The input PVs of the watch conditions are monitored by
+        :attr:`index`, once each, for all the watches that use them.
+        """
+        cli.logger(f"starting {len(self.watches)} watch(es)")
+        owners = {}  # input PV name: the first watch that uses it
+        for watch in self.watches:
+            if watch.condition is not None and watch.input_index is None:
+                pvnames = list(watch.condition.inputs.values())
+                for pvname in pvnames:
+                    owners.setdefault(pvname, watch)
+                self.index.add(watch.condition, [None] + pvnames, watch.condition_fired)
+                watch.input_index = self.index
+        bulk = connections.BulkConnection()
+        bulk.add(self.index.make_pvs(lambda pvname: owners[pvname].make_pv(pvname)))
+        for watch in self.watches:
+            if not watch.running:
+                bulk.add(watch.make_pvs())
+        for pv in bulk.wait(self.connect_timeout):
+            cli.logger("could not connect to PV: %s", pv.pvname)
+        cli.logger(bulk.summary())
+        if len(self.index):
+            self.index.start()
+            cli.logger(self.index.summary())
+        for watch in self.watches:
+            if not watch.connected:
+                cli.logger(f"{watch!r} did not start: PV(s) not connected")
+                continue
+            try:
+                watch.do_start()
+            except Exception as exc:
+                cli.logger(f"{watch!r} did not start: {exc}")
+        running = sum(1 for watch in self.watches if watch.running)
+        cli.logger(f"{running} of {len(self.watches)} watch(es) running")
+        metrics.queue_depth.set_function(self.queue_depth)
+        metrics.pvs_connected.set_function(self.connected_pvs)
+        metrics.history_bytes.set_function(self.history_bytes)
+        nbytes = self.history_bytes()
+        if nbytes:
+            cli.logger(f"context PV histories use {nbytes} bytes")
+        return running
+
+    def stop(self):
+        """stop watching for triggers on all watches"""
+        self._stop_event.set()
+        for watch in self.watches:
+            watch.do_stop()
+        self.index.stop()
+        for coalescer in self.coalescers.values():
+            if coalescer is not None:
+                coalescer.close()  # send the held digests
+        self.pool.shutdown()
+
+    def dispatch(self, watch, event):
+        """send the message for ``watch`` from the shared send pool"""
+        if watch.group in self.coalescers:
+            coalescer = self.coalescers[watch.group]
+        else:
+            coalescer = self.coalescers.get(None)
+        if coalescer is not None:
+            coalescer.add(event, watch)
+        else:
+            self.send_event(watch, event)
+
+    def send_event(self, watch, event):
+        """send one message from the shared send pool"""
+        self.pool.submit(watch.triggerPV, cli.SendMessage, watch, self.config, event)
+
+    def queue_depth(self):
+        """number of messages waiting to be sent"""
+        return self.pool.qsize()
+
+    def connected_pvs(self):
+        """number of connected PVs of all watches"""
+        return cli.connected_pvs(self.watches) + self.index.connected()
+
+    def history_bytes(self):
+        """memory used by the context PV histories of all watches (bytes)"""
+        return sum(w.history.nbytes for w in self.watches if w.history is not None)
+
+    def _send_digest(self, events, watches):
+        """send the digest from the shared send pool"""
+        key = ",".join(events[0].recipients)
+        self.pool.submit(key, digest.send_digest, events, self.config, watches)
+
+    def run(self, logging_interval=cli.CHECKPOINT_INTERVAL_S):
+        """
+        wait (without polling) until :meth:`stop` is called
+
+        Triggers are sent from the EPICS monitor callbacks.  This thread
+        only wakes up to write a checkpoint to the log.
+        """
+        while not self._stop_event.wait(logging_interval):
+            running = sum(1 for watch in self.watches if watch.running)
+            cli.logger(
+                f"checkpoint: {running} watch(es) running,"
+                f" {self.queue_depth()} message(s) waiting to be sent"
+            )